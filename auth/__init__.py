@@ -1 +1,2 @@
-from .google_auth import authenticate_google_drive
\ No newline at end of file
+from .google_auth import authenticate_google_drive, open_drive_session
+from .session_pool import SessionPool
@@ -1,11 +1,20 @@
+import threading
+
 from pydrive2.auth import GoogleAuth
 from pydrive2.drive import GoogleDrive
 
+from auth.session_pool import SessionPool
+
+TOKEN_FILE = "token.json"
+
+_session = None  # (GoogleDrive, SessionPool), shared by every backup in this process
+_session_lock = threading.Lock()
+
 def authenticate_google_drive():
     
     # connecting to google
     gauth = GoogleAuth("settings.yaml")
-    gauth.LoadCredentialsFile("token.json")
+    gauth.LoadCredentialsFile(TOKEN_FILE)
     
     if gauth.credentials is None:
         gauth.LocalWebserverAuth()
@@ -13,8 +22,24 @@ def authenticate_google_drive():
         gauth.Refresh()
     else:
         gauth.Authorize()
+        # Nothing changed, so there is nothing to save
+        return GoogleDrive(gauth)
     
     # Save credentials for next time
-    gauth.SaveCredentialsFile("token.json")
+    gauth.SaveCredentialsFile(TOKEN_FILE)
+    
+    return GoogleDrive(gauth)
+
+def open_drive_session():
+    """Get the process-wide (GoogleDrive, SessionPool), authenticating on first use
     
-    return GoogleDrive(gauth)
\ No newline at end of file
+    Later backups reuse the same credentials and pooled connections instead
+    of reading token.json and authorizing again.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            drive = authenticate_google_drive()
+            _session = (drive, SessionPool(drive.auth, TOKEN_FILE))
+        _session[1].start()
+        return _session
@@ -0,0 +1,102 @@
+import datetime
+import threading
+
+
+class SessionPool:
+    """Keep-alive authorized HTTP clients sharing one set of credentials
+
+    Clients handed out by acquire() go back to the pool with release(), so
+    their open connections (and TLS sessions) are reused by the next folder
+    or file operation instead of being set up again. All clients authorize
+    requests with the same credentials object, so a single refresh renews
+    the access token for every one of them.
+
+    A background thread refreshes the token refresh_margin seconds before
+    it expires, under a lock, so workers never see it expire mid-run and
+    never refresh it themselves all at once. The token file is only
+    rewritten when a refresh actually changed it.
+    """
+
+    def __init__(self, gauth, token_file, refresh_margin=300, max_idle=32):
+        self.gauth = gauth  # Authorized pydrive2 GoogleAuth
+        self.token_file = token_file
+        self.refresh_margin = refresh_margin
+        self.max_idle = max_idle
+        self.refresh_lock = threading.Lock()
+        self.idle_lock = threading.Lock()
+        self.idle = []  # Released clients, most recently used last
+        self.saved_token = gauth.credentials.to_json()
+        self.stopped = threading.Event()
+        self.refresher = None
+
+    def start(self):
+        """Start the background refresher; safe to call more than once"""
+        if self.refresher is None or not self.refresher.is_alive():
+            self.stopped.clear()
+            self.refresher = threading.Thread(target=self.run_refresher, daemon=True)
+            self.refresher.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def acquire(self):
+        """Get an authorized client, reusing an idle one when there is one"""
+        # Covers the refresher having been held up, e.g. by the machine sleeping
+        try:
+            self.ensure_fresh()
+        except Exception:
+            pass  # The client still refreshes by itself if a request gets a 401
+        with self.idle_lock:
+            if self.idle:
+                return self.idle.pop()
+        return self.gauth.Get_Http_Object()
+
+    def release(self, http):
+        """Give a client back for reuse"""
+        with self.idle_lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(http)
+
+    def seconds_left(self):
+        """Seconds until the access token expires; None if it never does"""
+        credentials = self.gauth.credentials
+        if not credentials.access_token:
+            return 0
+        if credentials.token_expiry is None:
+            return None
+        # oauth2client keeps token_expiry as a naive UTC datetime
+        return (credentials.token_expiry - datetime.datetime.utcnow()).total_seconds()
+
+    def needs_refresh(self):
+        seconds_left = self.seconds_left()
+        return seconds_left is not None and seconds_left <= self.refresh_margin
+
+    def ensure_fresh(self):
+        """Refresh the token if it is about to expire; one thread refreshes, the others wait for it"""
+        if not self.needs_refresh():
+            return
+        with self.refresh_lock:
+            if self.needs_refresh():  # Another thread may have just refreshed it
+                self.gauth.Refresh()
+                self.save_if_changed()
+
+    def save_if_changed(self):
+        token = self.gauth.credentials.to_json()
+        if token != self.saved_token:
+            self.gauth.SaveCredentialsFile(self.token_file)
+            self.saved_token = token
+
+    def run_refresher(self):
+        while True:
+            seconds_left = self.seconds_left()
+            # At least a short pause, so a token that lives shorter than the margin can't spin this loop
+            wait = 3600 if seconds_left is None else max(seconds_left - self.refresh_margin, 30)
+            if self.stopped.wait(wait):
+                return
+            try:
+                self.ensure_fresh()
+            except Exception as e:
+                # Workers still refresh on acquire() or on a 401; try again shortly
+                print(f"⚠️ Token refresh failed: {e}")
+                if self.stopped.wait(60):
+                    return
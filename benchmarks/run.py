@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.trees import TREES, generate_tree
+from core import BackupEngine, FileScanner
+from core.fake_drive import FakeDrive
+from core.scan_cache import ScanCache
+from core.state import STATE_DIR_ENV
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Benchmark scanning and uploading synthetic trees against a local fake Drive.'
+    )
+    parser.add_argument('trees', nargs='*', help=f"trees to run (default: all of {', '.join(TREES)})")
+    parser.add_argument('--scale', type=int, default=1, help='multiply the size of each tree (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for tree content and fault injection')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'drive_backup_bench'),
+                        help='where generated trees are kept between runs')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='parallel uploads (default: 4)')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every request (default: 0.02)')
+    parser.add_argument('--bandwidth', type=float, default=None, help='shared link cap in MB/s (default: none)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share of requests throttled with 403/429')
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help='share of requests failed with 500/503')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help='share of upload chunks cut off midway')
+    parser.add_argument('--streaming', action='store_true', help='upload while walking instead of scanning first')
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help="don't trace Python allocations (faster, but no peak memory)")
+    parser.add_argument('--json', help='also write the results to this file')
+    return parser
+
+
+def measure(func):
+    """Run func() and return (result, seconds, peak traced MB or None)"""
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024) if tracemalloc.is_tracing() else None
+    return result, elapsed, peak
+
+
+def run_tree(kind, args):
+    source = generate_tree(kind, args.work_dir, args.scale, args.seed)
+    scratch = tempfile.mkdtemp(prefix=f"bench-{kind}-")
+    os.environ[STATE_DIR_ENV] = os.path.join(scratch, 'state')
+    bandwidth = args.bandwidth * 1024 * 1024 if args.bandwidth else None
+
+    def new_drive(name):
+        return FakeDrive(os.path.join(scratch, name), args.latency, bandwidth,
+                         args.rate_limit_rate, args.disconnect_rate, args.seed, args.server_error_rate)
+
+    try:
+        # Scan
+        scanner = FileScanner(source)
+        (folders_found, files_count, total_size), scan_time, scan_peak = measure(scanner.scan_files)
+
+        # Rescan with the folder cache, once to fill it and once to use it
+        scan_cache = ScanCache(source)
+        try:
+            FileScanner(source, cache=scan_cache).scan_files()
+            _, rescan_time, _ = measure(FileScanner(source, cache=scan_cache).scan_files)
+        finally:
+            scan_cache.close()
+
+        # Folder creation on its own, into a drive of its own
+        engine = BackupEngine(args.workers, backend=new_drive('folders'))
+        root_id = engine.create_folder_in_drive('bench')
+        _, folder_time, folder_peak = measure(lambda: engine.create_folder_structure(folders_found, root_id))
+
+        # Full backup, folders included, into a fresh drive
+        drive = new_drive('upload')
+        engine = BackupEngine(args.workers, backend=drive)
+        scan_results = None if args.streaming else {
+            'folders_found': folders_found,
+            'files_count': files_count,
+            'total_size': total_size,
+            'manifest': scanner.manifest,
+            'scan_stats': scanner.stats
+        }
+        scanner = None
+        (success, message), upload_time, upload_peak = measure(
+            lambda: engine.start_backup(source, scan_results, f"bench-{kind}")
+        )
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {
+        'tree': kind,
+        'files': files_count,
+        'folders': len(folders_found),
+        'total_mb': total_size / (1024 * 1024),
+        'scan_s': scan_time,
+        'rescan_s': rescan_time,
+        'folders_s': folder_time,
+        'upload_s': upload_time,
+        'files_per_s': files_count / upload_time if upload_time else 0.0,
+        'mb_per_s': total_size / (1024 * 1024) / upload_time if upload_time else 0.0,
+        'peak_mb': max(scan_peak, folder_peak, upload_peak) if scan_peak is not None else None,
+        'requests': drive.stats['requests'],
+        'throttled': drive.stats['throttled'],
+        'server_errors': drive.stats['server_errors'],
+        'disconnects': drive.stats['disconnects'],
+        'phases': engine.metrics.report()['phases'],
+        'retries': engine.metrics.report()['retries'],
+        'success': success,
+        'message': message,
+    }
+
+
+def print_results(results):
+    header = (f"{'tree':<6} {'files':>7} {'MB':>8} {'scan s':>7} {'rescan s':>8} {'folders s':>9} {'upload s':>8} "
+              f"{'files/s':>8} {'MB/s':>7} {'peak MB':>8} {'reqs':>6} {'429s':>5} {'5xx':>5} {'drops':>5}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        peak = f"{r['peak_mb']:.1f}" if r['peak_mb'] is not None else '-'
+        print(f"{r['tree']:<6} {r['files']:>7} {r['total_mb']:>8.1f} {r['scan_s']:>7.2f} {r['rescan_s']:>8.2f} "
+              f"{r['folders_s']:>9.2f} {r['upload_s']:>8.2f} {r['files_per_s']:>8.1f} {r['mb_per_s']:>7.1f} {peak:>8} "
+              f"{r['requests']:>6} {r['throttled']:>5} {r['server_errors']:>5} {r['disconnects']:>5}")
+    for r in results:
+        phases = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in r['phases'].items())
+        print(f"{r['tree']}: {phases}")
+    for r in results:
+        if not r['success'] or 'failed' in r['message']:
+            print(f"⚠️ {r['tree']}: {r['message']}")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    unknown = [kind for kind in args.trees if kind not in TREES]
+    if unknown:
+        parser.error(f"unknown tree: {', '.join(unknown)}")
+    os.makedirs(args.work_dir, exist_ok=True)
+    if not args.no_tracemalloc:
+        tracemalloc.start()
+
+    results = []
+    for kind in args.trees or list(TREES):
+        print(f"Running {kind}...", flush=True)
+        results.append(run_tree(kind, args))
+
+    print()
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r['success'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
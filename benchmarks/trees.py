@@ -0,0 +1,76 @@
+import os
+import random
+import shutil
+
+KB = 1024
+MB = 1024 * 1024
+
+
+def write_file(path, size, rng):
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            block = min(remaining, 4 * MB)
+            f.write(rng.randbytes(block))
+            remaining -= block
+
+
+def tiny_files(root, scale, rng):
+    """Many tiny files: 20 folders of 250 files of 0.5-4 KB per scale unit"""
+    for d in range(20 * scale):
+        folder = os.path.join(root, f"dir{d:04d}")
+        os.makedirs(folder)
+        for i in range(250):
+            write_file(os.path.join(folder, f"file{i:04d}.txt"), rng.randint(KB // 2, 4 * KB), rng)
+
+
+def huge_files(root, scale, rng):
+    """A few huge files: 4 files of 64 MB per scale unit"""
+    for i in range(4 * scale):
+        write_file(os.path.join(root, f"huge{i:02d}.bin"), 64 * MB, rng)
+
+
+def deep_nesting(root, scale, rng):
+    """One chain of folders 50 deep per scale unit, a few small files at each level"""
+    for chain in range(scale):
+        folder = os.path.join(root, f"chain{chain:02d}")
+        for depth in range(50):
+            folder = os.path.join(folder, f"level{depth:02d}")
+            os.makedirs(folder)
+            for i in range(5):
+                write_file(os.path.join(folder, f"file{i}.dat"), rng.randint(KB, 64 * KB), rng)
+
+
+def wide_directories(root, scale, rng):
+    """One folder with 500 subfolders per scale unit, 10 small files in each"""
+    for d in range(500 * scale):
+        folder = os.path.join(root, f"sub{d:05d}")
+        os.makedirs(folder)
+        for i in range(10):
+            write_file(os.path.join(folder, f"file{i}.dat"), rng.randint(KB, 16 * KB), rng)
+
+
+TREES = {
+    'tiny': tiny_files,
+    'huge': huge_files,
+    'deep': deep_nesting,
+    'wide': wide_directories,
+}
+
+
+def generate_tree(kind, work_dir, scale=1, seed=0):
+    """Create a synthetic source tree (once) and return its path
+
+    Trees are deterministic for a kind, scale and seed, and are reused by
+    later runs as long as their completion marker is there.
+    """
+    root = os.path.join(work_dir, f"{kind}-x{scale}-s{seed}")
+    marker = os.path.join(work_dir, f".{kind}-x{scale}-s{seed}.done")
+    if os.path.exists(marker):
+        return root
+    if os.path.exists(root):
+        shutil.rmtree(root)  # Left over from an interrupted run
+    os.makedirs(root)
+    TREES[kind](root, scale, random.Random(seed))
+    open(marker, 'w').close()
+    return root
@@ -0,0 +1,301 @@
+import argparse
+import datetime
+import os
+import sys
+
+from core import FileScanner, ProgressTracker
+from core.bandwidth import BandwidthLimiter, parse_rate, parse_schedule
+from core.exclusions import ExclusionRules, parse_age, parse_size
+from core.scheduler import UPLOAD_ORDERS
+
+# Exit codes, so cron and systemd can tell what happened
+EXIT_OK = 0
+EXIT_FAILED = 1  # The backup didn't run or stopped with an error
+EXIT_USAGE = 2  # Bad arguments (argparse uses this too)
+EXIT_PARTIAL = 3  # The run finished but some files failed (or, with --verify, differ)
+EXIT_INTERRUPTED = 130
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='main.py',
+        description='Back up a folder to Google Drive without the GUI.'
+    )
+    parser.add_argument('source', help='folder to back up (or to restore into, or to verify)')
+    parser.add_argument('-n', '--name', help='backup folder name on Drive (default: <folder>_backup_<timestamp>; '
+                                             'with --restore or --verify: the last backup of the folder)')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='parallel uploads (default: 4)')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='update the previous backup of this folder instead of starting a new one')
+    parser.add_argument('--delete-removed', action='store_true',
+                        help='trash files on Drive that were deleted locally')
+    parser.add_argument('--dedup', action='store_true', help='copy duplicate content on Drive instead of uploading it')
+    parser.add_argument('--pack-small-files', action='store_true', help='upload small files in tar archives')
+    parser.add_argument('--compress', action='store_true', help='gzip compressible files while uploading')
+    parser.add_argument('--chunked', action='store_true',
+                        help='store large files as deduplicated content-defined chunks')
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help='skip files and folders matching a .gitignore-style pattern (repeatable)')
+    parser.add_argument('--exclude-from', metavar='FILE',
+                        help='read exclusion patterns from FILE instead of the backupignore file in the state folder')
+    parser.add_argument('--max-size', metavar='SIZE', help='skip files bigger than SIZE, e.g. 500M')
+    parser.add_argument('--min-size', metavar='SIZE', help='skip files smaller than SIZE')
+    parser.add_argument('--max-age', metavar='AGE',
+                        help='skip files last changed longer ago than AGE, e.g. 30d (their earlier backups are kept)')
+    parser.add_argument('--min-age', metavar='AGE', help='skip files changed less than AGE ago, e.g. 10m')
+    parser.add_argument('--scan-cache', action='store_true',
+                        help="only list folders changed since the last scan; files edited in place in unchanged "
+                             "folders are picked up by the daily full scan (with --delete-removed every scan is full)")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='only retry the files that failed in earlier runs, in the previous backup')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and back up changes as they happen (implies --incremental)')
+    parser.add_argument('--debounce', type=float, default=2.0, metavar='SECONDS',
+                        help='with --watch, wait until a file had no changes for this long (default: 2)')
+    parser.add_argument('--restore', action='store_true',
+                        help='download the backup into the folder instead, skipping files that are already there')
+    parser.add_argument('--verify', action='store_true',
+                        help='compare the folder to its backup by checksum without downloading it')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='scan and report what would be uploaded without contacting Drive')
+    parser.add_argument('--order', choices=UPLOAD_ORDERS, default='mixed',
+                        help='upload order: big files in their own lane (mixed, default), by size, or walk order')
+    parser.add_argument('--bandwidth-limit', metavar='RATE',
+                        help='cap total upload speed, e.g. 500K or 2M bytes per second')
+    parser.add_argument('--bandwidth-schedule', metavar='WINDOWS',
+                        help='time-of-day caps overriding --bandwidth-limit, e.g. "09:00-18:00=1M,22:00-06:00=off"')
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help='write phase timings and request latencies here (default: in the state folder)')
+    parser.add_argument('--prometheus-textfile', metavar='PATH',
+                        help='also write the metrics for the node-exporter textfile collector')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only print the final result')
+    return parser
+
+
+def default_backup_name(source):
+    folder_name = os.path.basename(os.path.normpath(source))
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{folder_name}_backup_{timestamp}"
+
+
+def print_progress(progress, message):
+    print(f"[{progress * 100:3.0f}%] {message}", flush=True)
+
+
+def dry_run(args):
+    """Scan the source and show what a backup would upload"""
+    from core.manifest_db import ManifestDB
+    from core.scan_cache import ScanCache
+
+    if args.retry_failed:
+        manifest_db = ManifestDB(args.source)
+        try:
+            failures = manifest_db.load_failures()
+        finally:
+            manifest_db.close()
+        print(f"Dry run: would retry {len(failures)} failed files")
+        if not args.quiet:
+            for path, (error, error_class, attempts, runs, _) in sorted(failures.items()):
+                print(f"  {path} ({error_class}, {attempts} attempts in {runs} runs): {error}")
+        return EXIT_OK
+
+    scan_cache = ScanCache(args.source, full_scan=args.delete_removed) if args.scan_cache else None
+    scanner = FileScanner(args.source, build_exclusions(args), scan_cache)
+    try:
+        folders_found, files_count, total_size = scanner.scan_files(
+            callback=None if args.quiet else ProgressTracker(print_progress, interval=1.0)
+        )
+    finally:
+        if scan_cache:
+            scan_cache.close()
+
+    to_upload, unchanged_count, deleted = scanner.manifest, 0, []
+    if args.incremental:
+        manifest_db = ManifestDB(args.source)
+        try:
+            if manifest_db.get_meta('root_folder_id'):
+                to_upload, unchanged_count, deleted = manifest_db.plan(scanner.manifest, skipped=scanner.skipped)
+            elif not args.quiet:
+                print("No previous backup of this folder; a full backup would run.")
+        finally:
+            manifest_db.close()
+
+    upload_mb = sum(file_info['size'] for file_info in to_upload) / (1024 * 1024)
+    print(f"Dry run: {files_count} files in {len(folders_found)} folders ({total_size / (1024 * 1024):.2f} MB)")
+    print(f"Would upload {len(to_upload)} files ({upload_mb:.2f} MB), skip {unchanged_count} unchanged")
+    if deleted:
+        action = "trash" if args.delete_removed else "leave"
+        print(f"Would {action} {len(deleted)} files deleted locally")
+    return EXIT_OK
+
+
+def build_exclusions(args):
+    return ExclusionRules.load(
+        args.exclude_from,
+        args.exclude,
+        max_size=parse_size(args.max_size) if args.max_size else None,
+        min_size=parse_size(args.min_size) if args.min_size else None,
+        max_age=parse_age(args.max_age) if args.max_age else None,
+        min_age=parse_age(args.min_age) if args.min_age else None
+    )
+
+
+def build_bandwidth(args):
+    if not (args.bandwidth_limit or args.bandwidth_schedule):
+        return None
+    return BandwidthLimiter(
+        parse_rate(args.bandwidth_limit) if args.bandwidth_limit else None,
+        parse_schedule(args.bandwidth_schedule or '')
+    )
+
+
+def run_watch(args):
+    """Back up the source, then keep backing up its changes until interrupted"""
+    from core import BackupEngine
+    from core.watcher import BackupDaemon
+
+    backup_engine = BackupEngine(
+        max_workers=args.workers, metrics_path=args.metrics_json, prometheus_textfile=args.prometheus_textfile
+    )
+    daemon = BackupDaemon(
+        backup_engine,
+        args.source,
+        args.name or default_backup_name(args.source),
+        debounce=args.debounce,
+        delete_removed=args.delete_removed,
+        deduplicate=args.dedup,
+        pack_small_files=args.pack_small_files,
+        compress=args.compress,
+        upload_order=args.order,
+        bandwidth=build_bandwidth(args),
+        chunked=args.chunked,
+        exclusions=build_exclusions(args),
+        scan_cache=args.scan_cache
+    )
+    if not args.quiet:
+        print(f"👀 Watching {args.source} for changes (Ctrl+C to stop)...", flush=True)
+    daemon.run()
+    return EXIT_OK
+
+
+def run_restore(args):
+    """Restore a backup into the source folder, or with --verify compare the folder to it"""
+    from core.restore_engine import RestoreEngine
+
+    restore_engine = RestoreEngine(max_workers=args.workers)
+    progress_tracker = ProgressTracker(None if args.quiet else print_progress, interval=1.0)
+    try:
+        restore_engine.authenticate()
+        backup_id = restore_engine.find_backup(args.source, args.name)
+    except Exception as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return EXIT_FAILED
+
+    if args.verify:
+        success, message = restore_engine.start_verify(
+            backup_id, args.source, progress_tracker, build_exclusions(args)
+        )
+    else:
+        success, message = restore_engine.start_restore(backup_id, args.source, progress_tracker)
+
+    if not success:
+        print(f"❌ {message}", file=sys.stderr)
+        return EXIT_FAILED
+
+    print(f"✅ {message}")
+    if args.verify:
+        report = restore_engine.last_report
+        if not args.quiet:
+            for label in ('changed', 'missing', 'extra', 'failed'):
+                for path in report[label]:
+                    print(f"  {label}: {path}")
+        return EXIT_PARTIAL if report['changed'] or report['missing'] or report['failed'] else EXIT_OK
+    if not args.quiet:
+        snapshot = progress_tracker.snapshot()
+        print(f"{snapshot['bytes_done'] / (1024 * 1024):.2f} MB transferred")
+    return EXIT_PARTIAL if restore_engine.last_counts.get('failed') else EXIT_OK
+
+
+def run_backup(args):
+    from core import BackupEngine
+
+    backup_engine = BackupEngine(
+        max_workers=args.workers, metrics_path=args.metrics_json, prometheus_textfile=args.prometheus_textfile
+    )
+    bandwidth = build_bandwidth(args)
+    progress_tracker = ProgressTracker(None if args.quiet else print_progress, interval=1.0)
+
+    # No scan results: the engine walks the source and uploads as it goes
+    success, message = backup_engine.start_backup(
+        args.source,
+        None,
+        args.name or default_backup_name(args.source),
+        progress_tracker,
+        incremental=args.incremental,
+        delete_removed=args.delete_removed,
+        deduplicate=args.dedup,
+        pack_small_files=args.pack_small_files,
+        compress=args.compress,
+        upload_order=args.order,
+        bandwidth=bandwidth,
+        chunked=args.chunked,
+        exclusions=build_exclusions(args),
+        retry_failed=args.retry_failed,
+        scan_cache=args.scan_cache
+    )
+
+    if not success:
+        print(f"❌ {message}", file=sys.stderr)
+        return EXIT_FAILED
+
+    print(f"✅ {message}")
+    if not args.quiet:
+        snapshot = progress_tracker.snapshot()
+        print(f"{snapshot['bytes_done'] / (1024 * 1024):.2f} MB transferred")
+    return EXIT_PARTIAL if backup_engine.last_counts.get('failed') else EXIT_OK
+
+
+def main(argv=None):
+    """Run a headless backup and return the process exit code"""
+    args = build_parser().parse_args(argv)
+
+    if args.restore and args.verify:
+        print("❌ --restore and --verify can't be combined", file=sys.stderr)
+        return EXIT_USAGE
+    if (args.restore or args.verify) and args.dry_run:
+        print(f"❌ --dry-run can't be combined with {'--restore' if args.restore else '--verify'}", file=sys.stderr)
+        return EXIT_USAGE
+    # A restore may create its target folder
+    if not os.path.isdir(args.source) and not (args.restore and not os.path.exists(args.source)):
+        print(f"❌ Not a folder: {args.source}", file=sys.stderr)
+        return EXIT_USAGE
+    if args.debounce < 0:
+        print("❌ --debounce can't be negative", file=sys.stderr)
+        return EXIT_USAGE
+    if args.workers < 1:
+        print("❌ --workers must be at least 1", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        if args.bandwidth_limit:
+            parse_rate(args.bandwidth_limit)
+        if args.bandwidth_schedule:
+            parse_schedule(args.bandwidth_schedule)
+        build_exclusions(args)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return EXIT_USAGE
+    except OSError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        if args.restore or args.verify:
+            return run_restore(args)
+        if args.dry_run:
+            return dry_run(args)
+        if args.watch:
+            return run_watch(args)
+        return run_backup(args)
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+        return EXIT_INTERRUPTED
@@ -1,2 +1,10 @@
 from .file_scanner import FileScanner
-from .backup_engine import BackupEngine
\ No newline at end of file
+from .progress import ProgressTracker
+
+
+def __getattr__(name):
+    # BackupEngine is loaded on first use so scanning and the CLI start fast
+    if name == 'BackupEngine':
+        from .backup_engine import BackupEngine
+        return BackupEngine
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
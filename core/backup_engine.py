@@ -1,160 +1,1075 @@
-from auth import authenticate_google_drive
+from core.chunking import CHUNKS_FOLDER_NAME, ChunkIndex, ContentChunker, build_chunk_manifest
+from core.compression import CompressionStats, GzipFileStream, codec_properties, looks_compressible
+from core.dedup import DedupIndex, plan_dedup
+from core.drive_backend import open_google_drive
+from core.file_scanner import FileScanner
+from core.manifest_db import ManifestDB
+from core.metrics import BackupMetrics, InstrumentedBackend
+from core.packer import PACKS_FOLDER_NAME, SmallFilePacker, build_pack_index
+from core.progress import ProgressTracker
+from core.remote_index import RemoteIndex
+from core.resumable_upload import CheckpointStore, ResumableUpload
+from core.scan_cache import ScanCache
+from core.state import state_path
+from core.folder_tree import FolderTreeBuilder, LazyFolderMap
+from core.upload_pool import TaskFailure, UploadPool, call_with_backoff, classify_error
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import datetime
+import hashlib
 import os
-from pathlib import Path
+import queue
+import tempfile
+import threading
+import time
+
+# Folders the engine keeps its own objects in; they have no local counterpart
+INTERNAL_PREFIXES = (f"{PACKS_FOLDER_NAME}/", f"{CHUNKS_FOLDER_NAME}/")
 
 class BackupEngine:
-    def __init__(self):
-        self.drive = None
+    STREAM_QUEUE_SIZE = 1000  # Planned entries a streaming walk may run ahead of the uploads
+    CHUNK_UPLOAD_WORKERS = 4  # Parallel chunk uploads per chunked file
+    
+    def __init__(self, max_workers=4, large_file_threshold=32 * 1024 * 1024, chunk_size=8 * 1024 * 1024,
+                 pack_threshold=256 * 1024, pack_segment_size=64 * 1024 * 1024, backend=None,
+                 metrics_path=None, prometheus_textfile=None):
+        self.backend = backend  # Drive access; Google Drive unless another backend is passed in
         self.folder_cache = {}  # Cache created folders to avoid duplicates
+        self.max_workers = max_workers  # Parallel upload workers
+        self.large_file_threshold = large_file_threshold  # Files this big use resumable uploads
+        self.chunk_size = chunk_size  # Bytes per resumable upload request
+        self.checkpoints = None  # On-disk resumable upload sessions, created on first use
+        self.pack_threshold = pack_threshold  # Files smaller than this get packed when packing is on
+        self.pack_segment_size = pack_segment_size  # Target size of each packed archive
+        self.manifest_db = None  # Local index of the backup, set per run
+        self.remote_index = None  # What an existing destination already holds, set per run
+        self.compression_stats = CompressionStats()  # Totals for the current run
+        self.progress = None  # ProgressTracker of the current run
+        self.bandwidth = None  # BandwidthLimiter of the current run, if any
+        self.exclusions = None  # ExclusionRules of the current run; None means the defaults
+        self.scan_cache = None  # ScanCache of the current run when cached scans are on
+        self.journaled = set()  # Paths in the failure journal when the current run started
+        self.failed_paths = set()  # Paths that failed for good in the current run
+        self.chunker = None  # ContentChunker of the current run when chunked storage is on
+        self.chunk_index = None  # Chunks already in the destination, set per run with the chunker
+        self.last_counts = {}  # Uploaded/failed/... counts of the last run
+        self.metrics = BackupMetrics()  # Timings, latencies, retries and errors, reset per run
+        self.metrics_path = metrics_path  # JSON report path; defaults to one per source in the state dir
+        self.prometheus_textfile = prometheus_textfile  # Optional node-exporter textfile to write too
         
     def authenticate(self):
         """Authenticate with Google Drive"""
-        try:
-            self.drive = authenticate_google_drive()
-            return True
-        except Exception as e:
-            raise Exception(f"Authentication failed: {str(e)}")
+        if self.backend is None:
+            self.backend = open_google_drive()
+        return True
     
-    def create_folder_in_drive(self, folder_name, parent_id='root'):
+    def create_folder_in_drive(self, folder_name, parent_id='root', http=None):
         """Create a folder in Google Drive"""
         # Check if we already created this folder
         cache_key = f"{parent_id}/{folder_name}"
         if cache_key in self.folder_cache:
             return self.folder_cache[cache_key]
-            
-        folder_metadata = {
-            'title': folder_name,
-            'mimeType': 'application/vnd.google-apps.folder',
-            'parents': [{'id': parent_id}]
-        }
         
-        folder = self.drive.CreateFile(folder_metadata)
-        folder.Upload()
+        # Or whether it was already in the destination before this run
+        if self.remote_index:
+            existing_id = self.remote_index.find_folder(parent_id, folder_name)
+            if existing_id:
+                self.folder_cache[cache_key] = existing_id
+                return existing_id
+            
+        folder_id = call_with_backoff(
+            lambda: self.backend.create_folder(folder_name, parent_id, http), on_retry=self.metrics.retry
+        )
         
         # Cache the folder ID
-        self.folder_cache[cache_key] = folder['id']
-        return folder['id']
+        self.folder_cache[cache_key] = folder_id
+        return folder_id
+    
+    def find_folder(self, folder_name, parent_id='root'):
+        """Get the id of an existing folder by name, or None"""
+        return call_with_backoff(lambda: self.backend.find_folder(folder_name, parent_id), on_retry=self.metrics.retry)
+    
+    def get_previous_backup_folder(self):
+        """Get the backup folder recorded in the local index, if it still exists"""
+        root_id = self.manifest_db.get_meta('root_folder_id')
+        if not root_id:
+            return None
+        try:
+            if call_with_backoff(lambda: self.backend.is_trashed(root_id), on_retry=self.metrics.retry):
+                return None
+        except Exception:
+            return None
+        return root_id
     
-    def create_folder_structure(self, folders_found, main_folder_id, progress_callback=None):
-        """Create all necessary folders in Google Drive"""
-        folder_ids = {'': main_folder_id}  # Empty string = root of backup
+    def create_folder_structure(self, folders_found, main_folder_id, progress_callback=None,
+                                folder_ids=None, on_level_ready=None):
+        """Create all necessary folders in Google Drive
         
-        # Sort folders to create parent folders first
-        sorted_folders = sorted(folders_found, key=lambda x: x.count('/'))
+        Folders already in folder_ids (relative path -> id) are skipped; the
+        dict is filled in place as each depth level is created, and
+        on_level_ready(paths) is called so uploads into them can start.
+        """
+        if folder_ids is None:
+            folder_ids = {}
+        folder_ids[''] = main_folder_id  # Empty string = root of backup
         
-        for i, folder_path in enumerate(sorted_folders):
+        def level_ready(paths, created, total):
+            for folder_path in paths:
+                if self.manifest_db:
+                    self.manifest_db.record_folder(folder_path, folder_ids[folder_path])
+                if self.remote_index:
+                    self.remote_index.record_folder(folder_path, folder_ids[folder_path])
             if progress_callback:
-                progress = 0.3 + (i / len(sorted_folders)) * 0.2  # 30-50% progress
-                progress_callback(progress, f"📁 Creating folder: {folder_path}")
-            
-            # Find parent folder
-            parent_path = str(Path(folder_path).parent) if Path(folder_path).parent != Path('.') else ''
-            parent_id = folder_ids.get(parent_path, main_folder_id)
-            
-            # Create folder
-            folder_name = Path(folder_path).name
-            folder_id = self.create_folder_in_drive(folder_name, parent_id)
-            folder_ids[folder_path] = folder_id
+                progress = 0.3 + (created / total) * 0.2  # 30-50% progress
+                progress_callback(progress, f"📁 Created {created}/{total} folders")
+            if on_level_ready:
+                on_level_ready(paths)
         
-        return folder_ids
+        builder = FolderTreeBuilder(
+            self.backend, self.new_upload_client, self.max_workers, on_retry=self.metrics.retry,
+            client_release=self.release_upload_client
+        )
+        return builder.build(folders_found, folder_ids, level_ready)
     
-    def upload_file_to_drive(self, file_path, drive_folder_id):
-        """Upload a single file to Google Drive"""
-        try:
+    def new_upload_client(self):
+        """Get an authorized HTTP client for one upload worker"""
+        return self.backend.new_client()
+    
+    def release_upload_client(self, http):
+        """Give a client from new_upload_client back so its connection gets reused"""
+        self.backend.release_client(http)
+    
+    def _upload_file(self, file_path, drive_folder_id, http=None, file_id=None, title=None, compress=False):
+        """Upload a single file, raising on failure
+        
+        With a file_id the existing Drive file is updated in place, which
+        keeps its id and stores the old content as a revision. With compress
+        the content is gzipped on the way up unless it looks incompressible.
+        With chunked storage on, large files are stored as chunks instead.
+        """
+        if http is None:
+            # Given back even when the upload fails, so the session pool doesn't leak clients
+            http = self.new_upload_client()
+            try:
+                return self._upload_file(file_path, drive_folder_id, http, file_id, title, compress)
+            finally:
+                self.release_upload_client(http)
+        
+        if self.chunker and os.path.getsize(file_path) >= self.large_file_threshold:
+            return self._upload_file_chunked(file_path, drive_folder_id, http, file_id, title)
+        
+        if compress and looks_compressible(file_path):
+            return self._upload_file_compressed(file_path, drive_folder_id, http, file_id, title)
+        
+        if os.path.getsize(file_path) >= self.large_file_threshold:
+            return self._upload_file_resumable(file_path, drive_folder_id, http, file_id, title)
+        
+        if file_id:
+            # Mark the new revision as raw in case an older one was compressed
+            file_metadata = {'id': file_id, 'properties': codec_properties('identity')}
+        else:
             file_metadata = {
-                'title': os.path.basename(file_path),
+                'title': title or os.path.basename(file_path),
                 'parents': [{'id': drive_folder_id}]
             }
-            
-            drive_file = self.drive.CreateFile(file_metadata)
-            drive_file.SetContentFile(file_path)
-            drive_file.Upload()
-            
+        
+        self.throttle(os.path.getsize(file_path))
+        return self.backend.upload_file(file_path, file_metadata, http)
+    
+    def throttle(self, byte_count):
+        """Wait for the run's bandwidth limiter, if there is one, before sending byte_count bytes"""
+        if self.bandwidth:
+            self.bandwidth.consume(byte_count)
+    
+    def _upload_file_resumable(self, file_path, drive_folder_id, http=None, file_id=None, title=None):
+        """Upload a large file in checkpointed chunks, resuming an earlier attempt if there is one"""
+        if self.checkpoints is None:
+            self.checkpoints = CheckpointStore()
+        
+        file_metadata = {'properties': codec_properties('identity')} if file_id else {
+            'title': title or os.path.basename(file_path),
+            'parents': [{'id': drive_folder_id}]
+        }
+        
+        on_progress = (lambda count: self.progress.add_bytes(file_path, count)) if self.progress else None
+        uploader = ResumableUpload(
+            self.metrics.wrap_http(http), self.checkpoints, self.chunk_size,
+            on_progress=on_progress, on_retry=self.metrics.retry, throttle=self.throttle
+        )
+        return uploader.upload(file_path, file_metadata, file_id)
+    
+    def _upload_file_compressed(self, file_path, drive_folder_id, http=None, file_id=None, title=None):
+        """Gzip a file while uploading it, recording the codec in its Drive properties
+        
+        Small files are compressed in memory and sent in one request; large
+        ones are streamed through a resumable session so no compressed copy
+        ever lands on disk. The returned md5Checksum is that of the original
+        content, so the local manifest and dedup index keep matching local files.
+        """
+        original_size = os.path.getsize(file_path)
+        file_metadata = {'mimeType': 'application/gzip'}
+        if not file_id:
+            file_metadata['title'] = title or os.path.basename(file_path)
+            file_metadata['parents'] = [{'id': drive_folder_id}]
+        
+        if original_size < self.large_file_threshold:
+            stream = GzipFileStream(file_path)
+            data = stream.read_all()
+            file_metadata['properties'] = codec_properties('gzip', stream.original_size, stream.md5)
+            self.throttle(len(data))
+            result = self.backend.upload_bytes(data, file_metadata, file_id, http)
+        else:
+            if self.checkpoints is None:
+                self.checkpoints = CheckpointStore()
+            file_metadata['properties'] = codec_properties('gzip', original_size)
+            uploader = ResumableUpload(
+                self.metrics.wrap_http(http), self.checkpoints, self.chunk_size, on_retry=self.metrics.retry,
+                throttle=self.throttle
+            )
+            result, stream = uploader.upload_stream(file_path, lambda: GzipFileStream(file_path), file_metadata, file_id)
+            if stream is None:
+                # Finished by an earlier run; nothing was compressed this time
+                return result
+            # The original checksum is only known once the stream has been read
+            md5_property = codec_properties('gzip', original_md5=stream.md5)[-1]
+            self.backend.set_properties(result['id'], [md5_property], http)
+        
+        self.compression_stats.add(stream)
+        return dict(result, md5Checksum=stream.md5)
+    
+    def _upload_file_chunked(self, file_path, drive_folder_id, http=None, file_id=None, title=None):
+        """Store a file as content-defined chunks plus a small manifest in its place
+        
+        Chunks are content-addressed objects in the chunks folder, so only
+        chunks whose SHA-256 isn't stored yet get uploaded; a file that
+        changed a little since the last run only sends the chunks around
+        the change. The manifest keeps the file's title and carries the
+        original size and MD5, so indexes and restores see the real file.
+        Chunk boundaries and hashes come from the chunker's processes; this
+        thread only reads the chunks that need uploading.
+        """
+        before = os.stat(file_path)
+        chunks, md5 = self.chunker.chunks(file_path, before.st_size)
+        
+        entries = []
+        uploads = []
+        waiting = []
+        size = 0
+        with open(file_path, 'rb') as f, ThreadPoolExecutor(self.CHUNK_UPLOAD_WORKERS) as executor:
+            for offset, length, digest in chunks:
+                entries.append([digest, length])
+                size += length
+                
+                claim = self.chunk_index.claim(digest)
+                if claim is True:
+                    # Keep at most two chunks per upload thread in memory
+                    running = [upload for upload in uploads if not upload.done()]
+                    if len(running) >= self.CHUNK_UPLOAD_WORKERS * 2:
+                        wait(running, return_when=FIRST_COMPLETED)
+                    f.seek(offset)
+                    uploads.append(executor.submit(self._upload_chunk, digest, f.read(length), file_path))
+                    continue
+                if claim:
+                    waiting.append((digest, claim))
+                self.metrics.count('chunks_reused')
+                self.metrics.count('chunk_bytes_reused', length)
+                if self.progress:
+                    self.progress.add_bytes(file_path, length)
+        
+        for upload in uploads:
+            upload.result()
+        for digest, event in waiting:
+            if not self.chunk_index.wait(digest, event):
+                raise Exception(f"Chunk {digest} of {os.path.basename(file_path)} failed to upload")
+        
+        after = os.stat(file_path)
+        if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+            raise Exception(f"{os.path.basename(file_path)} changed while it was being backed up")
+        file_metadata = {'mimeType': 'application/gzip', 'properties': codec_properties('chunks', size, md5)}
+        if not file_id:
+            file_metadata['title'] = title or os.path.basename(file_path)
+            file_metadata['parents'] = [{'id': drive_folder_id}]
+        data = build_chunk_manifest(size, md5, entries)
+        self.throttle(len(data))
+        result = self.backend.upload_bytes(data, file_metadata, file_id, http)
+        return dict(result, md5Checksum=md5)
+    
+    def _upload_chunk(self, digest, data, file_path):
+        """Upload one claimed chunk to the chunks folder"""
+        try:
+            # The file was hashed in another process; don't store content under the wrong name
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise Exception(f"{os.path.basename(file_path)} changed while it was being backed up")
+            folder_id = self.chunk_index.get_folder_id(self.create_chunks_folder)
+            metadata = {'title': digest, 'parents': [{'id': folder_id}], 'mimeType': 'application/octet-stream'}
+            http = self.new_upload_client()
+            try:
+                self.throttle(len(data))
+                result = call_with_backoff(
+                    lambda: self.backend.upload_bytes(data, metadata, None, http), on_retry=self.metrics.retry
+                )
+            finally:
+                self.release_upload_client(http)
+        except Exception:
+            self.chunk_index.finish(digest)
+            raise
+        self.manifest_db.record_chunk(digest, result['id'], len(data))
+        self.chunk_index.finish(digest, result['id'])
+        self.metrics.count('chunks_uploaded')
+        if self.progress:
+            self.progress.add_bytes(file_path, len(data))
+    
+    def create_chunks_folder(self):
+        folder_id = self.create_folder_in_drive(CHUNKS_FOLDER_NAME, self.manifest_db.get_meta('root_folder_id'))
+        self.manifest_db.set_meta('chunks_folder_id', folder_id)
+        return folder_id
+    
+    def load_chunk_index(self):
+        """Collect the chunks the destination already holds, from the local index and a remote listing"""
+        chunk_index = ChunkIndex(self.manifest_db.get_meta('chunks_folder_id'))
+        for digest, chunk_id in self.manifest_db.load_chunks():
+            chunk_index.add(digest, chunk_id)
+        if self.remote_index:
+            chunk_index.folder_id = chunk_index.folder_id or self.remote_index.find_folder(
+                self.remote_index.root_id, CHUNKS_FOLDER_NAME
+            )
+            for digest, chunk_id in self.remote_index.files_under(CHUNKS_FOLDER_NAME):
+                chunk_index.add(digest, chunk_id)
+        return chunk_index
+    
+    def _copy_file(self, source_id, title, drive_folder_id, http=None):
+        """Copy an existing Drive file into a folder server-side, raising on failure"""
+        return self.backend.copy_file(source_id, title, drive_folder_id, http)
+    
+    def _trash_file(self, file_id, http=None):
+        """Move a Drive file to the trash, raising on failure"""
+        self.backend.trash_file(file_id, http)
+    
+    def upload_file_to_drive(self, file_path, drive_folder_id, http=None):
+        """Upload a single file to Google Drive"""
+        try:
+            self._upload_file(file_path, drive_folder_id, http)
             return True, None
         except Exception as e:
             return False, str(e)
     
-    def start_backup(self, folder_path, scan_results, custom_backup_name, progress_callback=None):
-        """Start the backup process"""
+    def upload_packed_files(self, small_files, main_folder_id, pool, counts, total_files, progress_callback):
+        """Pack small files into tar segments and upload them with their index"""
+        packs_folder_id = self.create_folder_in_drive(PACKS_FOLDER_NAME, main_folder_id)
+        packer = SmallFilePacker(self.pack_segment_size)
+        run_stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        uploaded_segments = []
+        # Packing runs in the scheduler's feeder thread, next to the result callbacks
+        counts_lock = threading.Lock()
+        
+        def on_pack_error(file_info, error):
+            with counts_lock:
+                counts['done'] += 1
+                counts['failed'] += 1
+                print(f"Failed to pack {file_info['filename']}: {error}")
+                self.record_failure(file_info['relative_path'], TaskFailure(error, classify_error(error), 1))
+                progress_callback.file_done(file_info['file_path'], file_info['size'])
+        
+        def segments():
+            for segment_path, segment_name, entries in packer.pack(small_files, on_pack_error):
+                yield {
+                    'file_path': segment_path,
+                    'filename': f"{run_stamp}-{segment_name}",
+                    'entries': entries,
+                    'size': sum(entry[2] for entry in entries),
+                }
+        
+        def upload_segment(segment, http):
+            return self._upload_file(segment['file_path'], packs_folder_id, http, title=segment['filename'])
+        
+        def on_segment(segment, success, outcome):
+            # Kept until now so a failed attempt can be retried
+            os.remove(segment['file_path'])
+            entries = segment['entries']
+            with counts_lock:
+                counts['done'] += len(entries)
+                progress_callback.file_done(segment['file_path'], segment['size'], len(entries))
+                if success:
+                    # Recorded once the index that locates them is stored
+                    uploaded_segments.append((segment['filename'], outcome['id'], entries))
+                else:
+                    counts['failed'] += len(entries)
+                    print(f"Failed to upload {segment['filename']}: {outcome}")
+                    for file_info, _, _, _, _ in entries:
+                        self.record_failure(file_info['relative_path'], outcome)
+            
+            progress = 0.5 + progress_callback.fraction() * 0.45
+            progress_callback(progress, f"📦 Uploaded archive: {segment['filename']} ({counts['done']}/{total_files})")
+        
+        pool.run(segments(), upload_segment, self.new_upload_client, on_segment, self.release_upload_client)
+        if not uploaded_segments:
+            return
+        
+        # Every run writes its own index; restore applies them oldest first
+        packed = [entry for _, _, entries in uploaded_segments for entry in entries]
+        try:
+            self.upload_pack_index(packs_folder_id, f"index-{run_stamp}.json.gz", uploaded_segments)
+        except Exception as e:
+            # Without the index the segments can't be restored
+            print(f"Failed to upload the pack index: {e}")
+            failure = TaskFailure(e, classify_error(e), 0)
+            counts['failed'] += len(packed)
+            for file_info, _, _, _, _ in packed:
+                self.record_failure(file_info['relative_path'], failure)
+            return
+        
+        counts['uploaded'] += len(packed)
+        counts['packed'] += len(packed)
+        for _, segment_id, entries in uploaded_segments:
+            for file_info, _, size, mtime, _ in entries:
+                self.manifest_db.record_file(file_info['relative_path'], size, mtime, None, f"pack:{segment_id}")
+                self.record_success(file_info['relative_path'])
+    
+    def upload_pack_index(self, packs_folder_id, title, segments, deleted=None):
+        """Upload a pack index, retrying transient errors"""
+        fd, index_path = tempfile.mkstemp(suffix='.json.gz')
+        http = self.new_upload_client()
         try:
-            # Step 1: Authenticate
+            with os.fdopen(fd, 'wb') as f:
+                f.write(build_pack_index(segments, deleted))
+            call_with_backoff(
+                lambda: self._upload_file(index_path, packs_folder_id, http, title=title), on_retry=self.metrics.retry
+            )
+        finally:
+            os.remove(index_path)
+            self.release_upload_client(http)
+    
+    def record_failure(self, relative_path, failure):
+        """Journal a file that failed for good (a TaskFailure), so a retry_failed run can pick it up"""
+        self.failed_paths.add(relative_path)
+        self.manifest_db.record_failure(relative_path, str(failure), failure.error_class, failure.attempts)
+    
+    def record_success(self, relative_path):
+        if relative_path in self.journaled:
+            self.manifest_db.clear_failures([relative_path])
+    
+    def scan_source(self, folder_path, progress_callback=None):
+        """Scan the source when the caller didn't, in the same shape as a UI scan"""
+        if progress_callback:
+            progress_callback(0.05, "📂 Scanning source folder...")
+        scanner = FileScanner(folder_path, self.exclusions, self.scan_cache)
+        folders_found, files_count, total_size = scanner.scan_files()
+        self.record_scan(scanner.stats)
+        return {
+            'folders_found': folders_found,
+            'files_count': files_count,
+            'total_size': total_size,
+            'manifest': scanner.manifest,
+            'skipped': scanner.skipped
+        }
+    
+    def scan_changed(self, folder_path, changed_paths, progress_callback=None):
+        """Rescan only the given relative paths, e.g. the ones a watcher saw change
+        
+        Files are stat'ed and folders walked; paths that no longer exist are
+        left out, so planning against the index within the same scopes finds
+        them deleted. The scan cache isn't used: a watcher may report a
+        folder for files edited in place, which its mtime doesn't show.
+        """
+        if progress_callback:
+            progress_callback(0.05, f"📂 Rescanning {len(changed_paths)} changed paths...")
+        scanner = FileScanner(folder_path, self.exclusions)
+        manifest = []
+        skipped = []
+        folders_found = set()
+        stats = {'folders': 0, 'files': 0, 'bytes': 0, 'errors': 0, 'excluded': 0, 'filtered': 0, 'seconds': 0.0}
+        for path in changed_paths:
+            absolute = os.path.join(folder_path, *path.split('/')) if path else folder_path
+            if os.path.isdir(absolute) and not os.path.islink(absolute):
+                folder = path
+                for item in scanner.walk(start=path):
+                    if item['type'] == 'folder':
+                        folders_found.add(item['relative_path'])
+                    elif item['type'] == 'skipped':
+                        skipped.append(item['relative_path'])
+                    else:
+                        del item['type']
+                        manifest.append(item)
+                for key in stats:
+                    stats[key] += scanner.stats[key]
+            else:
+                file_info = scanner.stat_file(path)
+                if file_info is None:
+                    continue
+                if file_info['type'] == 'skipped':
+                    skipped.append(path)
+                    continue
+                del file_info['type']
+                manifest.append(file_info)
+                folder = file_info['folder_path']
+            # The folders above a changed path may be new too; existing ones are skipped later
+            while folder:
+                folders_found.add(folder)
+                folder = folder.rpartition('/')[0]
+        self.record_scan(stats)
+        return {
+            'folders_found': folders_found,
+            'files_count': len(manifest),
+            'total_size': sum(file_info['size'] for file_info in manifest),
+            'manifest': manifest,
+            'skipped': skipped,
+            'scopes': list(changed_paths)
+        }
+    
+    def record_scan(self, scan_stats):
+        """Add a FileScanner's stats to the run's metrics"""
+        self.metrics.add_phase_time('scan', scan_stats['seconds'])
+        self.metrics.count('scan_errors', scan_stats['errors'])
+        self.metrics.count('scan_excluded', scan_stats.get('excluded', 0))
+        self.metrics.count('scan_filtered', scan_stats.get('filtered', 0))
+        self.metrics.count('scan_cached_folders', scan_stats.get('cached', 0))
+    
+    def upload_as_folders_appear(self, files_to_upload, folders_found, folder_ids, pool, upload_task, on_result,
+                                 progress_callback=None):
+        """Create the folder tree in the background, uploading each folder's
+        files as soon as its level exists
+        
+        Files whose folder couldn't be created are not uploaded; they are
+        reported to on_result as failed, so they get journaled.
+        """
+        files_by_folder = {}
+        for file_info in files_to_upload:
+            files_by_folder.setdefault(file_info['folder_path'], []).append(file_info)
+        
+        ready_files = queue.Queue()
+        for known_path in list(folder_ids):
+            if known_path in files_by_folder:
+                ready_files.put(files_by_folder.pop(known_path))
+        
+        def level_ready(paths):
+            for created_path in paths:
+                if created_path in files_by_folder:
+                    ready_files.put(files_by_folder.pop(created_path))
+        
+        build_errors = []
+        
+        def build_folders():
+            try:
+                with self.metrics.phase('folders'):
+                    self.create_folder_structure(
+                        folders_found, folder_ids[''], progress_callback, folder_ids, level_ready
+                    )
+            except Exception as e:
+                print(f"Failed to create folders: {e}")
+                build_errors.append(e)
+            # Without an error, anything left had no folder in the scan; upload_task creates it
+            if not build_errors:
+                for leftover in list(files_by_folder.values()):
+                    ready_files.put(leftover)
+                files_by_folder.clear()
+            ready_files.put(None)
+        
+        def files_as_folders_appear():
+            while True:
+                batch = ready_files.get()
+                if batch is None:
+                    break
+                yield from batch
+        
+        if progress_callback:
+            progress_callback(0.3, "📁 Creating folder structure...")
+        builder_thread = threading.Thread(target=build_folders, daemon=True)
+        builder_thread.start()
+        try:
+            pool.run(files_as_folders_appear(), upload_task, self.new_upload_client, on_result, self.release_upload_client)
+        finally:
+            builder_thread.join()
+        
+        for missing_files in files_by_folder.values():
+            for file_info in missing_files:
+                error = build_errors[0]
+                failure = TaskFailure(
+                    f"Folder {file_info['folder_path']} couldn't be created: {error}", classify_error(error), 0
+                )
+                on_result(file_info, False, failure)
+    
+    def upload_streaming(self, folder_path, folder_ids, incremental, pool, upload_task, on_result, counts,
+                         progress_callback):
+        """Walk the source in a producer thread and upload what it finds right away
+        
+        The walk feeds a bounded queue, so at most STREAM_QUEUE_SIZE planned
+        entries are held in memory no matter how big the tree is. Until the
+        walk ends, counts['total'] is an estimate extrapolated from how much
+        of the tree has been listed. Returns the (path, file_id) pairs of
+        files that are on Drive but no longer exist locally.
+        """
+        
+        progress_callback(0.2, "📂 Walking source folder and uploading...")
+        progress_callback.set_span(0.5, 0.95)
+        if incremental:
+            self.manifest_db.begin_streaming_plan()
+        
+        tasks = queue.Queue(maxsize=self.STREAM_QUEUE_SIZE)
+        walk_state = {'fraction': 0.0, 'queued': 0, 'queued_bytes': 0, 'error': None}
+        seen_paths = set() if self.remote_index else None
+        
+        def walk_progress(progress, message):
+            walk_state['fraction'] = progress
+        
+        def plan_file(file_info):
+            if incremental:
+                return self.manifest_db.plan_one(file_info)
+            if self.remote_index:
+                seen_paths.add(file_info['relative_path'])
+                planned, entry = self.remote_index.classify(file_info)
+                if planned is None:
+                    self.manifest_db.record_file(
+                        file_info['relative_path'], file_info['size'], file_info['mtime'], entry['md5'], entry['id']
+                    )
+                return planned
+            return file_info
+        
+        def keep_file(path):
+            # Filtered out this run; its backup stays
+            if incremental:
+                return self.manifest_db.keep_one(path)
+            if self.remote_index:
+                seen_paths.add(path)
+                return path in self.remote_index.entries
+            return False
+        
+        scanner = FileScanner(folder_path, self.exclusions, self.scan_cache)
+        
+        def walk():
+            try:
+                for item in scanner.walk(walk_progress):
+                    if item['type'] == 'folder':
+                        if item['relative_path'] not in folder_ids:
+                            tasks.put(item)
+                        continue
+                    if item['type'] == 'skipped':
+                        if keep_file(item['relative_path']):
+                            counts['unchanged'] += 1
+                        continue
+                    planned = plan_file(item)
+                    if planned is None:
+                        counts['unchanged'] += 1
+                        continue
+                    walk_state['queued'] += 1
+                    walk_state['queued_bytes'] += planned['size']
+                    # Extrapolate the totals from the share of folders listed so far
+                    scale = 1 / max(walk_state['fraction'], 0.01)
+                    counts['total'] = max(int(walk_state['queued'] * scale), walk_state['queued'])
+                    progress_callback.set_totals(
+                        counts['total'], int(walk_state['queued_bytes'] * scale), estimated=True
+                    )
+                    tasks.put(planned)
+            except Exception as e:
+                walk_state['error'] = e
+            finally:
+                counts['total'] = walk_state['queued']
+                progress_callback.set_totals(walk_state['queued'], walk_state['queued_bytes'])
+                counts['walk_done'] = True
+                tasks.put(None)
+        
+        def queued_tasks():
+            while True:
+                task = tasks.get()
+                if task is None:
+                    break
+                yield task
+            if walk_state['error']:
+                raise walk_state['error']
+        
+        walker = threading.Thread(target=walk, daemon=True)
+        walker.start()
+        try:
+            pool.run(queued_tasks(), upload_task, self.new_upload_client, on_result, self.release_upload_client)
+        finally:
+            # Unblock the walker if the pool stopped early
+            while walker.is_alive():
+                try:
+                    tasks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            walker.join()
+        # Listing time only; it overlaps the uploads rather than adding to the run
+        self.record_scan(scanner.stats)
+        
+        if incremental:
+            return self.manifest_db.unseen_files()
+        if self.remote_index:
+            return self.remote_index.missing_files(seen_paths, INTERNAL_PREFIXES)
+        return []
+    
+    def write_metrics(self, folder_path):
+        """Write the run's metrics report, and the Prometheus textfile if configured"""
+        try:
+            self.metrics.write_json(self.metrics_path or state_path('metrics', folder_path, '.json'))
+            if self.prometheus_textfile:
+                self.metrics.write_prometheus(self.prometheus_textfile)
+        except OSError as e:
+            print(f"Failed to write metrics: {e}")
+    
+    def prepare_destination(self, folder_path, custom_backup_name, incremental, retry_failed, changed_paths,
+                            scan_results, progress_callback):
+        """Reuse the previous backup folder, index an existing one by that name, or create it
+
+        Returns (main_folder_id, folder_ids, incremental, scan_results); a run
+        with nothing to be incremental against becomes a full backup, which
+        rescans the whole source if only changed paths were scanned.
+        """
+        main_folder_id = self.get_previous_backup_folder() if incremental else None
+        if retry_failed and not main_folder_id:
+            raise Exception("The backup the failed files belong to no longer exists; run a full backup")
+        if main_folder_id:
             if progress_callback:
-                progress_callback(0.05, "🔐 Authenticating with Google Drive...")
-            
-            self.authenticate()
-            
-            # Step 2: Create main backup folder with custom name
+                progress_callback(0.1, "📁 Updating previous backup folder...")
+            return main_folder_id, self.manifest_db.load_folders(), incremental, scan_results
+        
+        if changed_paths is not None:
+            # Nothing to compare the changes with; back up everything
+            scan_results = self.scan_source(folder_path, progress_callback)
+        main_folder_id = self.find_folder(custom_backup_name)
+        if main_folder_id:
+            # Back up into the existing folder instead of duplicating it
+            if progress_callback:
+                progress_callback(0.1, f"🔎 Indexing existing backup folder: {custom_backup_name}")
+            http = self.new_upload_client()
+            try:
+                self.remote_index = call_with_backoff(lambda: RemoteIndex(main_folder_id).load(
+                    self.backend,
+                    http,
+                    (lambda message: progress_callback(0.15, message)) if progress_callback else None
+                ), on_retry=self.metrics.retry)
+            finally:
+                self.release_upload_client(http)
+            folder_ids = self.remote_index.folder_ids()
+        else:
             if progress_callback:
                 progress_callback(0.1, f"📁 Creating backup folder: {custom_backup_name}")
-            
             main_folder_id = self.create_folder_in_drive(custom_backup_name)
+            folder_ids = {}
+        self.manifest_db.reset(main_folder_id)
+        for existing_path, existing_id in folder_ids.items():
+            if existing_path:
+                self.manifest_db.record_folder(existing_path, existing_id)
+        return main_folder_id, folder_ids, False, scan_results
+    
+    def upload_callbacks(self, folder_ids, dedup_index, counts, compress, streaming):
+        """Build the (upload_task, on_result) pair the upload pools of a run share
+        
+        upload_task handles files, duplicates to copy and, in a streaming
+        run, folders; on_result records each outcome in the counts, the
+        index and the failure journal.
+        """
+        progress_callback = self.progress
+        
+        def record_folder(path, folder_id):
+            self.manifest_db.record_folder(path, folder_id)
+            if self.remote_index:
+                self.remote_index.record_folder(path, folder_id)
+        
+        folder_map = LazyFolderMap(folder_ids, self.create_folder_in_drive, record_folder)
+        
+        def upload_task(file_info, http):
+            if file_info.get('type') == 'folder':
+                return folder_map.get(file_info['relative_path'], http)
+            # Get the correct folder ID, creating it if a streaming walk got here first
+            target_folder_id = folder_ids.get(file_info['folder_path'])
+            if target_folder_id is None:
+                target_folder_id = folder_map.get(file_info['folder_path'], http)
+            if file_info.get('copy_from'):
+                return self._copy_file(file_info['copy_from'], file_info['filename'], target_folder_id, http)
+            return self._upload_file(
+                file_info['file_path'], target_folder_id, http, file_info.get('file_id'), compress=compress
+            )
+        
+        def on_result(file_info, success, outcome):
+            if file_info.get('type') == 'folder':
+                if not success:
+                    print(f"Failed to create folder {file_info['relative_path']}: {outcome}")
+                return
             
-            # Step 3: Create folder structure
-            if progress_callback:
-                progress_callback(0.2, "📁 Creating folder structure...")
+            counts['done'] += 1
+            progress_callback.file_done(file_info['file_path'], file_info['size'])
+            if success:
+                if file_info.get('copy_from'):
+                    counts['copied'] += 1
+                    counts['bytes_saved'] += file_info['size']
+                else:
+                    counts['uploaded'] += 1
+                # A copy's Drive checksum may be of compressed content; the local one never is
+                md5 = file_info['md5'] if file_info.get('copy_from') else outcome.get('md5Checksum')
+                dedup_index.add(md5, file_info['size'], outcome['id'])
+                self.manifest_db.record_file(
+                    file_info['relative_path'], file_info['size'], file_info['mtime'], md5, outcome['id']
+                )
+                if self.remote_index:
+                    self.remote_index.record_file(file_info['relative_path'], outcome['id'], md5, file_info['size'])
+                self.record_success(file_info['relative_path'])
+            else:
+                counts['failed'] += 1
+                print(f"Failed to upload {file_info['filename']}: {outcome}")
+                self.record_failure(file_info['relative_path'], outcome)
             
-            folder_ids = self.create_folder_structure(
-                scan_results['folders_found'], 
-                main_folder_id, 
-                progress_callback
+            # Calculate progress by bytes (50-95% for file uploads); a streaming total is an estimate
+            total = max(counts['total'], counts['done'])
+            progress = 0.5 + progress_callback.fraction() * 0.45
+            approx = '~' if streaming and not counts.get('walk_done') else ''
+            progress_callback(progress, f"⬆️ Uploaded: {file_info['filename']} ({counts['done']}/{approx}{total})")
+        
+        return upload_task, on_result
+    
+    def plan_uploads(self, folder_path, scan_results, incremental, deduplicate, pack_small_files, dedup_index,
+                     counts, progress_callback):
+        """Split a scan into (files to upload, duplicates to copy, small files to pack, deleted files)
+        
+        deleted lists (path, file_id) of backed-up files that are gone
+        locally. Files a pattern excludes count as gone; files the size or
+        age filters skipped keep their backup.
+        """
+        if progress_callback:
+            progress_callback(0.2, "📂 Preparing file list...")
+        
+        files_to_upload = scan_results.get('manifest')
+        if files_to_upload is None:
+            files_to_upload = self.scan_source(folder_path)['manifest']
+        
+        deleted = []
+        if incremental:
+            files_to_upload, counts['unchanged'], deleted = self.manifest_db.plan(
+                files_to_upload, scan_results.get('scopes'), scan_results.get('skipped', ())
             )
-            
-            # Step 4: Get all files to upload
+        elif self.remote_index:
+            local_paths = {file_info['relative_path'] for file_info in files_to_upload}
+            local_paths.update(scan_results.get('skipped', ()))
+            files_to_upload, unchanged = self.remote_index.plan(files_to_upload)
+            counts['unchanged'] = len(unchanged)
+            for file_info, entry in unchanged:
+                self.manifest_db.record_file(
+                    file_info['relative_path'], file_info['size'], file_info['mtime'], entry['md5'], entry['id']
+                )
+            deleted = self.remote_index.missing_files(local_paths, INTERNAL_PREFIXES)
+        
+        duplicates = []
+        if deduplicate:
+            if progress_callback:
+                progress_callback(0.25, "🔍 Looking for duplicate files...")
+            for md5, size, file_id in self.manifest_db.load_checksums():
+                dedup_index.add(md5, size, file_id)
+            files_to_upload, duplicates = plan_dedup(files_to_upload, dedup_index)
+        
+        small_files = []
+        if pack_small_files:
+            small_files = [f for f in files_to_upload if f['size'] < self.pack_threshold]
+            files_to_upload = [f for f in files_to_upload if f['size'] >= self.pack_threshold]
+        
+        counts['total'] = len(files_to_upload) + len(duplicates) + len(small_files)
+        progress_callback.set_totals(
+            counts['total'], sum(f['size'] for f in files_to_upload + duplicates + small_files)
+        )
+        progress_callback.set_span(0.5, 0.95)
+        return files_to_upload, duplicates, small_files, deleted
+    
+    def trash_removed(self, deleted, main_folder_id, pool, progress_callback):
+        """Trash the Drive copies of files deleted locally and return the paths that were trashed"""
+        trashed = []
+        if progress_callback:
+            progress_callback(0.95, f"🗑️ Trashing {len(deleted)} removed files...")
+        
+        # Packed files live inside a shared segment; a removal record in a new index hides them instead
+        packed = {path: file_id[len('pack:'):] for path, file_id in deleted if file_id.startswith('pack:')}
+        deleted = [deleted_file for deleted_file in deleted if not deleted_file[1].startswith('pack:')]
+        if packed:
+            run_stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            try:
+                packs_folder_id = self.find_folder(PACKS_FOLDER_NAME, main_folder_id)
+                if packs_folder_id:
+                    self.upload_pack_index(packs_folder_id, f"index-{run_stamp}-removed.json.gz", [], packed)
+                trashed.extend(packed.keys())
+            except Exception as e:
+                print(f"Failed to record {len(packed)} removed packed files: {e}")
+        
+        def trash_task(deleted_file, http):
+            self._trash_file(deleted_file[1], http)
+        
+        def on_trashed(deleted_file, success, outcome):
+            if success:
+                trashed.append(deleted_file[0])
+            else:
+                print(f"Failed to trash {deleted_file[0]}: {outcome}")
+        
+        pool.run(deleted, trash_task, self.new_upload_client, on_trashed, self.release_upload_client)
+        self.manifest_db.remove_files(trashed)
+        if self.remote_index:
+            for trashed_path in trashed:
+                self.remote_index.remove(trashed_path)
+        return trashed
+    
+    def settle_failures(self, scan_results):
+        """Clear the journal entries of files this run rescanned that didn't fail again"""
+        # They were uploaded, or are gone or excluded by now
+        scopes = scan_results.get('scopes') if scan_results else None
+        settled = [
+            path for path in self.journaled - self.failed_paths
+            if scopes is None or any(not scope or path == scope or path.startswith(f"{scope}/") for scope in scopes)
+        ]
+        if settled:
+            self.manifest_db.clear_failures(settled)
+    
+    def summarize(self, counts, trashed):
+        """Record the run's file counts in its metrics and build the result message"""
+        result_message = f"Backup complete! {counts['uploaded']} files uploaded successfully"
+        if counts['packed'] > 0:
+            result_message += f" ({counts['packed']} small files packed into archives)"
+        if counts['copied'] > 0:
+            saved_mb = counts['bytes_saved'] / (1024 * 1024)
+            result_message += f", {counts['copied']} duplicates copied on Drive ({saved_mb:.2f} MB saved)"
+        if counts['unchanged'] > 0:
+            result_message += f", {counts['unchanged']} unchanged files skipped"
+        if trashed:
+            result_message += f", {len(trashed)} removed files trashed"
+        if counts['failed'] > 0:
+            result_message += f", {counts['failed']} files failed (journaled for a retry)"
+        if self.compression_stats.files > 0:
+            result_message += f". {self.compression_stats.summary()}"
+        
+        for name in ('uploaded', 'failed', 'unchanged', 'copied', 'packed'):
+            self.metrics.count(f"files_{name}", counts[name])
+        self.metrics.count('files_trashed', len(trashed))
+        self.metrics.count('bytes_saved', counts['bytes_saved'])
+        return result_message
+    
+    def start_backup(self, folder_path, scan_results, custom_backup_name, progress_callback=None,
+                     incremental=False, delete_removed=False, deduplicate=False, pack_small_files=False,
+                     compress=False, upload_order='mixed', bandwidth=None, chunked=False, changed_paths=None,
+                     exclusions=None, retry_failed=False, scan_cache=False):
+        """Start the backup process
+        
+        Without scan_results the source is walked and uploaded in one pass
+        (see upload_streaming), unless deduplicate or pack_small_files need
+        the whole file list first. incremental updates the previous backup
+        in place, trashing files deleted locally if delete_removed is set;
+        changed_paths or retry_failed limit it to those paths or to the
+        failure journal. With scan_cache, files edited in place in folders
+        that didn't change wait for the daily full scan (see ScanCache);
+        delete_removed runs always list everything. Returns (success, message).
+        """
+        # Coalesces per-file updates and adds byte counts, throughput and ETA
+        progress_callback = self.progress = ProgressTracker.wrap(progress_callback)
+        metrics = self.metrics = BackupMetrics()
+        self.bandwidth = bandwidth
+        self.exclusions = exclusions
+        try:
+            # Step 1: Authenticate
             if progress_callback:
-                progress_callback(0.5, "📂 Preparing file list...")
+                progress_callback(0.05, "🔐 Authenticating with Google Drive...")
             
-            # Re-scan to get individual files with their folder info
-            from core.file_scanner import FileScanner
-            scanner = FileScanner(folder_path)
-            files_to_upload = []
+            with metrics.phase('auth'):
+                self.authenticate()
+            self.backend = metrics.instrument(self.backend)
+            self.manifest_db = ManifestDB(folder_path)
+            if scan_cache:
+                self.scan_cache = ScanCache(folder_path, full_scan=delete_removed)
+            self.compression_stats = CompressionStats()
+            self.journaled = set(self.manifest_db.load_failures())
+            self.failed_paths = set()
             
-            root_path = Path(folder_path)
-            for file_path in root_path.rglob('*'):
-                if file_path.is_file():
-                    try:
-                        relative_path = file_path.relative_to(root_path)
-                        folder_path_str = str(relative_path.parent) if relative_path.parent != Path('.') else ''
-                        
-                        files_to_upload.append({
-                            'file_path': str(file_path),
-                            'folder_path': folder_path_str,
-                            'filename': file_path.name
-                        })
-                    except (PermissionError, OSError):
-                        continue
+            if retry_failed:
+                if not self.journaled:
+                    metrics.success = True
+                    return True, "No failed files to retry"
+                changed_paths = sorted(self.journaled)
+                incremental = True
+            if changed_paths is not None:
+                scan_results = self.scan_changed(folder_path, changed_paths, progress_callback)
+            streaming = scan_results is None and not (deduplicate or pack_small_files)
+            if scan_results is None and not streaming:
+                scan_results = self.scan_source(folder_path, progress_callback)
+            elif scan_results and scan_results.get('scan_stats'):
+                self.record_scan(scan_results['scan_stats'])
             
-            # Step 5: Upload files
-            total_files = len(files_to_upload)
-            uploaded_count = 0
-            failed_count = 0
+            # Step 2: Reuse the previous backup folder or create a new one
+            phase_started = time.perf_counter()
+            main_folder_id, folder_ids, incremental, scan_results = self.prepare_destination(
+                folder_path, custom_backup_name, incremental, retry_failed, changed_paths, scan_results,
+                progress_callback
+            )
+            folder_ids[''] = main_folder_id
+            if chunked:
+                self.chunk_index = self.load_chunk_index()
+                self.chunker = ContentChunker()
+            metrics.add_phase_time('prepare', time.perf_counter() - phase_started)
             
-            for i, file_info in enumerate(files_to_upload):
-                # Calculate progress (50-95% for file uploads)
-                progress = 0.5 + (i / total_files) * 0.45
-                if progress_callback:
-                    progress_callback(progress, f"⬆️ Uploading: {file_info['filename']} ({i+1}/{total_files})")
-                
-                # Get the correct folder ID
-                target_folder_id = folder_ids.get(file_info['folder_path'], main_folder_id)
-                
-                # Upload file
-                success, error = self.upload_file_to_drive(file_info['file_path'], target_folder_id)
+            counts = self.last_counts = {'done': 0, 'total': 0, 'uploaded': 0, 'failed': 0, 'unchanged': 0,
+                                         'copied': 0, 'bytes_saved': 0, 'packed': 0}
+            dedup_index = DedupIndex()
+            pool = UploadPool(
+                self.max_workers, on_retry=metrics.retry, order=upload_order, large_threshold=self.large_file_threshold
+            )
+            upload_task, on_result = self.upload_callbacks(folder_ids, dedup_index, counts, compress, streaming)
+            
+            if streaming:
+                # Steps 3-5: Walk, plan and upload in one pipelined pass
+                with metrics.phase('upload'):
+                    deleted = self.upload_streaming(
+                        folder_path, folder_ids, incremental, pool, upload_task, on_result, counts, progress_callback
+                    )
+            else:
+                # Step 3: Plan the upload from the scan manifest
+                with metrics.phase('plan'):
+                    files_to_upload, duplicates, small_files, deleted = self.plan_uploads(
+                        folder_path, scan_results, incremental, deduplicate, pack_small_files, dedup_index, counts,
+                        progress_callback
+                    )
                 
-                if success:
-                    uploaded_count += 1
-                else:
-                    failed_count += 1
-                    print(f"Failed to upload {file_info['filename']}: {error}")
+                # Steps 4-5: Create folders in the background and upload in parallel
+                with metrics.phase('upload'):
+                    self.upload_as_folders_appear(
+                        files_to_upload, scan_results['folders_found'], folder_ids, pool, upload_task, on_result,
+                        progress_callback
+                    )
+                    
+                    # Duplicates are copied once the first copy of their content is on Drive
+                    for file_info in duplicates:
+                        file_info['copy_from'] = dedup_index.find(file_info['md5'])
+                    pool.run(duplicates, upload_task, self.new_upload_client, on_result, self.release_upload_client)
+                    
+                    if small_files:
+                        self.upload_packed_files(
+                            small_files, main_folder_id, pool, counts, counts['total'], progress_callback
+                        )
             
-            # Final step
-            if progress_callback:
-                progress_callback(1.0, "✅ Backup complete!")
+            # Step 6: Trash files that were deleted locally
+            trashed = []
+            if deleted and delete_removed:
+                with metrics.phase('trash'):
+                    trashed = self.trash_removed(deleted, main_folder_id, pool, progress_callback)
             
-            result_message = f"Backup complete! {uploaded_count} files uploaded successfully"
-            if failed_count > 0:
-                result_message += f", {failed_count} files failed"
+            if self.remote_index:
+                self.remote_index.save()
+            self.settle_failures(scan_results)
             
+            # Final step
+            progress_callback(1.0, "✅ Backup complete!")
+            progress_callback.flush()
+            result_message = self.summarize(counts, trashed)
+            metrics.success = True
             return True, result_message
             
         except Exception as e:
-            return False, f"Backup failed: {str(e)}"
\ No newline at end of file
+            metrics.success = False
+            return False, f"Backup failed: {str(e)}"
+        finally:
+            if isinstance(self.backend, InstrumentedBackend):
+                self.backend = self.backend.backend
+            self.write_metrics(folder_path)
+            self.progress = None
+            self.bandwidth = None
+            self.exclusions = None
+            if self.scan_cache:
+                self.scan_cache.close()
+                self.scan_cache = None
+            if self.chunker:
+                self.chunker.shutdown()
+            self.chunker = None
+            self.chunk_index = None
+            self.remote_index = None
+            if self.manifest_db:
+                self.manifest_db.close()
+                self.manifest_db = None
\ No newline at end of file
@@ -0,0 +1,89 @@
+import datetime
+import re
+import threading
+import time
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(text):
+    """Parse a rate like '500K', '2M' or '1.5G' (bytes per second); 'off' or '0' means unlimited"""
+    text = text.strip().upper()
+    if text in ('OFF', 'NONE', 'UNLIMITED'):
+        return None
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?)(?:B|B/S)?', text)
+    if not match:
+        raise ValueError(f"Invalid rate: {text!r} (use e.g. 500K, 2M or off)")
+    rate = float(match.group(1)) * UNITS[match.group(2)]
+    return rate or None
+
+
+def parse_minutes(text):
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', text.strip())
+    minutes = int(match.group(1)) * 60 + int(match.group(2)) if match else -1
+    if not 0 <= minutes <= 24 * 60 or int(match.group(2)) > 59:
+        raise ValueError(f"Invalid time: {text!r} (use HH:MM)")
+    return minutes
+
+
+def parse_schedule(text):
+    """Parse 'HH:MM-HH:MM=RATE,...' into (start minute, end minute, rate) windows
+
+    Windows may wrap around midnight, e.g. '22:00-06:00=off'.
+    """
+    windows = []
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        span, separator, rate = part.partition('=')
+        start, dash, end = span.partition('-')
+        if not separator or not dash:
+            raise ValueError(f"Invalid schedule entry: {part!r} (use HH:MM-HH:MM=RATE)")
+        windows.append((parse_minutes(start), parse_minutes(end), parse_rate(rate)))
+    return windows
+
+
+class BandwidthLimiter:
+    """Token bucket shared by every upload worker, capping total upload bytes per second
+
+    The rate is `limit`, or the rate of the first time-of-day window (local
+    time) that contains the current time; None means unlimited. Callers ask
+    for bytes before sending them. A request larger than the bucket is let
+    through and paid back by the callers after it, so chunk size doesn't
+    matter and the long-run rate still holds.
+    """
+
+    def __init__(self, limit=None, windows=(), burst_seconds=1.0):
+        self.limit = limit
+        self.windows = list(windows)
+        self.burst_seconds = burst_seconds  # Bucket size, in seconds of the current rate
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.rate = None
+
+    def current_rate(self, now=None):
+        now = now or datetime.datetime.now()
+        minute = now.hour * 60 + now.minute
+        for start, end, rate in self.windows:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return rate
+        return self.limit
+
+    def consume(self, byte_count):
+        """Wait until byte_count bytes may be sent"""
+        rate = self.current_rate()
+        with self.lock:
+            now = time.monotonic()
+            if rate != self.rate:
+                # Limit changed (or was switched on): start from an empty bucket at the new rate
+                self.rate = rate
+                self.tokens = 0.0
+            elif rate:
+                self.tokens = min(rate * self.burst_seconds, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            if not rate:
+                return
+            self.tokens -= byte_count
+            wait = -self.tokens / rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
@@ -0,0 +1,262 @@
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from core.hashing import file_md5
+
+try:
+    import numpy
+except ImportError:  # Optional: only speeds up the boundary scan
+    numpy = None
+
+CHUNKS_FOLDER_NAME = '_drive_backup_chunks'
+
+MIN_CHUNK_SIZE = 512 * 1024
+AVG_CHUNK_BITS = 21  # A cut is ~1 in 2 MB past the minimum
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+SEGMENT_SIZE = 32 * 1024 * 1024  # Bytes per process pool job
+SCAN_BLOCK = 1024 * 1024  # Positions hashed per array operation when numpy is available
+
+# Gear table: one fixed pseudo-random 64-bit value per byte value
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'big') for i in range(256)]
+HASH_MASK = 0xFFFFFFFFFFFFFFFF
+WINDOW = 64  # A 64-bit gear hash only depends on the last 64 bytes
+GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint64) if numpy is not None else None
+
+
+def find_cut(data, start, min_size, max_size, cut_mask):
+    """Get the end of the chunk starting at data[start], using a gear rolling hash
+
+    Cuts where the top bits of the hash are all zero, but never before
+    min_size or after max_size bytes. Only the last WINDOW bytes before
+    a position affect the hash, so hashing starts just before min_size.
+    """
+    end = min(len(data), start + max_size)
+    if start + min_size >= end:
+        return end
+    h = 0
+    gear = GEAR
+    i = start + min_size - WINDOW
+    for b in data[i:start + min_size]:
+        h = ((h << 1) + gear[b]) & HASH_MASK
+    i = start + min_size
+    for b in data[i:end]:
+        h = ((h << 1) + gear[b]) & HASH_MASK
+        i += 1
+        if not h & cut_mask:
+            return i
+    return end
+
+
+def gear_candidates(data, begin, stop, cut_mask):
+    """Get the positions in [begin, stop) where the gear hash of the WINDOW bytes before passes cut_mask
+
+    Needs numpy. Hashes every position at once by doubling: after the
+    step for n, h[j] sums the gear values of the n bytes up to j, each
+    shifted by its distance from j, so six steps cover the window.
+    """
+    count = stop - begin + WINDOW - 1
+    h = GEAR_ARRAY[numpy.frombuffer(data, dtype=numpy.uint8, count=count, offset=begin - WINDOW)]
+    shift = 1
+    while shift < WINDOW:
+        h[shift:] += h[:-shift] << numpy.uint64(shift)
+        shift *= 2
+    hits = numpy.flatnonzero((h[WINDOW - 1:] & numpy.uint64(cut_mask)) == 0)
+    return (hits + begin).tolist()
+
+
+def cut_finder(data, min_size, max_size, cut_mask):
+    """Get a function giving the end of the chunk that starts at a position of data, like find_cut
+
+    Starts must be asked for in increasing order. With numpy the hashes
+    are computed SCAN_BLOCK positions at a time as array operations;
+    otherwise each call runs find_cut byte by byte.
+    """
+    if numpy is None or min_size < WINDOW:
+        return lambda start: find_cut(data, start, min_size, max_size, cut_mask)
+    candidates = []
+    scan = {'next': WINDOW}  # First position not hashed yet
+
+    def find(start):
+        end = min(len(data), start + max_size)
+        first = start + min_size + 1
+        if first > end:
+            return end
+        scan['next'] = max(scan['next'], first)
+        while True:
+            i = bisect.bisect_left(candidates, first)
+            if i < len(candidates):
+                return min(candidates[i], end)
+            if scan['next'] > end:
+                return end
+            stop = min(scan['next'] + SCAN_BLOCK, len(data) + 1)
+            candidates.extend(gear_candidates(data, scan['next'], stop, cut_mask))
+            scan['next'] = stop
+
+    return find
+
+
+def chunk_range(file_path, start, stop_at, size, min_size, max_size, avg_bits, known_cuts=()):
+    """Chunk a file from a cut at `start` until a cut at or past stop_at
+
+    Also stops at the first cut in known_cuts, where the chain has caught
+    up with one computed from another start. Returns [cut, sha256] for
+    each chunk, with the absolute offset it ends at and the hash of its
+    content, so the caller doesn't have to hash it again. Runs in the
+    process pool, so it only takes picklable arguments.
+    """
+    cut_mask = ((1 << avg_bits) - 1) << (64 - avg_bits)
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        # A chunk that starts before stop_at ends at most max_size later
+        data = f.read(min(stop_at + max_size, size) - start)
+    find = cut_finder(data, min_size, max_size, cut_mask)
+    view = memoryview(data)
+    cuts = []
+    pos = 0
+    while True:
+        end = find(pos)
+        cut = start + end
+        cuts.append([cut, hashlib.sha256(view[pos:end]).hexdigest()])
+        pos = end
+        if cut >= stop_at or pos >= len(data) or cut in known_cuts:
+            return cuts
+
+
+class ContentChunker:
+    """Splits files into content-defined chunks on a pool of processes
+
+    Boundaries depend only on nearby content, so an edit only changes the
+    chunks around it and the rest keep their hashes. Each SEGMENT_SIZE
+    stretch of a file is chunked by its own job; where a job's chain
+    starts at an arbitrary segment start instead of a real cut, it is
+    resynced by chunking on from the last real cut until both agree,
+    which gives exactly the cuts of one sequential pass. The jobs also
+    hash each chunk, and one more job hashes the whole file, so the
+    uploading thread only reads the chunks it has to send.
+    """
+
+    def __init__(self, max_workers=None, min_size=MIN_CHUNK_SIZE, avg_bits=AVG_CHUNK_BITS,
+                 max_size=MAX_CHUNK_SIZE, segment_size=SEGMENT_SIZE):
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.params = (min_size, max_size, avg_bits)
+        self.segment_size = max(segment_size, max_size)
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self.executor
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def chunks(self, file_path, size):
+        """Get ([(offset, length, sha256), ...], md5) for a file of size bytes"""
+        executor = self.get_executor()
+        md5_job = executor.submit(file_md5, file_path)
+        if size == 0:
+            return [], md5_job.result()
+        starts = list(range(0, size, self.segment_size))
+        jobs = [executor.submit(chunk_range, file_path, start, min(start + self.segment_size, size), size,
+                                *self.params) for start in starts]
+
+        cuts = []
+        pos = 0
+        for start, job in zip(starts, jobs):
+            job_cuts = job.result()
+            segment_end = min(start + self.segment_size, size)
+            if pos >= segment_end:
+                continue
+            # A job's first chunk only counts if its start was a real cut
+            job_set = frozenset(cut for cut, _ in job_cuts)
+            if pos != start and pos not in job_set:
+                synced = executor.submit(chunk_range, file_path, pos, segment_end, size, *self.params, job_set)
+                cuts.extend(synced.result())
+                pos = cuts[-1][0]
+                if pos not in job_set:
+                    continue
+            for cut, digest in job_cuts:
+                if cut > pos:
+                    cuts.append((cut, digest))
+                    pos = cut
+
+        offsets = [0] + [cut for cut, _ in cuts[:-1]]
+        return [(offset, cut - offset, digest) for offset, (cut, digest) in zip(offsets, cuts)], md5_job.result()
+
+
+class ChunkIndex:
+    """Chunks the backup already holds, by SHA-256, shared by all upload workers
+
+    claim() makes sure a chunk new to this run is only uploaded once even
+    when several files contain it: the first caller uploads it, the others
+    wait for that upload with wait().
+    """
+
+    def __init__(self, folder_id=None):
+        self.folder_id = folder_id  # Drive folder holding the chunk objects, created on first use
+        self.folder_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.known = {}  # SHA-256 -> Drive file id
+        self.pending = {}  # SHA-256 -> Event, for chunks being uploaded right now
+
+    def get_folder_id(self, create_folder):
+        """Get the chunks folder id, creating it with create_folder() the first time"""
+        with self.folder_lock:
+            if self.folder_id is None:
+                self.folder_id = create_folder()
+            return self.folder_id
+
+    def add(self, digest, file_id):
+        with self.lock:
+            self.known[digest] = file_id
+
+    def claim(self, digest):
+        """Return True if the caller should upload this chunk
+
+        Returns False if it is already stored, or an Event to wait on if
+        another worker is uploading it.
+        """
+        with self.lock:
+            if digest in self.known:
+                return False
+            if digest in self.pending:
+                return self.pending[digest]
+            self.pending[digest] = threading.Event()
+            return True
+
+    def finish(self, digest, file_id=None):
+        """Mark a claimed chunk uploaded (with its id) or failed (without)"""
+        with self.lock:
+            if file_id:
+                self.known[digest] = file_id
+            self.pending.pop(digest).set()
+
+    def wait(self, digest, event):
+        """Wait for another worker's upload; True if the chunk made it"""
+        event.wait()
+        with self.lock:
+            return digest in self.known
+
+
+def build_chunk_manifest(size, md5, chunks):
+    """Build the gzipped JSON stored in place of a chunked file
+
+    chunks is a list of [sha256, length] in file order.
+    """
+    manifest = {'version': 1, 'size': size, 'md5': md5, 'chunks': chunks}
+    return gzip.compress(json.dumps(manifest, separators=(',', ':')).encode('utf-8'))
+
+
+def load_chunk_manifest(data):
+    """Parse a manifest produced by build_chunk_manifest"""
+    return json.loads(gzip.decompress(data).decode('utf-8'))
@@ -0,0 +1,72 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from core.hashing import file_md5
+
+
+class DedupIndex:
+    """Checksums of content already in the backup destination
+
+    Keyed by MD5 so it lines up with the md5Checksum Drive reports for
+    every uploaded file.
+    """
+
+    def __init__(self):
+        self.by_md5 = {}  # md5 -> Drive file id
+        self.sizes = set()  # Sizes present, to skip hashing files that can't match
+
+    def add(self, md5, size, file_id):
+        if md5 and file_id:
+            self.by_md5.setdefault(md5, file_id)
+            self.sizes.add(size)
+
+    def find(self, md5):
+        return self.by_md5.get(md5)
+
+
+def hash_files(files, max_workers=None):
+    """Store the MD5 of each file in its 'md5' key, hashing in parallel
+
+    hashlib releases the GIL on large buffers, so threads scale with disks.
+    Files that can't be read are left without a hash.
+    """
+    def hash_one(file_info):
+        try:
+            file_info['md5'] = file_md5(file_info['file_path'])
+        except OSError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 4) as executor:
+        list(executor.map(hash_one, files))
+
+
+def plan_dedup(files, index, max_workers=None):
+    """Split files into ones to upload and duplicates to copy on Drive
+
+    Only files whose size collides with another file or with something
+    already in the index can be duplicates, so only those get hashed.
+    Returns (uploads, duplicates); each duplicate carries its 'md5' and
+    should be copied from whatever file ends up holding that checksum.
+    """
+    size_counts = Counter(file_info['size'] for file_info in files)
+    candidates = [
+        file_info for file_info in files
+        if file_info['size'] > 0 and not file_info.get('file_id')
+        and (size_counts[file_info['size']] > 1 or file_info['size'] in index.sizes)
+    ]
+    hash_files(candidates, max_workers)
+
+    uploads = []
+    duplicates = []
+    first_seen = set()
+    for file_info in files:
+        md5 = file_info.get('md5') if not file_info.get('file_id') else None
+        if md5 and (index.find(md5) or md5 in first_seen):
+            duplicates.append(file_info)
+            continue
+        if md5:
+            first_seen.add(md5)
+        uploads.append(file_info)
+
+    return uploads, duplicates
@@ -0,0 +1,167 @@
+import io
+
+from core.folder_tree import FOLDER_MIME_TYPE
+
+FILE_FIELDS = 'id,md5Checksum,fileSize'
+LIST_FIELDS = 'nextPageToken,items(id,title,mimeType,md5Checksum,fileSize,modifiedDate,parents(id),properties(key,value))'
+CHANGE_FIELDS = ('nextPageToken,newStartPageToken,items(fileId,deleted,'
+                 'file(id,title,mimeType,md5Checksum,fileSize,parents(id),properties(key,value),labels(trashed)))')
+PARENTS_PER_QUERY = 40  # Keeps the q string well under Drive's length limit
+PAGE_SIZE = 1000
+
+
+class DriveHttpError(Exception):
+    """A Drive request answered with an HTTP error status"""
+
+    def __init__(self, status, content):
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', 'replace')
+        super().__init__(f"HTTP {status}: {content}")
+        self.status = status
+        self.error = {'code': status}  # Same shape as pydrive2's ApiRequestError
+
+
+def open_google_drive():
+    """Authenticate with Google Drive and get a backend for it"""
+    # Imported here so the Google client stack only loads when it's used
+    from auth import open_drive_session
+    try:
+        drive, sessions = open_drive_session()
+        return GoogleDriveBackend(drive, sessions)
+    except Exception as e:
+        raise Exception(f"Authentication failed: {str(e)}")
+
+
+def escape_query(value):
+    """Escape a string for use inside quotes in a Drive query"""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+class GoogleDriveBackend:
+    """Drive access through pydrive2 and the Drive v2 API
+
+    BackupEngine and its helpers only reach Drive through these methods, so
+    another implementation can stand in for it (see core.fake_drive). Every
+    call takes the http client of the worker making it, from new_client().
+    Resumable uploads and ranged downloads talk to that client directly.
+    With a SessionPool, clients come from and go back to the pool, so their
+    connections are kept alive across operations and backups.
+    """
+
+    def __init__(self, drive, sessions=None):
+        self.drive = drive  # Authorized pydrive2 GoogleDrive
+        self.service = drive.auth.service
+        self.sessions = sessions  # Optional auth.SessionPool
+
+    def new_client(self):
+        """Get an authorized HTTP client for one worker"""
+        if self.sessions:
+            return self.sessions.acquire()
+        return self.drive.auth.Get_Http_Object()
+
+    def release_client(self, http):
+        """Hand back a client from new_client() once its worker is done with it"""
+        if self.sessions:
+            self.sessions.release(http)
+
+    def create_folder(self, name, parent_id, http=None):
+        folder = self.drive.CreateFile({
+            'title': name,
+            'mimeType': FOLDER_MIME_TYPE,
+            'parents': [{'id': parent_id}]
+        })
+        folder.Upload(param={'http': http} if http else None)
+        return folder['id']
+
+    def create_folders(self, folders, http=None):
+        """Create (name, parent_id) folders in one batch request
+
+        Returns one (folder_id, error) pair per folder, in order.
+        """
+        results = [None] * len(folders)
+
+        def on_response(request_id, response, exception):
+            results[int(request_id)] = (response['id'] if exception is None else None, exception)
+
+        batch = self.service.new_batch_http_request(callback=on_response)
+        for i, (name, parent_id) in enumerate(folders):
+            body = {'title': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [{'id': parent_id}]}
+            batch.add(self.service.files().insert(body=body, fields='id'), request_id=str(i))
+        batch.execute(http=http)
+        return results
+
+    def find_folder(self, name, parent_id, http=None):
+        """Get the id of a folder by name and parent, or None"""
+        query = (f"title = '{escape_query(name)}' and '{parent_id}' in parents "
+                 f"and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false")
+        response = self.service.files().list(q=query, maxResults=1, fields='items(id)').execute(http=http)
+        items = response.get('items', [])
+        return items[0]['id'] if items else None
+
+    def is_trashed(self, file_id, http=None):
+        """Check whether a file is in the trash; raises if it doesn't exist"""
+        drive_file = self.drive.CreateFile({'id': file_id})
+        drive_file.FetchMetadata(fields='id,labels')
+        return bool(drive_file.get('labels', {}).get('trashed'))
+
+    def upload_file(self, file_path, metadata, http=None):
+        """Upload a file in one request; metadata with an 'id' updates that file"""
+        drive_file = self.drive.CreateFile(metadata)
+        drive_file.SetContentFile(file_path)
+        drive_file.Upload(param={'http': http} if http else None)
+        return drive_file
+
+    def upload_bytes(self, data, metadata, file_id=None, http=None):
+        """Upload in-memory content in one request, updating file_id if given"""
+        from googleapiclient.http import MediaIoBaseUpload
+        files = self.service.files()
+        media = MediaIoBaseUpload(io.BytesIO(data), mimetype=metadata.get('mimeType'), resumable=False)
+        if file_id:
+            request = files.update(fileId=file_id, body=metadata, media_body=media, fields=FILE_FIELDS)
+        else:
+            request = files.insert(body=metadata, media_body=media, fields=FILE_FIELDS)
+        return request.execute(http=http)
+
+    def set_properties(self, file_id, properties, http=None):
+        self.service.files().patch(fileId=file_id, body={'properties': properties}).execute(http=http)
+
+    def copy_file(self, source_id, title, parent_id, http=None):
+        """Copy a file server-side into a folder"""
+        body = {'title': title, 'parents': [{'id': parent_id}]}
+        return self.service.files().copy(fileId=source_id, body=body, fields=FILE_FIELDS).execute(http=http)
+
+    def trash_file(self, file_id, http=None):
+        drive_file = self.drive.CreateFile({'id': file_id})
+        drive_file.Trash(param={'http': http} if http else None)
+
+    def list_children(self, parent_ids, http=None):
+        """Yield every untrashed item directly inside any of parent_ids
+
+        Items carry id, title, mimeType, md5Checksum, fileSize, modifiedDate,
+        parents and properties. Parents are queried PARENTS_PER_QUERY at a time, one
+        paged list per group.
+        """
+        for i in range(0, len(parent_ids), PARENTS_PER_QUERY):
+            group = parent_ids[i:i + PARENTS_PER_QUERY]
+            parents = ' or '.join(f"'{parent_id}' in parents" for parent_id in group)
+            page_token = None
+            while True:
+                request = self.service.files().list(
+                    q=f"({parents}) and trashed = false", maxResults=PAGE_SIZE, fields=LIST_FIELDS,
+                    pageToken=page_token
+                )
+                response = request.execute(http=http)
+                yield from response.get('items', [])
+                page_token = response.get('nextPageToken')
+                if not page_token:
+                    break
+
+    def get_start_page_token(self, http=None):
+        return self.service.changes().getStartPageToken().execute(http=http).get('startPageToken')
+
+    def list_changes(self, page_token, http=None):
+        """Get one page of changes: {'items', 'nextPageToken', 'newStartPageToken'}"""
+        request = self.service.changes().list(
+            pageToken=page_token, maxResults=PAGE_SIZE, includeSubscribed=False, fields=CHANGE_FIELDS
+        )
+        return request.execute(http=http)
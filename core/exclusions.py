@@ -0,0 +1,197 @@
+import os
+import re
+import time
+
+from core.state import get_state_dir
+
+IGNORE_FILE_NAME = '.backupignore'  # Per-folder rules, like .gitignore
+CONFIG_FILE_NAME = 'backupignore'  # Rules for every source, in the state folder
+
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+
+def parse_size(text):
+    """Parse a size like '500K', '2M' or '1.5G' into bytes"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMGT]?)B?', text.strip().upper())
+    if not match:
+        raise ValueError(f"Invalid size: {text!r} (use e.g. 500K, 2M or 1G)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_age(text):
+    """Parse an age like '90s', '30m', '12h', '7d' or '2w' into seconds"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([smhdw])', text.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid age: {text!r} (use e.g. 30m, 12h or 7d)")
+    return float(match.group(1)) * AGE_UNITS[match.group(2)]
+
+
+def translate_glob(pattern):
+    """Translate a gitignore glob into a regex for paths relative to the rule's folder"""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            parts.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            parts.append(f"[{body}]")
+            i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(parts)
+
+
+class Rule:
+    """One compiled gitignore line"""
+
+    def __init__(self, line):
+        self.negate = line.startswith('!')
+        if self.negate or line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        self.dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        # A slash anywhere but at the end ties the pattern to the rule's folder
+        self.anchored = '/' in line
+        line = line.lstrip('/')
+        self.literal = None if re.search(r'[*?\[\\]', line) else line
+        self.regex = re.compile(translate_glob(line), re.DOTALL)
+
+    def matches(self, path, name, is_dir):
+        if self.dir_only and not is_dir:
+            return False
+        target = path if self.anchored else name
+        if self.literal is not None:
+            return target == self.literal
+        return self.regex.fullmatch(target) is not None
+
+
+def parse_rules(lines):
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip()
+        if line and not line.startswith('#'):
+            rules.append(Rule(line))
+    return rules
+
+
+class ExclusionRules:
+    """Decides which folders and files a scan skips
+
+    Patterns use .gitignore syntax: `*`, `**`, `?`, `[...]`, a leading `/`
+    or inner `/` to anchor a pattern, a trailing `/` for folders only and
+    `!` to include again what an earlier pattern excluded. Rules come from
+    the config file, then from the .backupignore file of each folder,
+    which apply below that folder; as in git, deeper files win and the
+    last matching line wins. Excluded folders are pruned without being
+    listed. Files can also be filtered by size and by age (seconds since
+    their last change); unlike a pattern, a filter only skips a file for
+    the current run and leaves its earlier backup alone.
+    """
+
+    def __init__(self, patterns=(), max_size=None, min_size=None, max_age=None, min_age=None):
+        self.rules = parse_rules(patterns)
+        self.max_size = max_size
+        self.min_size = min_size
+        self.max_age = max_age
+        self.min_age = min_age
+        self.folder_rules = {}  # Relative folder -> rules of its .backupignore
+        self.loaded = set()  # Folders whose .backupignore was looked for
+
+    @classmethod
+    def load(cls, config_path=None, patterns=(), **filters):
+        """Build rules from a config file (default: the one in the state folder, if any) plus extra patterns"""
+        path = config_path or get_state_dir() / CONFIG_FILE_NAME
+        lines = []
+        try:
+            with open(path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            if config_path:
+                raise
+        return cls(lines + list(patterns), **filters)
+
+    def read_ignore_file(self, root, folder, present=True):
+        """(Re)load the .backupignore of a relative folder; present=False skips looking for it"""
+        self.loaded.add(folder)
+        self.folder_rules.pop(folder, None)
+        if not present:
+            return
+        ignore_path = os.path.join(root, *folder.split('/'), IGNORE_FILE_NAME)
+        try:
+            with open(ignore_path, encoding='utf-8', errors='replace') as f:
+                rules = parse_rules(f)
+        except OSError:
+            return
+        if rules:
+            self.folder_rules[folder] = rules
+
+    def prepare(self, root, path):
+        """Load the .backupignore files above a relative path; True if a folder above it is excluded"""
+        folder = ''
+        for part in path.split('/')[:-1]:
+            if folder not in self.loaded:
+                self.read_ignore_file(root, folder)
+            folder = f"{folder}/{part}" if folder else part
+            if self.excludes_folder(folder):
+                return True
+        if folder not in self.loaded:
+            self.read_ignore_file(root, folder)
+        return False
+
+    def match(self, path, is_dir):
+        """True if excluded, False if included again by a `!` rule, None if no rule matches"""
+        if not self.rules and not self.folder_rules:
+            return None
+        name = path.rpartition('/')[2]
+        folder = path
+        while folder:
+            folder = folder.rpartition('/')[0]
+            rules = self.folder_rules.get(folder)
+            if rules:
+                relative = path[len(folder) + 1:] if folder else path
+                for rule in reversed(rules):
+                    if rule.matches(relative, name, is_dir):
+                        return not rule.negate
+        for rule in reversed(self.rules):
+            if rule.matches(path, name, is_dir):
+                return not rule.negate
+        return None
+
+    def excludes_folder(self, path):
+        return self.match(path, True) is True
+
+    def excludes_file(self, path):
+        return self.match(path, False) is True
+
+    def filters_file(self, size, mtime):
+        """True if the size or age filters skip a file this run"""
+        if self.max_size is not None and size > self.max_size:
+            return True
+        if self.min_size is not None and size < self.min_size:
+            return True
+        if self.max_age is not None or self.min_age is not None:
+            age = time.time() - mtime
+            if self.max_age is not None and age > self.max_age:
+                return True
+            if self.min_age is not None and age < self.min_age:
+                return True
+        return False
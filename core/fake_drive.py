@@ -0,0 +1,345 @@
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import random
+import shutil
+import threading
+import time
+
+from core.drive_backend import PAGE_SIZE, DriveHttpError
+from core.folder_tree import FOLDER_MIME_TYPE
+from core.packer import DOWNLOAD_URL
+from core.resumable_upload import UPLOAD_URL
+
+
+def modified_date():
+    """The current time in Drive's RFC 3339 format, which sorts chronologically as a string"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return now.strftime('%Y-%m-%dT%H:%M:%S.') + f"{now.microsecond // 1000:03d}Z"
+
+
+class FakeResponse(dict):
+    """httplib2-style response: headers as dict items plus a status"""
+
+    def __init__(self, status, headers=None):
+        super().__init__(headers or {})
+        self.status = status
+
+
+class FakeDrive:
+    """Local stand-in for GoogleDriveBackend that keeps uploads on disk
+
+    File content is stored under root_dir, metadata in memory. Every request
+    waits latency seconds and may fail with a 403/429 rate limit error at
+    rate_limit_rate. Content goes through one shared link capped at
+    bandwidth bytes per second (None for unlimited), and resumable chunk
+    uploads are cut off halfway at disconnect_rate. Requests fail with a
+    500/503 server error at server_error_rate. new_client() hands out
+    FakeHttp clients that speak the resumable upload and ranged download
+    protocols, so those code paths run unchanged.
+    """
+
+    def __init__(self, root_dir, latency=0.0, bandwidth=None, rate_limit_rate=0.0, disconnect_rate=0.0, seed=None,
+                 server_error_rate=0.0):
+        self.root_dir = root_dir
+        self.objects_dir = os.path.join(root_dir, 'objects')
+        self.sessions_dir = os.path.join(root_dir, 'sessions')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.rate_limit_rate = rate_limit_rate
+        self.disconnect_rate = disconnect_rate
+        self.server_error_rate = server_error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.link_free_at = 0.0  # When the shared link finishes what's queued on it
+        self.files = {'root': {'id': 'root', 'title': 'My Drive', 'mimeType': FOLDER_MIME_TYPE, 'parents': []}}
+        self.changes = []  # File ids in the order they changed
+        self.sessions = {}  # Session URI -> resumable upload state
+        self.stats = {'requests': 0, 'throttled': 0, 'server_errors': 0, 'disconnects': 0, 'bytes_uploaded': 0,
+                      'bytes_downloaded': 0}
+
+    def request(self):
+        """Account for one API request: latency, then maybe a rate limit error"""
+        with self.lock:
+            self.stats['requests'] += 1
+            throttled = self.random.random() < self.rate_limit_rate
+            failed = not throttled and self.random.random() < self.server_error_rate
+            if throttled:
+                self.stats['throttled'] += 1
+                status = self.random.choice((403, 429))
+            elif failed:
+                self.stats['server_errors'] += 1
+                status = self.random.choice((500, 503))
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            raise DriveHttpError(status, 'rateLimitExceeded' if status == 403 else 'Too Many Requests')
+        if failed:
+            raise DriveHttpError(status, 'Backend Error')
+
+    def transfer(self, byte_count, direction='bytes_uploaded'):
+        """Hold the caller until byte_count bytes got through the shared link"""
+        with self.lock:
+            self.stats[direction] += byte_count
+            if not self.bandwidth:
+                return
+            start = max(time.monotonic(), self.link_free_at)
+            self.link_free_at = start + byte_count / self.bandwidth
+            wait = self.link_free_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def chance(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def new_client(self):
+        return FakeHttp(self)
+
+    def release_client(self, http):
+        pass
+
+    def object_path(self, file_id):
+        return os.path.join(self.objects_dir, file_id)
+
+    def new_id(self):
+        return f"fake{next(self.ids)}"
+
+    def resource(self, item):
+        """Copy of an item as the API returns it"""
+        resource = {key: value for key, value in item.items() if key != 'trashed'}
+        resource['parents'] = [{'id': parent_id} for parent_id in item['parents']]
+        resource['labels'] = {'trashed': item.get('trashed', False)}
+        return resource
+
+    def get(self, file_id):
+        item = self.files.get(file_id)
+        if item is None:
+            raise DriveHttpError(404, f"File not found: {file_id}")
+        return item
+
+    def save_item(self, item):
+        with self.lock:
+            self.files[item['id']] = item
+            self.changes.append(item['id'])
+        return self.resource(item)
+
+    def store(self, source, metadata, file_id=None):
+        """Store content (a file path or bytes) as a new file or a new revision of file_id"""
+        if file_id:
+            with self.lock:
+                item = dict(self.get(file_id))
+        else:
+            item = {'id': self.new_id(), 'title': metadata.get('title', 'Untitled'), 'trashed': False,
+                    'parents': [parent['id'] for parent in metadata.get('parents', [{'id': 'root'}])]}
+        item['mimeType'] = metadata.get('mimeType', 'application/octet-stream')
+        if metadata.get('properties'):
+            item['properties'] = self.merge_properties(item.get('properties'), metadata['properties'])
+
+        if isinstance(source, bytes):
+            with open(self.object_path(item['id']), 'wb') as f:
+                f.write(source)
+        else:
+            shutil.copyfile(source, self.object_path(item['id']))
+        item['md5Checksum'], item['fileSize'] = self.checksum(item['id'])
+        item['modifiedDate'] = modified_date()
+        return self.save_item(item)
+
+    def checksum(self, file_id):
+        digest = hashlib.md5()
+        size = 0
+        with open(self.object_path(file_id), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+                size += len(block)
+        return digest.hexdigest(), str(size)
+
+    def merge_properties(self, current, updates):
+        merged = {prop['key']: prop for prop in current or []}
+        for prop in updates:
+            merged[prop['key']] = {'key': prop['key'], 'value': prop['value']}
+        return list(merged.values())
+
+    # Backend interface, see GoogleDriveBackend
+
+    def create_folder(self, name, parent_id, http=None):
+        self.request()
+        item = {'id': self.new_id(), 'title': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent_id],
+                'trashed': False}
+        return self.save_item(item)['id']
+
+    def create_folders(self, folders, http=None):
+        # One request for the batch; like Drive, each call in it can be throttled on its own
+        self.request()
+        results = []
+        for name, parent_id in folders:
+            if self.chance(self.rate_limit_rate):
+                results.append((None, DriveHttpError(403, 'rateLimitExceeded')))
+                continue
+            item = {'id': self.new_id(), 'title': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent_id],
+                    'trashed': False}
+            results.append((self.save_item(item)['id'], None))
+        return results
+
+    def find_folder(self, name, parent_id, http=None):
+        self.request()
+        with self.lock:
+            for item in self.files.values():
+                if (item['title'] == name and parent_id in item['parents'] and not item.get('trashed')
+                        and item['mimeType'] == FOLDER_MIME_TYPE):
+                    return item['id']
+        return None
+
+    def is_trashed(self, file_id, http=None):
+        self.request()
+        with self.lock:
+            return bool(self.get(file_id).get('trashed'))
+
+    def upload_file(self, file_path, metadata, http=None):
+        self.request()
+        self.transfer(os.path.getsize(file_path))
+        return self.store(file_path, metadata, metadata.get('id'))
+
+    def upload_bytes(self, data, metadata, file_id=None, http=None):
+        self.request()
+        self.transfer(len(data))
+        return self.store(data, metadata, file_id)
+
+    def set_properties(self, file_id, properties, http=None):
+        self.request()
+        with self.lock:
+            item = dict(self.get(file_id))
+        item['properties'] = self.merge_properties(item.get('properties'), properties)
+        self.save_item(item)
+
+    def copy_file(self, source_id, title, parent_id, http=None):
+        self.request()
+        with self.lock:
+            item = dict(self.get(source_id), id=self.new_id(), title=title, parents=[parent_id], trashed=False,
+                        modifiedDate=modified_date())
+        shutil.copyfile(self.object_path(source_id), self.object_path(item['id']))
+        return self.save_item(item)
+
+    def trash_file(self, file_id, http=None):
+        self.request()
+        with self.lock:
+            item = dict(self.get(file_id), trashed=True)
+        self.save_item(item)
+
+    def list_children(self, parent_ids, http=None):
+        wanted = set(parent_ids)
+        with self.lock:
+            children = [self.resource(item) for item in self.files.values()
+                        if not item.get('trashed') and wanted.intersection(item['parents'])]
+        for i in range(0, max(len(children), 1), PAGE_SIZE):
+            self.request()
+            yield from children[i:i + PAGE_SIZE]
+
+    def get_start_page_token(self, http=None):
+        self.request()
+        with self.lock:
+            return str(len(self.changes))
+
+    def list_changes(self, page_token, http=None):
+        self.request()
+        start = int(page_token)
+        with self.lock:
+            ids = self.changes[start:start + PAGE_SIZE]
+            items = [{'fileId': file_id, 'deleted': False, 'file': self.resource(self.files[file_id])}
+                     for file_id in ids]
+            end = start + len(ids)
+            response = {'items': items}
+            if end < len(self.changes):
+                response['nextPageToken'] = str(end)
+            else:
+                response['newStartPageToken'] = str(end)
+        return response
+
+
+class FakeHttp:
+    """Per-worker client for FakeDrive, answering resumable uploads and ranged downloads"""
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def request(self, url, method='GET', body=None, headers=None):
+        headers = headers or {}
+        try:
+            self.drive.request()
+            if url.startswith(UPLOAD_URL):
+                return self.start_session(url, body, headers)
+            if url in self.drive.sessions:
+                return self.put_chunk(url, body or b'', headers)
+            if url.startswith(DOWNLOAD_URL):
+                return self.download(url, headers)
+        except DriveHttpError as e:
+            return FakeResponse(e.status), json.dumps({'error': {'code': e.status, 'message': str(e)}}).encode()
+        return FakeResponse(404), b'Not Found'
+
+    def start_session(self, url, body, headers):
+        path = url.split('?', 1)[0]
+        file_id = path[len(UPLOAD_URL) + 1:] or None
+        session_uri = f"fake://upload/{self.drive.new_id()}"
+        self.drive.sessions[session_uri] = {
+            'metadata': json.loads(body or '{}'),
+            'file_id': file_id,
+            'path': os.path.join(self.drive.sessions_dir, session_uri.rsplit('/', 1)[1]),
+            'received': 0,
+        }
+        open(self.drive.sessions[session_uri]['path'], 'wb').close()
+        return FakeResponse(200, {'location': session_uri}), b''
+
+    def put_chunk(self, session_uri, chunk, headers):
+        session = self.drive.sessions[session_uri]
+        content_range = headers.get('Content-Range', 'bytes */*')
+        byte_range, total = content_range[len('bytes '):].split('/')
+
+        if byte_range != '*':
+            start = int(byte_range.split('-')[0])
+            if start == session['received']:
+                self.drive.transfer(len(chunk))
+                if self.drive.chance(self.drive.disconnect_rate):
+                    # Keep part of the chunk and drop the connection, like a flaky link
+                    self.append(session, chunk[:len(chunk) // 2])
+                    with self.drive.lock:
+                        self.drive.stats['disconnects'] += 1
+                    raise ConnectionError("Connection reset by fake Drive")
+                self.append(session, chunk)
+
+        if total != '*' and session['received'] == int(total):
+            del self.drive.sessions[session_uri]
+            try:
+                resource = self.drive.store(session['path'], session['metadata'], session['file_id'])
+            finally:
+                os.remove(session['path'])
+            return FakeResponse(200), json.dumps(resource).encode()
+
+        headers = {'range': f"bytes=0-{session['received'] - 1}"} if session['received'] else {}
+        return FakeResponse(308, headers), b''
+
+    def append(self, session, data):
+        with open(session['path'], 'ab') as f:
+            f.write(data)
+        session['received'] += len(data)
+
+    def download(self, url, headers):
+        file_id = url[len(DOWNLOAD_URL) + 1:].split('?', 1)[0]
+        with self.drive.lock:
+            self.drive.get(file_id)
+        with open(self.drive.object_path(file_id), 'rb') as f:
+            byte_range = headers.get('Range')
+            if not byte_range:
+                content = f.read()
+                status = 200
+            else:
+                start, end = byte_range[len('bytes='):].split('-')
+                f.seek(int(start))
+                content = f.read(int(end) - int(start) + 1)
+                status = 206
+        self.drive.transfer(len(content), 'bytes_downloaded')
+        return FakeResponse(status), content
@@ -1,76 +1,262 @@
 from pathlib import Path
+from stat import S_ISREG
+from core.exclusions import IGNORE_FILE_NAME, ExclusionRules
 import os
+import time
+
+def new_folder_stats():
+    # files/bytes: directly in the folder; total_*: including everything below it
+    return {'files': 0, 'bytes': 0, 'total_files': 0, 'total_bytes': 0, 'subfolders': []}
+
+
+def roll_up_folder_stats(folder_stats):
+    """Fill in totals and subfolder names, deepest folders first, in one pass"""
+    # The root '' sorts last, after its top-level folders
+    for path in sorted(folder_stats, key=lambda path: path.count('/') if path else -1, reverse=True):
+        stats = folder_stats[path]
+        stats['total_files'] += stats['files']
+        stats['total_bytes'] += stats['bytes']
+        if not path:
+            continue
+        parent, _, name = path.rpartition('/')
+        parent_stats = folder_stats[parent]
+        parent_stats['total_files'] += stats['total_files']
+        parent_stats['total_bytes'] += stats['total_bytes']
+        parent_stats['subfolders'].append(name)
+
 
 class FileScanner:
-    def __init__(self, root_folder):
+    def __init__(self, root_folder, rules=None, cache=None):
         self.root_folder = Path(root_folder)
+        # What to skip; the config file and .backupignore files unless the caller built its own
+        self.rules = rules if rules is not None else ExclusionRules.load()
+        self.cache = cache  # Optional ScanCache of folder listings from earlier scans
+        self.manifest = []  # One entry per file, filled by scan_files
+        self.skipped = []  # Paths of files the size or age filters skipped, filled by scan_files
+        self.folder_stats = {}  # Relative folder -> file counts and sizes, filled by scan_files
+        # Filled by walk; seconds counts time spent listing, not time the caller held us up
+        self.stats = {'folders': 0, 'files': 0, 'bytes': 0, 'errors': 0, 'excluded': 0, 'filtered': 0, 'cached': 0,
+                      'seconds': 0.0}
+
+    def list_folder(self, rel_dir, abs_dir, scan_started_ns):
+        """List a folder as (subfolder names, [[name, size, mtime], ...]) before exclusions
 
-    def count_items(self, path):
-        """Count total items for progress calculation"""
-        total_items = 0
+        With a cache, a folder whose mtime and inode haven't changed since
+        it was last listed comes from the cache without a listing or a stat
+        per file; folders listed from disk are stored for the next scan.
+        """
+        cache = self.cache
+        if cache is not None:
+            try:
+                folder_stat = os.stat(abs_dir)
+            except OSError:
+                self.stats['errors'] += 1
+                return [], []
+            cached = cache.get(rel_dir, folder_stat)
+            if cached is not None:
+                self.stats['cached'] += 1
+                return cached
+
+        dirs = []
+        files = []
         try:
-            for item in path.rglob('*'):
-                total_items += 1
+            with os.scandir(abs_dir) as listing:
+                entries = list(listing)
         except (PermissionError, OSError):
-            pass
-        return total_items
+            self.stats['errors'] += 1
+            return dirs, files
+
+        complete = True
+        for entry in entries:
+            try:
+                # DirEntry caches the type from the directory listing,
+                # so this doesn't cost an extra syscall on most platforms
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append([entry.name, stat.st_size, stat.st_mtime])
+            except (PermissionError, OSError):
+                self.stats['errors'] += 1
+                complete = False
+
+        if cache is not None and complete:
+            cache.put(rel_dir, folder_stat, dirs, files, scan_started_ns)
+        return dirs, files
+
+    def walk(self, callback=None, start=''):
+        """Walk the tree once with os.scandir, yielding a manifest entry per file
+
+        Folders are reported through the 'folder' entries so callers can rebuild
+        the directory layout without a second walk. Relative paths always use
+        '/' as separator, the root folder itself is ''. With start, only the
+        subtree at that relative folder is walked (the folder itself isn't
+        reported); paths stay relative to the root.
+        
+        Folders the exclusion rules match are pruned without being listed,
+        and excluded files aren't reported; both count in stats['excluded'].
+        Files the size or age filters skip are reported as 'skipped' entries
+        (and counted in stats['filtered']), so their backups can be kept.
+        Rules are applied on every walk, also to folders from the cache.
+        """
+        root = str(self.root_folder)
+        rules = self.rules
+        cache = self.cache
+        pending = [start]  # Relative directories still to be listed
+        dirs_done = 0
+        files_count = 0
+        total_size = 0
+        last_progress = 0.0
+        stats = self.stats = {'folders': 0, 'files': 0, 'bytes': 0, 'errors': 0, 'excluded': 0, 'filtered': 0,
+                              'cached': 0, 'seconds': 0.0}
+        started = time.perf_counter()
+        scan_started_ns = time.time_ns()
+        seen_folders = None  # Folders listed, to drop the ones that are gone once a whole-tree walk ends
+        expected_files = 0  # Files in the tree at the last scan, for progress
+        listed_files = 0
+        if cache is not None:
+            cache.validate()
+            if not start:
+                seen_folders = set()
+                expected_files = cache.totals()[0]
+        if start and (rules.prepare(root, start) or rules.excludes_folder(start)):
+            pending = []
+
+        while pending:
+            rel_dir = pending.pop()
+            abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+
+            # Listed up front so the folder's .backupignore applies to all its entries
+            dirs, files = self.list_folder(rel_dir, abs_dir, scan_started_ns)
+            if seen_folders is not None:
+                seen_folders.add(rel_dir)
+            listed_files += len(files)
+            rules.read_ignore_file(root, rel_dir, any(name == IGNORE_FILE_NAME for name, _, _ in files))
+
+            for name in dirs:
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                if rules.excludes_folder(rel_path):
+                    stats['excluded'] += 1
+                    continue
+                pending.append(rel_path)
+                stats['seconds'] += time.perf_counter() - started
+                yield {'type': 'folder', 'relative_path': rel_path}
+                started = time.perf_counter()
+
+            for name, size, mtime in files:
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                if rules.excludes_file(rel_path):
+                    stats['excluded'] += 1
+                    continue
+                if rules.filters_file(size, mtime):
+                    stats['filtered'] += 1
+                    stats['seconds'] += time.perf_counter() - started
+                    yield {'type': 'skipped', 'relative_path': rel_path}
+                    started = time.perf_counter()
+                    continue
+                files_count += 1
+                total_size += size
+                stats['seconds'] += time.perf_counter() - started
+                yield {
+                    'type': 'file',
+                    'relative_path': rel_path,
+                    'file_path': os.path.join(abs_dir, name),
+                    'folder_path': rel_dir,
+                    'filename': name,
+                    'size': size,
+                    'mtime': mtime,
+                }
+                started = time.perf_counter()
+
+            dirs_done += 1
+            if callback and (dirs_done % 50 == 0 or not pending):
+                if expected_files:
+                    # The last scan's file count is a better yardstick than the folders still queued
+                    progress = min(0.99, listed_files / expected_files) if pending else 1.0
+                else:
+                    # No pre-count: estimate from folders listed vs. still queued
+                    progress = dirs_done / (dirs_done + len(pending))
+                progress = max(last_progress, progress)
+                last_progress = progress
+                size_mb = total_size / (1024 * 1024)
+                callback(progress, f"Scanned {dirs_done} folders, {files_count} files ({size_mb:.1f} MB)...")
+
+        if seen_folders is not None:
+            cache.prune(seen_folders)
+        elif cache is not None:
+            cache.commit()
+        stats['seconds'] += time.perf_counter() - started
+        stats.update(folders=max(dirs_done - 1, 0), files=files_count, bytes=total_size)
+
+    def stat_file(self, relative_path):
+        """Get the manifest entry of one file, or None if it isn't a regular file any more or is excluded
+
+        A file the size or age filters skip gets a 'skipped' entry, as in walk.
+        """
+        file_path = os.path.join(str(self.root_folder), *relative_path.split('/'))
+        try:
+            stat = os.stat(file_path, follow_symlinks=False)
+        except OSError:
+            return None
+        if not S_ISREG(stat.st_mode):
+            return None
+        if self.rules.prepare(str(self.root_folder), relative_path) or self.rules.excludes_file(relative_path):
+            return None
+        if self.rules.filters_file(stat.st_size, stat.st_mtime):
+            return {'type': 'skipped', 'relative_path': relative_path}
+        folder_path, _, filename = relative_path.rpartition('/')
+        return {
+            'type': 'file',
+            'relative_path': relative_path,
+            'file_path': file_path,
+            'folder_path': folder_path,
+            'filename': filename,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
 
     def scan_files(self, callback=None):
         folders_found = set()
         files_count = 0
         total_size = 0
-        processed_items = 0
+        self.manifest = []
+        self.skipped = []
+        folder_stats = self.folder_stats = {'': new_folder_stats()}
 
         try:
-            # First, count total items for progress tracking
             if callback:
-                callback(0, "Counting items...")
-            
-            total_items = self.count_items(self.root_folder)
-            
-            if total_items == 0:
+                callback(0, "Scanning folders...")
+
+            for item in self.walk(callback):
+                if item['type'] == 'folder':
+                    folders_found.add(item['relative_path'])
+                    folder_stats[item['relative_path']] = new_folder_stats()
+                    continue
+                if item['type'] == 'skipped':
+                    self.skipped.append(item['relative_path'])
+                    continue
+
+                del item['type']
+                self.manifest.append(item)
+                files_count += 1
+                total_size += item['size']
+                stats = folder_stats[item['folder_path']]
+                stats['files'] += 1
+                stats['bytes'] += item['size']
+
+            if files_count == 0 and not folders_found:
                 if callback:
                     callback(1.0, "No items found")
                 return folders_found, files_count, total_size
 
-            # Now scan through all items
-            for item_path in self.root_folder.rglob('*'):
-                processed_items += 1
-                progress = processed_items / total_items
-                
-                try:
-                    if item_path.is_file():
-                        files_count += 1
-                        file_size = item_path.stat().st_size
-                        total_size += file_size
-                        
-                        # Add the parent folder to our set
-                        relative_parent = item_path.parent.relative_to(self.root_folder)
-                        if str(relative_parent) != '.':  # Don't include root as a folder
-                            folders_found.add(str(relative_parent))
-                    
-                    elif item_path.is_dir():
-                        # Add directory to our set
-                        relative_path = item_path.relative_to(self.root_folder)
-                        if str(relative_path) != '.':  # Don't include root
-                            folders_found.add(str(relative_path))
-                    
-                    # Update progress every 100 items or at the end
-                    if processed_items % 100 == 0 or processed_items == total_items:
-                        if callback:
-                            callback(progress, f"Processed {processed_items}/{total_items} items...")
-
-                except (PermissionError, OSError) as e:
-                    if callback and processed_items % 100 == 0:
-                        callback(progress, f"Processed {processed_items}/{total_items} items (some skipped)...")
-                    continue
-
         except Exception as e:
             if callback:
                 callback(1.0, f"Error during scan: {str(e)}")
-        
+
+        roll_up_folder_stats(folder_stats)
+
         # Final progress update
         if callback:
             callback(1.0, "Scan complete!")
-        
-        return folders_found, files_count, total_size
\ No newline at end of file
+
+        return folders_found, files_count, total_size
@@ -0,0 +1,163 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.upload_pool import classify_error, retry_delay
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+class FolderTreeBuilder:
+    """Creates a folder tree on Drive one depth level at a time
+
+    Folders at the same depth don't depend on each other, so each level is
+    split into batch requests of up to BATCH_SIZE inserts which run on a
+    small thread pool, each thread with its own HTTP client.
+    """
+
+    BATCH_SIZE = 100  # Drive accepts at most 100 calls per batch request
+
+    def __init__(self, backend, client_factory, max_workers=4, max_attempts=5, on_retry=None, client_release=None):
+        self.backend = backend
+        self.on_retry = on_retry  # on_retry(error) before a batch's failed inserts are retried
+        self.client_factory = client_factory
+        self.client_release = client_release  # Gets every client back once build() is done
+        self.max_workers = max(1, max_workers)
+        self.max_attempts = max_attempts
+        self.local = threading.local()
+        self.clients = []
+
+    def build(self, folders, folder_ids, on_level_ready=None):
+        """Create every folder not already in folder_ids
+
+        folder_ids maps relative path ('' for the backup root) to Drive id and
+        is filled in as levels complete. on_level_ready(paths, created, total)
+        is called after each level with the folders it created, so callers can
+        start using them. A folder that can't be created is left out of
+        folder_ids along with everything below it, the rest of the tree is
+        still built, and the first error is raised at the end.
+        """
+        levels = {}
+        for folder_path in folders:
+            if folder_path not in folder_ids:
+                levels.setdefault(folder_path.count('/'), []).append(folder_path)
+
+        total = sum(len(paths) for paths in levels.values())
+        created = 0
+        errors = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for depth in sorted(levels):
+                    # Folders whose parent couldn't be created are skipped
+                    paths = [path for path in levels[depth] if path.rpartition('/')[0] in folder_ids]
+                    batches = [paths[i:i + self.BATCH_SIZE] for i in range(0, len(paths), self.BATCH_SIZE)]
+                    level_ids = {}
+                    for batch_ids, error in executor.map(lambda batch: self.create_batch(batch, folder_ids), batches):
+                        level_ids.update(batch_ids)
+                        if error is not None:
+                            errors.append(error)
+                    folder_ids.update(level_ids)
+                    created += len(level_ids)
+                    if on_level_ready:
+                        on_level_ready([path for path in paths if path in level_ids], created, total)
+        finally:
+            if self.client_release:
+                for http in self.clients:
+                    self.client_release(http)
+            self.clients = []
+            self.local = threading.local()
+
+        if errors:
+            raise errors[0]
+        return folder_ids
+
+    def get_http(self):
+        if not hasattr(self.local, 'http'):
+            self.local.http = self.client_factory()
+            self.clients.append(self.local.http)
+        return self.local.http
+
+    def create_batch(self, paths, folder_ids):
+        """Create one batch of sibling-level folders, retrying transient errors
+
+        Returns ({path: folder_id} of the folders created, the error that
+        stopped the rest or None).
+        """
+        created = {}
+        remaining = list(paths)
+        attempts = 0
+
+        while remaining:
+            failed = []
+            errors = []
+
+            folders = []
+            for folder_path in remaining:
+                parent_path, _, folder_name = folder_path.rpartition('/')
+                folders.append((folder_name, folder_ids[parent_path]))
+            try:
+                results = self.backend.create_folders(folders, self.get_http())
+            except Exception as e:
+                # The batch request as a whole failed; retry all of it if that's transient
+                results = [(None, e)] * len(folders)
+            for folder_path, (folder_id, error) in zip(remaining, results):
+                if error is None:
+                    created[folder_path] = folder_id
+                else:
+                    failed.append(folder_path)
+                    errors.append(error)
+
+            if not failed:
+                break
+            attempts += 1
+            retryable = all(classify_error(e) in ('throttled', 'server', 'network') for e in errors)
+            if attempts >= self.max_attempts or not retryable:
+                return created, errors[0]
+            if self.on_retry:
+                for error in errors:
+                    self.on_retry(error)
+            time.sleep(retry_delay(attempts))
+            remaining = failed
+
+        return created, None
+
+
+class LazyFolderMap:
+    """Creates folders on demand, for uploads that arrive before their folder
+
+    Each missing folder is created exactly once even when several workers
+    ask for it at the same time; parents are created first.
+    """
+
+    def __init__(self, folder_ids, create_func, on_created=None):
+        self.folder_ids = folder_ids  # Relative path -> id, '' is the backup root
+        self.create_func = create_func  # create_func(name, parent_id, http) -> id
+        self.on_created = on_created
+        self.lock = threading.Lock()
+        self.pending = {}  # Path -> Event set once its creation finished
+
+    def get(self, path, http=None):
+        while True:
+            with self.lock:
+                if path in self.folder_ids:
+                    return self.folder_ids[path]
+                event = self.pending.get(path)
+                if event is None:
+                    event = self.pending[path] = threading.Event()
+                    break
+            # Someone else is creating it; wait and look again
+            event.wait()
+
+        try:
+            parent_path, _, folder_name = path.rpartition('/')
+            parent_id = self.get(parent_path, http)
+            folder_id = self.create_func(folder_name, parent_id, http)
+            with self.lock:
+                self.folder_ids[path] = folder_id
+            if self.on_created:
+                self.on_created(path, folder_id)
+            return folder_id
+        finally:
+            with self.lock:
+                del self.pending[path]
+            event.set()
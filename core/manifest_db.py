@@ -0,0 +1,248 @@
+import time
+
+from core.hashing import file_md5
+from core.sqlite_store import SQLiteStore
+from core.state import state_path
+
+
+class ManifestDB(SQLiteStore):
+    """Local SQLite index of what a source folder looks like in its Drive backup
+
+    Maps each relative path to the size, mtime and MD5 it had when it was
+    last uploaded, plus the Drive id it was uploaded as. Also lists the
+    content-addressed chunks stored in the backup, by SHA-256, and keeps
+    a journal of the files whose upload failed for good. Rows lost to a
+    crash before their batch was committed only get uploaded again.
+    """
+
+    def __init__(self, source_folder, db_path=None):
+        super().__init__(db_path or state_path('manifest', source_folder, '.sqlite'), """
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                md5 TEXT,
+                file_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY,
+                folder_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                hash TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS failures (
+                path TEXT PRIMARY KEY,
+                error TEXT NOT NULL,
+                error_class TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                runs INTEGER NOT NULL,
+                failed_at REAL NOT NULL
+            );
+        """)
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self.conn.commit()
+
+    def reset(self, root_folder_id):
+        """Forget everything and start indexing a new backup folder"""
+        with self.lock:
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("DELETE FROM folders")
+            self.conn.execute("DELETE FROM chunks")
+            self.conn.execute("DELETE FROM failures")
+            self.conn.execute("DELETE FROM meta WHERE key = 'chunks_folder_id'")
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('root_folder_id', ?)", (root_folder_id,))
+            self.conn.commit()
+
+    def load_files(self):
+        """Load the whole file index as {path: (size, mtime, md5, file_id)}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT path, size, mtime, md5, file_id FROM files")
+            return {row[0]: row[1:] for row in rows}
+
+    def load_files_under(self, scopes):
+        """Like load_files, but only for the given paths and everything below them
+
+        The scope '' is the whole tree.
+        """
+        if '' in scopes:
+            return self.load_files()
+        files = {}
+        with self.lock:
+            for scope in scopes:
+                prefix = f"{scope}/"
+                rows = self.conn.execute(
+                    "SELECT path, size, mtime, md5, file_id FROM files WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (scope, len(prefix), prefix)
+                )
+                files.update((row[0], row[1:]) for row in rows)
+        return files
+
+    def load_folders(self):
+        """Load the folder index as {path: folder_id}"""
+        with self.lock:
+            return dict(self.conn.execute("SELECT path, folder_id FROM folders"))
+
+    def load_checksums(self):
+        """Load (md5, size, file_id) for every indexed file with a checksum"""
+        with self.lock:
+            return self.conn.execute("SELECT md5, size, file_id FROM files WHERE md5 IS NOT NULL").fetchall()
+
+    def load_chunks(self):
+        """Load (hash, file_id) for every stored chunk"""
+        with self.lock:
+            return self.conn.execute("SELECT hash, file_id FROM chunks").fetchall()
+
+    def record_chunk(self, digest, file_id, size):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO chunks (hash, file_id, size) VALUES (?, ?, ?)", (digest, file_id, size)
+            )
+            self._maybe_commit()
+
+    def record_failure(self, path, error, error_class, attempts):
+        """Journal a file whose upload failed for good; attempts and runs add up across runs"""
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO failures (path, error, error_class, attempts, runs, failed_at)
+                   VALUES (?, ?, ?, ?, 1, ?)
+                   ON CONFLICT(path) DO UPDATE SET error = excluded.error, error_class = excluded.error_class,
+                       attempts = attempts + excluded.attempts, runs = runs + 1, failed_at = excluded.failed_at""",
+                (path, error, error_class, attempts, time.time())
+            )
+            # Written right away: the journal is what a rerun of the failures starts from
+            self.conn.commit()
+
+    def load_failures(self):
+        """Load the failure journal as {path: (error, error_class, attempts, runs, failed_at)}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT path, error, error_class, attempts, runs, failed_at FROM failures")
+            return {row[0]: row[1:] for row in rows}
+
+    def clear_failures(self, paths):
+        with self.lock:
+            self.conn.executemany("DELETE FROM failures WHERE path = ?", ((path,) for path in paths))
+            self.conn.commit()
+
+    def record_folder(self, path, folder_id):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO folders (path, folder_id) VALUES (?, ?)", (path, folder_id))
+            self._maybe_commit()
+
+    def record_file(self, path, size, mtime, md5, file_id):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime, md5, file_id) VALUES (?, ?, ?, ?, ?)",
+                (path, size, mtime, md5, file_id)
+            )
+            self._maybe_commit()
+
+    def remove_files(self, paths):
+        with self.lock:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in paths))
+            self.conn.commit()
+
+    def classify(self, file_info, record):
+        """Decide what to do with one scanned file given its index record
+
+        Returns None if it's unchanged, otherwise the file_info to upload;
+        changed files carry the 'file_id' to update in place. Only files
+        whose size matches but mtime moved get hashed, to tell a touch apart
+        from a real edit.
+        """
+        if record is None:
+            return file_info
+
+        size, mtime, md5, file_id = record
+        if size == file_info['size'] and mtime == file_info['mtime']:
+            return None
+
+        if size == file_info['size'] and md5:
+            try:
+                if file_md5(file_info['file_path']) == md5:
+                    # Only the timestamp moved; remember it and skip the upload
+                    self.record_file(file_info['relative_path'], size, file_info['mtime'], md5, file_id)
+                    return None
+            except OSError:
+                pass
+
+        # Packed files can't be updated in place; they get uploaded or packed afresh
+        if file_id.startswith('pack:'):
+            return file_info
+        return dict(file_info, file_id=file_id)
+
+    def plan(self, manifest, scopes=None, skipped=()):
+        """Diff a whole scan manifest against the index in one pass
+
+        Returns (to_upload, unchanged_count, deleted) where deleted lists
+        (path, file_id) for indexed files that no longer exist locally.
+        With scopes, the manifest is a rescan of only those paths (see
+        load_files_under) and deletions are only looked for inside them.
+        skipped lists paths that exist but were filtered out this run;
+        their records are kept and count as unchanged.
+        """
+        indexed = self.load_files() if scopes is None else self.load_files_under(scopes)
+        to_upload = []
+        unchanged_count = 0
+        for path in skipped:
+            if indexed.pop(path, None) is not None:
+                unchanged_count += 1
+
+        for file_info in manifest:
+            planned = self.classify(file_info, indexed.pop(file_info['relative_path'], None))
+            if planned is None:
+                unchanged_count += 1
+            else:
+                to_upload.append(planned)
+
+        # Whatever is left in the index no longer exists locally
+        deleted = [(path, record[3]) for path, record in indexed.items()]
+        self.commit()
+        return to_upload, unchanged_count, deleted
+
+    def begin_streaming_plan(self):
+        """Start planning files one at a time, as a streaming walk finds them"""
+        with self.lock:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM temp.seen")
+
+    def plan_one(self, file_info):
+        """Like classify, but looks the record up with a point query
+
+        Keeps memory flat on huge trees; the path is remembered so
+        unseen_files can report deletions once the walk is over.
+        """
+        path = file_info['relative_path']
+        with self.lock:
+            record = self.conn.execute(
+                "SELECT size, mtime, md5, file_id FROM files WHERE path = ?", (path,)
+            ).fetchone()
+            self.conn.execute("INSERT OR IGNORE INTO temp.seen (path) VALUES (?)", (path,))
+        return self.classify(file_info, record)
+
+    def keep_one(self, path):
+        """Mark a file the streaming walk skipped as seen; True if it is indexed"""
+        with self.lock:
+            self.conn.execute("INSERT OR IGNORE INTO temp.seen (path) VALUES (?)", (path,))
+            return self.conn.execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone() is not None
+
+    def unseen_files(self):
+        """Get (path, file_id) of indexed files the streaming walk didn't see"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT path, file_id FROM files WHERE path NOT IN (SELECT path FROM temp.seen)"
+            ).fetchall()
@@ -0,0 +1,285 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from core.upload_pool import RATE_LIMIT_REASONS, classify_error
+
+# Upper bounds in seconds, like Prometheus "le" buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = 'drive_backup'
+
+
+# classify_error's classes under the names the metrics use
+METRIC_ERROR_CLASSES = {'throttled': 'rate_limit', 'auth': 'client', 'unknown': 'other'}
+
+
+def error_class(error):
+    """Bucket an error for counting: rate_limit, server, client, network, local or other"""
+    kind = classify_error(error)
+    return METRIC_ERROR_CLASSES.get(kind, kind)
+
+
+def status_class(status, content=b''):
+    """Bucket a failed HTTP status the same way as error_class"""
+    text = content.decode('utf-8', 'replace') if isinstance(content, bytes) else str(content)
+    if status == 429 or (status == 403 and any(reason in text for reason in RATE_LIMIT_REASONS)):
+        return 'rate_limit'
+    return 'server' if status >= 500 else 'client'
+
+
+class Histogram:
+    """Fixed-bucket histogram; observing is a bisect and two additions"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Get [(upper bound, observations <= bound)], ending with +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, None when empty"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): total
+                        for bound, total in self.cumulative()},
+        }
+
+
+class BackupMetrics:
+    """Phase timings, request latencies, retries, errors and byte counts of one run
+
+    Every update is a short critical section, cheap next to the network
+    calls it measures, so it stays on for every run. The report is written
+    at the end as JSON and, optionally, as a Prometheus textfile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.phases = {}  # Phase name -> seconds
+        self.latency = {}  # Operation -> Histogram
+        self.errors = {}  # Error class -> count
+        self.retries = {}  # Error class -> count
+        self.counters = {}  # Name -> value
+        self.success = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, time.perf_counter() - started)
+
+    def add_phase_time(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def observe(self, operation, seconds, error=None, failure_class=None):
+        """Record one request; error (or failure_class for HTTP statuses) counts a failure"""
+        if error is not None:
+            failure_class = error_class(error)
+        with self.lock:
+            histogram = self.latency.get(operation)
+            if histogram is None:
+                histogram = self.latency[operation] = Histogram()
+            histogram.observe(seconds)
+            if failure_class:
+                self.errors[failure_class] = self.errors.get(failure_class, 0) + 1
+
+    def retry(self, error):
+        """on_retry hook for the retry loops"""
+        retry_class = error_class(error)
+        with self.lock:
+            self.retries[retry_class] = self.retries.get(retry_class, 0) + 1
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def instrument(self, backend):
+        return InstrumentedBackend(backend, self)
+
+    def wrap_http(self, http):
+        return InstrumentedHttp(http, self)
+
+    def report(self):
+        with self.lock:
+            return {
+                'started_at': self.started_at,
+                'duration_seconds': round(time.time() - self.started_at, 3),
+                'success': self.success,
+                'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                'requests': {operation: histogram.to_dict() for operation, histogram in self.latency.items()},
+                'errors': dict(self.errors),
+                'retries': dict(self.retries),
+                'counters': dict(self.counters),
+            }
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path):
+        """Write the run in the node-exporter textfile collector format"""
+        report = self.report()
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {metric_type}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                             else f"{METRIC_PREFIX}_{name} {value}")
+
+        metric('last_run_timestamp_seconds', 'gauge', 'When the last backup run started.',
+               [((), report['started_at'])])
+        metric('last_run_duration_seconds', 'gauge', 'Wall time of the last backup run.',
+               [((), report['duration_seconds'])])
+        metric('last_run_success', 'gauge', 'Whether the last backup run completed.',
+               [((), 1 if report['success'] else 0)])
+        metric('phase_seconds', 'gauge', 'Wall time spent in each phase of the last run.',
+               [((('phase', name),), seconds) for name, seconds in sorted(report['phases'].items())])
+        metric('errors', 'gauge', 'Failed requests in the last run by error class.',
+               [((('class', name),), count) for name, count in sorted(report['errors'].items())])
+        metric('retries', 'gauge', 'Retries in the last run by error class.',
+               [((('class', name),), count) for name, count in sorted(report['retries'].items())])
+        metric('run_counter', 'gauge', 'Files and bytes handled in the last run.',
+               [((('name', name),), value) for name, value in sorted(report['counters'].items())])
+
+        lines.append(f"# HELP {METRIC_PREFIX}_request_duration_seconds Drive request latency by operation.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_request_duration_seconds histogram")
+        with self.lock:
+            histograms = sorted(self.latency.items())
+            for operation, histogram in histograms:
+                for bound, total in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else str(bound)
+                    lines.append(f'{METRIC_PREFIX}_request_duration_seconds_bucket'
+                                 f'{{operation="{operation}",le="{le}"}} {total}')
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_sum{{operation="{operation}"}} '
+                             f'{histogram.sum:.6f}')
+                lines.append(f'{METRIC_PREFIX}_request_duration_seconds_count{{operation="{operation}"}} '
+                             f'{histogram.count}')
+
+        write_atomic(path, '\n'.join(lines) + '\n')
+
+
+def write_atomic(path, text):
+    # The textfile collector may read at any moment; never let it see half a file
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+class InstrumentedBackend:
+    """Wraps a Drive backend, timing every call by method name"""
+
+    def __init__(self, backend, metrics):
+        self.backend = backend
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        if not callable(method) or name in ('new_client', 'release_client'):
+            return method
+        return functools.partial(self.call, name)
+
+    def call(self, name, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = getattr(self.backend, name)(*args, **kwargs)
+        except Exception as e:
+            self.metrics.observe(name, time.perf_counter() - started, e)
+            raise
+        self.metrics.observe(name, time.perf_counter() - started)
+        return result
+
+    def upload_file(self, file_path, metadata, http=None):
+        result = self.call('upload_file', file_path, metadata, http)
+        self.metrics.count('bytes_sent', os.path.getsize(file_path))
+        return result
+
+    def upload_bytes(self, data, metadata, file_id=None, http=None):
+        result = self.call('upload_bytes', data, metadata, file_id, http)
+        self.metrics.count('bytes_sent', len(data))
+        return result
+
+    def list_children(self, parent_ids, http=None):
+        # A generator: time the work done while producing items, not the caller's
+        started = time.perf_counter()
+        busy = 0.0
+        try:
+            for item in self.backend.list_children(parent_ids, http):
+                busy += time.perf_counter() - started
+                yield item
+                started = time.perf_counter()
+        except Exception as e:
+            self.metrics.observe('list_children', busy + time.perf_counter() - started, e)
+            raise
+        self.metrics.observe('list_children', busy + time.perf_counter() - started)
+
+
+class InstrumentedHttp:
+    """Wraps an http client used directly (resumable uploads, downloads), timing each request"""
+
+    def __init__(self, http, metrics):
+        self.http = http
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, url, method='GET', body=None, headers=None, **kwargs):
+        if method == 'GET':
+            operation = 'download'
+        elif 'uploadType=resumable' in url:
+            operation = 'upload_session'
+        else:
+            operation = 'upload_chunk'
+
+        started = time.perf_counter()
+        try:
+            resp, content = self.http.request(url, method, body=body, headers=headers, **kwargs)
+        except Exception as e:
+            self.metrics.observe(operation, time.perf_counter() - started, e)
+            raise
+        failure_class = status_class(resp.status, content) if resp.status >= 400 else None
+        self.metrics.observe(operation, time.perf_counter() - started, failure_class=failure_class)
+        if operation == 'upload_chunk' and body and resp.status in (200, 201, 308):
+            self.metrics.count('bytes_sent', len(body))
+        return resp, content
@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+
+from core.drive_backend import DriveHttpError
+
+PACKS_FOLDER_NAME = '_drive_backup_packs'
+DOWNLOAD_URL = 'https://www.googleapis.com/drive/v2/files'
+
+
+class HashingReader:
+    """Wraps a file so everything read through it is added to an MD5"""
+
+    def __init__(self, f):
+        self.f = f
+        self.md5 = hashlib.md5()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.md5.update(data)
+        return data
+
+
+class SmallFilePacker:
+    """Streams small files into tar segments of roughly segment_size bytes
+
+    Every packed file is recorded with the segment it went into and the
+    byte offset of its data inside that segment, so a single file can later
+    be restored with one ranged download instead of fetching whole segments.
+    """
+
+    def __init__(self, segment_size=64 * 1024 * 1024, temp_dir=None):
+        self.segment_size = segment_size
+        self.temp_dir = temp_dir
+        self.segment_count = 0
+
+    def pack(self, files, on_error=None):
+        """Yield (segment_path, segment_name, entries) as each segment fills up
+
+        entries is a list of (file_info, data_offset, size, mtime, md5), with
+        the MD5 of the bytes that went into the segment. A file that fails
+        part way is cut back out of the segment and passed to
+        on_error(file_info, error). The caller owns segment_path and should
+        delete it once it's uploaded.
+        """
+        tar = None
+        entries = []
+
+        for file_info in files:
+            if tar is None:
+                self.segment_count += 1
+                segment_name = f"pack-{self.segment_count:05d}.tar"
+                fd, segment_path = tempfile.mkstemp(suffix='.tar', dir=self.temp_dir)
+                os.close(fd)
+                tar = tarfile.open(segment_path, 'w', format=tarfile.PAX_FORMAT)
+
+            member_offset = tar.offset
+            try:
+                with open(file_info['file_path'], 'rb') as f:
+                    stat = os.fstat(f.fileno())
+                    info = tarfile.TarInfo(file_info['relative_path'])
+                    info.size = stat.st_size
+                    info.mtime = stat.st_mtime
+                    info.mode = 0o644
+                    # The data starts right after this member's (possibly PAX) header
+                    header = info.tobuf(tar.format, tar.encoding, tar.errors)
+                    data_offset = tar.offset + len(header)
+                    reader = HashingReader(f)
+                    tar.addfile(info, reader)
+            except OSError as e:
+                # e.g. the file shrank while it was copied; drop the partial member
+                tar.fileobj.seek(member_offset)
+                tar.fileobj.truncate()
+                tar.offset = member_offset
+                if on_error:
+                    on_error(file_info, e)
+                else:
+                    print(f"Failed to pack {file_info['filename']}: {e}")
+                continue
+
+            entries.append((file_info, data_offset, stat.st_size, stat.st_mtime, reader.md5.hexdigest()))
+
+            if tar.offset >= self.segment_size:
+                tar.close()
+                yield segment_path, segment_name, entries
+                tar = None
+                entries = []
+
+        if tar is not None:
+            tar.close()
+            if entries:
+                yield segment_path, segment_name, entries
+            else:
+                os.remove(segment_path)
+
+
+def build_pack_index(segments, deleted=None):
+    """Build the compact, gzipped JSON index of packed files
+
+    segments is a list of (segment_name, segment_drive_id, entries) as
+    produced while uploading. The index maps each relative path to
+    [segment name, data offset, size, mtime, md5]; version 1 indexes have
+    no md5. deleted maps packed paths removed locally since to the Drive id
+    of the segment they were in.
+    """
+    index = {'version': 2, 'segments': {}, 'files': {}, 'deleted': dict(deleted or {})}
+    for segment_name, segment_id, entries in segments:
+        index['segments'][segment_name] = segment_id
+        for file_info, data_offset, size, mtime, md5 in entries:
+            index['files'][file_info['relative_path']] = [segment_name, data_offset, size, mtime, md5]
+    return gzip.compress(json.dumps(index, separators=(',', ':')).encode('utf-8'))
+
+
+def load_pack_index(data):
+    """Parse an index produced by build_pack_index"""
+    return json.loads(gzip.decompress(data).decode('utf-8'))
+
+
+def fetch_packed_file(http, index, relative_path):
+    """Download the content of one packed file with a single ranged request"""
+    segment_name, data_offset, size = index['files'][relative_path][:3]
+    if size == 0:
+        return b''
+    segment_id = index['segments'][segment_name]
+    headers = {'Range': f"bytes={data_offset}-{data_offset + size - 1}"}
+    resp, content = http.request(f"{DOWNLOAD_URL}/{segment_id}?alt=media", 'GET', headers=headers)
+    if resp.status not in (200, 206):
+        raise DriveHttpError(resp.status, content)
+    # A server that ignores Range sends the whole segment
+    return content if resp.status == 206 else content[data_offset:data_offset + size]
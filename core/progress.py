@@ -0,0 +1,128 @@
+import collections
+import threading
+import time
+
+RATE_WINDOW = 10.0  # Seconds of history used for throughput
+
+
+class ProgressTracker:
+    """Collects progress from the core and hands it out at the UI's pace
+
+    It's called like a plain progress_callback(progress, message), which only
+    stores the latest values, so workers can report every file cheaply. Bytes
+    and file counts are tracked alongside for byte-accurate progress,
+    throughput and ETA. Consumers either poll snapshot() on their own timer,
+    or pass a listener(progress, message) which is forwarded at most once per
+    interval (call flush() to forward the last update).
+    """
+
+    def __init__(self, listener=None, interval=0.1):
+        self.listener = listener
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.progress = 0.0
+        self.message = ""
+        self.files_total = 0
+        self.bytes_total = 0
+        self.estimated = False
+        self.span = None  # (start, end) of overall progress the transfer phase covers
+        self.files_done = 0
+        self.bytes_done = 0
+        self.reported = {}  # Key -> bytes reported so far for files still in flight
+        self.samples = collections.deque()  # (time, bytes_done, files_done)
+        self.next_forward = 0.0
+
+    @classmethod
+    def wrap(cls, progress_callback):
+        """Get a tracker for progress_callback, which may already be one"""
+        if isinstance(progress_callback, cls):
+            return progress_callback
+        return cls(progress_callback)
+
+    def __call__(self, progress, message):
+        self.progress = progress
+        self.message = message
+        if self.listener:
+            now = time.monotonic()
+            if now >= self.next_forward:
+                self.next_forward = now + self.interval
+                self.listener(progress, message)
+
+    def flush(self):
+        if self.listener:
+            self.listener(self.progress, self.message)
+
+    def set_totals(self, files, total_bytes, estimated=False):
+        """Set what the transfer phase will cover; estimated totals are shown as such"""
+        with self.lock:
+            self.files_total = files
+            self.bytes_total = total_bytes
+            self.estimated = estimated
+
+    def set_span(self, start, end):
+        """Map transfer progress onto [start, end] of the overall bar, so
+        snapshots move with bytes sent even between file completions"""
+        self.span = (start, end)
+
+    def add_bytes(self, key, count):
+        """Count bytes of a file that is still being transferred"""
+        with self.lock:
+            self.reported[key] = self.reported.get(key, 0) + count
+            self.bytes_done += count
+
+    def file_done(self, key, size, files=1):
+        """Count a finished transfer of size bytes, topping up what add_bytes reported
+
+        files is how many source files it carried, e.g. for a packed archive.
+        """
+        with self.lock:
+            self.bytes_done += max(0, size - self.reported.pop(key, 0))
+            self.files_done += files
+
+    def fraction(self):
+        """Share of the transfer phase done, by bytes when there are any"""
+        with self.lock:
+            return self.transfer_fraction()
+
+    def transfer_fraction(self):
+        if self.bytes_total > 0:
+            return min(1.0, self.bytes_done / self.bytes_total)
+        if self.files_total > 0:
+            return min(1.0, self.files_done / self.files_total)
+        return 0.0
+
+    def snapshot(self):
+        """Get the latest state with throughput and ETA as a dict"""
+        now = time.monotonic()
+        with self.lock:
+            self.samples.append((now, self.bytes_done, self.files_done))
+            while len(self.samples) > 2 and now - self.samples[0][0] > RATE_WINDOW:
+                self.samples.popleft()
+            first_time, first_bytes, first_files = self.samples[0]
+            elapsed = now - first_time
+            bytes_per_second = (self.bytes_done - first_bytes) / elapsed if elapsed > 0 else 0.0
+            files_per_second = (self.files_done - first_files) / elapsed if elapsed > 0 else 0.0
+
+            eta = None
+            if self.bytes_total > 0 and bytes_per_second > 0:
+                eta = max(0, self.bytes_total - self.bytes_done) / bytes_per_second
+            elif self.files_total > 0 and files_per_second > 0:
+                eta = max(0, self.files_total - self.files_done) / files_per_second
+
+            progress = self.progress
+            if self.span:
+                start, end = self.span
+                progress = max(progress, start + self.transfer_fraction() * (end - start))
+
+            return {
+                'progress': progress,
+                'message': self.message,
+                'files_done': self.files_done,
+                'files_total': self.files_total,
+                'bytes_done': self.bytes_done,
+                'bytes_total': self.bytes_total,
+                'estimated': self.estimated,
+                'bytes_per_second': bytes_per_second,
+                'files_per_second': files_per_second,
+                'eta': eta,
+            }
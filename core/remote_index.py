@@ -0,0 +1,246 @@
+import gzip
+import json
+import os
+
+from core.compression import CODEC_PROPERTY, ORIGINAL_MD5_PROPERTY, ORIGINAL_SIZE_PROPERTY
+from core.folder_tree import FOLDER_MIME_TYPE
+from core.hashing import file_md5
+from core.state import get_state_dir
+
+
+def get_property(item, key):
+    for prop in item.get('properties') or []:
+        if prop.get('key') == key:
+            return prop.get('value')
+    return None
+
+
+def remote_codec(item):
+    """Get how the current revision of a listed Drive file is encoded"""
+    return get_property(item, CODEC_PROPERTY) or 'identity'
+
+
+def remote_md5(item):
+    """Get the checksum of the original content of a listed Drive file
+
+    The original-* properties only describe encoded revisions; a raw one
+    may still carry those of an older compressed revision.
+    """
+    if remote_codec(item) == 'identity':
+        return item.get('md5Checksum')
+    return get_property(item, ORIGINAL_MD5_PROPERTY) or None
+
+
+def remote_size(item):
+    """Get the size of the original content of a listed Drive file"""
+    if remote_codec(item) == 'identity':
+        return int(item.get('fileSize') or 0)
+    return int(get_property(item, ORIGINAL_SIZE_PROPERTY) or item.get('fileSize') or 0)
+
+
+class RemoteIndex:
+    """Path -> id/md5/size map of an existing backup folder on Drive
+
+    The tree is loaded breadth-first, listing the children of a whole level
+    of folders at a time (grouped into few paged queries by the backend).
+    It can be saved locally with a changes token, so the next run loads it
+    and only applies what changed on Drive since then.
+    """
+
+    def __init__(self, root_id):
+        self.root_id = root_id
+        self.clear()
+
+    def clear(self):
+        self.entries = {'': {'id': self.root_id, 'folder': True}}  # Relative path -> entry
+        self.paths_by_id = {self.root_id: ''}
+        self.change_token = None
+
+    def cache_path(self):
+        return get_state_dir() / f"remote_{self.root_id}.json.gz"
+
+    def add(self, parent_path, item):
+        path = f"{parent_path}/{item['title']}" if parent_path else item['title']
+        if path in self.entries:
+            return None  # Drive allows duplicate titles; keep the first one
+        entry = {'id': item['id'], 'folder': item.get('mimeType') == FOLDER_MIME_TYPE}
+        if not entry['folder']:
+            entry['md5'] = remote_md5(item)
+            entry['size'] = remote_size(item)
+        self.entries[path] = entry
+        self.paths_by_id[item['id']] = path
+        return path
+
+    def remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry:
+            self.paths_by_id.pop(entry['id'], None)
+
+    def load(self, backend, http=None, progress_callback=None):
+        """Load the tree, from the local cache if it can be brought up to date"""
+        if self.load_cached(backend, http):
+            return self
+
+        # Take the token first so changes made while we list aren't lost
+        self.change_token = backend.get_start_page_token(http)
+        frontier = ['']
+        while frontier:
+            next_frontier = []
+            for item in backend.list_children([self.entries[path]['id'] for path in frontier], http):
+                parent_path = self.parent_path_of(item)
+                if parent_path is None:
+                    continue
+                path = self.add(parent_path, item)
+                if path is not None and self.entries[path]['folder']:
+                    next_frontier.append(path)
+            frontier = next_frontier
+            if progress_callback:
+                progress_callback(f"🔎 Indexed {len(self.entries)} existing items on Drive...")
+
+        self.save()
+        return self
+
+    def parent_path_of(self, item):
+        for parent in item.get('parents') or []:
+            path = self.paths_by_id.get(parent['id'])
+            if path is not None and self.entries[path]['folder']:
+                return path
+        return None
+
+    def save(self):
+        data = {'root_id': self.root_id, 'change_token': self.change_token, 'entries': self.entries}
+        temp_path = f"{self.cache_path()}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp_path, self.cache_path())
+
+    def load_cached(self, backend, http=None):
+        """Load the saved index and apply Drive changes since it was saved
+
+        Returns False (leaving the index empty) if there is no usable cache,
+        or if a folder we know about was moved, renamed or deleted, since
+        that would shift the paths of a whole subtree.
+        """
+        try:
+            with gzip.open(self.cache_path(), 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('root_id') != self.root_id or not data.get('change_token'):
+            return False
+
+        self.entries = data['entries']
+        self.change_token = data['change_token']
+        self.paths_by_id = {entry['id']: path for path, entry in self.entries.items()}
+
+        page_token = data['change_token']
+        while page_token:
+            response = backend.list_changes(page_token, http)
+            for change in response.get('items', []):
+                if not self.apply_change(change):
+                    self.clear()
+                    return False
+            if response.get('newStartPageToken'):
+                self.change_token = response['newStartPageToken']
+            page_token = response.get('nextPageToken')
+
+        self.save()
+        return True
+
+    def apply_change(self, change):
+        """Apply one Drive change; returns False if the cache can't be patched"""
+        item = change.get('file') or {}
+        gone = change.get('deleted') or item.get('labels', {}).get('trashed')
+        known_path = self.paths_by_id.get(change['fileId'])
+
+        if known_path is not None:
+            entry = self.entries[known_path]
+            if entry['folder']:
+                if known_path == '':
+                    return not gone
+                parent_path = self.parent_path_of(item)
+                renamed = known_path != (f"{parent_path}/{item.get('title')}" if parent_path else item.get('title'))
+                return not gone and parent_path is not None and not renamed
+            self.remove(known_path)
+
+        if gone or not item:
+            return True
+        parent_path = self.parent_path_of(item)
+        if parent_path is not None:
+            self.add(parent_path, item)
+        return True
+
+    def record_file(self, path, file_id, md5, size):
+        """Remember a file this run put on Drive, so the saved index doesn't
+        depend on the change feed having caught up"""
+        self.remove(path)
+        self.entries[path] = {'id': file_id, 'folder': False, 'md5': md5, 'size': size}
+        self.paths_by_id[file_id] = path
+
+    def record_folder(self, path, folder_id):
+        if path not in self.entries:
+            self.entries[path] = {'id': folder_id, 'folder': True}
+            self.paths_by_id[folder_id] = path
+
+    def find_folder(self, parent_id, folder_name):
+        """Get the id of an indexed folder by parent id and name"""
+        parent_path = self.paths_by_id.get(parent_id)
+        if parent_path is None:
+            return None
+        entry = self.entries.get(f"{parent_path}/{folder_name}" if parent_path else folder_name)
+        return entry['id'] if entry and entry['folder'] else None
+
+    def files_under(self, prefix):
+        """Get (name, id) of the files directly inside the folder at prefix"""
+        return [
+            (path[len(prefix) + 1:], entry['id']) for path, entry in self.entries.items()
+            if not entry['folder'] and path.startswith(f"{prefix}/") and '/' not in path[len(prefix) + 1:]
+        ]
+
+    def folder_ids(self):
+        """Get {relative path: id} for every folder in the backup"""
+        return {path: entry['id'] for path, entry in self.entries.items() if entry['folder']}
+
+    def classify(self, file_info):
+        """Decide what to do with one scanned file
+
+        Returns (file_info_to_upload, None), or (None, entry) if the same
+        content is already on Drive. A remote file with the same path and
+        size is checked by MD5; changed ones carry the 'file_id' to update.
+        """
+        entry = self.entries.get(file_info['relative_path'])
+        if entry is None or entry['folder']:
+            return file_info, None
+        if entry['size'] == file_info['size'] and entry.get('md5'):
+            try:
+                if file_md5(file_info['file_path']) == entry['md5']:
+                    return None, entry
+            except OSError:
+                pass
+        return dict(file_info, file_id=entry['id']), None
+
+    def plan(self, manifest):
+        """Split a scan manifest into files to upload and files already on Drive
+
+        Returns (to_upload, unchanged) where unchanged holds (file_info, entry) pairs.
+        """
+        to_upload = []
+        unchanged = []
+        for file_info in manifest:
+            planned, entry = self.classify(file_info)
+            if planned is None:
+                unchanged.append((file_info, entry))
+            else:
+                to_upload.append(planned)
+        return to_upload, unchanged
+
+    def missing_files(self, local_paths, excluded_prefix):
+        """Get (path, id) of remote files with no local counterpart
+
+        excluded_prefix is a path prefix, or a tuple of them, to leave out.
+        """
+        return [
+            (path, entry['id']) for path, entry in self.entries.items()
+            if not entry['folder'] and path not in local_paths
+            and not path.startswith(excluded_prefix)
+        ]
@@ -0,0 +1,432 @@
+from core.chunking import CHUNKS_FOLDER_NAME, load_chunk_manifest
+from core.drive_backend import DriveHttpError, open_google_drive
+from core.file_scanner import FileScanner
+from core.folder_tree import FOLDER_MIME_TYPE
+from core.hashing import file_md5
+from core.manifest_db import ManifestDB
+from core.packer import DOWNLOAD_URL, PACKS_FOLDER_NAME, fetch_packed_file, load_pack_index
+from core.progress import ProgressTracker
+from core.remote_index import remote_codec, remote_md5, remote_size
+from core.upload_pool import UploadPool, call_with_backoff
+import hashlib
+import os
+import tempfile
+import zlib
+
+
+class ChecksumMismatch(Exception):
+    """Downloaded content doesn't match the checksum recorded in the backup"""
+
+
+def is_safe_name(title):
+    """Check that a Drive title can be used as one local path component"""
+    return title not in ('', '.', '..') and not any(c in title for c in ('/', '\\', '\0'))
+
+
+def download_pieces(http, file_id, size, piece_size):
+    """Yield the content of a Drive file in ranged pieces of at most piece_size bytes"""
+    for start in range(0, size, piece_size):
+        end = min(start + piece_size, size) - 1
+        headers = {'Range': f"bytes={start}-{end}"}
+        resp, content = http.request(f"{DOWNLOAD_URL}/{file_id}?alt=media", 'GET', headers=headers)
+        if resp.status not in (200, 206):
+            raise DriveHttpError(resp.status, content)
+        if resp.status == 200:
+            # The server ignored Range and sent the whole file
+            yield content[start:]
+            return
+        if len(content) != end - start + 1:
+            raise DriveHttpError(resp.status, f"expected {end - start + 1} bytes at {start}, got {len(content)}")
+        yield content
+
+
+def inflate(decompressor, data, limit):
+    """Yield the gzip-decompressed output of data, at most limit bytes at a time"""
+    while data:
+        output = decompressor.decompress(data, limit)
+        if output:
+            yield output
+        data = decompressor.unconsumed_tail
+
+
+class RestoreEngine:
+    """Downloads a Drive backup folder back into a local folder, or checks a local folder against it
+
+    The backup is listed breadth-first, a whole level of folders per
+    listing, like RemoteIndex does. Files are downloaded by a pool of
+    workers in ranged pieces of chunk_size bytes that go straight into a
+    temporary file next to their target, so memory stays flat whatever
+    the file size; each file replaces its target only once its MD5 matched
+    the backup. Compressed, chunked and packed files are decoded on the way.
+    """
+
+    def __init__(self, max_workers=8, chunk_size=8 * 1024 * 1024, backend=None):
+        self.backend = backend  # Drive access; Google Drive unless another backend is passed in
+        self.max_workers = max_workers  # Parallel downloads
+        self.chunk_size = chunk_size  # Bytes per ranged download request
+        self.chunk_ids = {}  # SHA-256 -> Drive id of the chunk objects of the backup being read
+        self.progress = None  # ProgressTracker of the current run
+        self.last_counts = {}  # Restored/failed/... counts of the last run
+        self.last_report = {}  # Paths that are missing, changed or extra, from the last verify
+
+    def authenticate(self):
+        """Authenticate with Google Drive"""
+        if self.backend is None:
+            self.backend = open_google_drive()
+        return True
+
+    def find_backup(self, folder_path, backup_name=None):
+        """Get the id of a backup folder in My Drive by name, or of the last backup of folder_path"""
+        if backup_name:
+            folder_id = call_with_backoff(lambda: self.backend.find_folder(backup_name, 'root'))
+            if not folder_id:
+                raise Exception(f"No backup folder named {backup_name} on Drive")
+            return folder_id
+
+        manifest_db = ManifestDB(folder_path)
+        try:
+            root_id = manifest_db.get_meta('root_folder_id')
+        finally:
+            manifest_db.close()
+        if not root_id:
+            raise Exception(f"No previous backup of {folder_path}; give the backup folder's name")
+        return root_id
+
+    def list_backup(self, root_id, progress_callback=None):
+        """List every file of a backup as {relative path: entry}, plus its folders
+
+        Entries say how to get the original content back: a Drive file id
+        with the codec it was stored with, or a place in a pack segment.
+        Drive allows several files with one title; the newest one wins, as
+        it does between a regular file and a packed copy of the same path.
+        Items whose title can't be a local file name, like '..' or one with
+        a slash, are left out.
+        """
+        self.chunk_ids = {}
+        http = self.backend.new_client()
+        try:
+            folder_paths = {root_id: ''}  # Drive id -> relative path
+            internal = {}  # Drive id -> name, for the packs and chunks folders
+            items = {}  # Relative path -> newest Drive item
+            frontier = [root_id]
+            while frontier:
+                children = call_with_backoff(lambda: list(self.backend.list_children(frontier, http)))
+                frontier = []
+                for item in children:
+                    parent_path = next(
+                        (folder_paths[p['id']] for p in item.get('parents') or [] if p['id'] in folder_paths), None
+                    )
+                    if parent_path is None:
+                        continue
+                    if not is_safe_name(item['title']):
+                        print(f"Skipping {item['title']!r} in {parent_path or 'the backup root'}: not a valid file name")
+                        continue
+                    path = f"{parent_path}/{item['title']}" if parent_path else item['title']
+                    if item.get('mimeType') == FOLDER_MIME_TYPE:
+                        if path in (PACKS_FOLDER_NAME, CHUNKS_FOLDER_NAME):
+                            internal[item['id']] = path
+                            continue
+                        # Folders with the same path are merged
+                        folder_paths[item['id']] = path
+                        frontier.append(item['id'])
+                    elif path not in items or item.get('modifiedDate', '') > items[path].get('modifiedDate', ''):
+                        items[path] = item
+                if progress_callback:
+                    progress_callback(0.05, f"🔎 Listed {len(items)} files in {len(folder_paths)} folders...")
+
+            files = {path: self.file_entry(path, item) for path, item in items.items()}
+            if internal:
+                self.list_internal(internal, files, http)
+        finally:
+            self.backend.release_client(http)
+
+        folders = sorted({path for path in folder_paths.values() if path})
+        return files, folders
+
+    def list_internal(self, internal, files, http):
+        """Collect the chunk objects and merge the packed files of the packs folder into files"""
+        children = call_with_backoff(lambda: list(self.backend.list_children(list(internal), http)))
+        segment_dates = {}
+        indexes = []
+        for item in children:
+            folder = next((internal[p['id']] for p in item.get('parents') or [] if p['id'] in internal), None)
+            if folder == CHUNKS_FOLDER_NAME:
+                self.chunk_ids[item['title']] = item['id']
+            elif item['title'].startswith('index-'):
+                indexes.append(item)
+            else:
+                segment_dates[item['id']] = item.get('modifiedDate', '')
+
+        loaded = []
+        removed = set()
+        for item in sorted(indexes, key=lambda item: item['title']):
+            size = int(item.get('fileSize') or 0)
+            data = call_with_backoff(lambda: b''.join(download_pieces(http, item['id'], size, self.chunk_size)))
+            index = load_pack_index(data)
+            loaded.append(index)
+            # Packed files deleted locally can't be trashed on their own
+            removed.update(index.get('deleted', {}).items())
+
+        # Each backup run wrote its own index; later ones win
+        for index in loaded:
+            for path, record in index['files'].items():
+                segment_name, _, size, mtime = record[:4]
+                md5 = record[4] if len(record) > 4 else None
+                segment_id = index['segments'].get(segment_name)
+                modified = segment_dates.get(segment_id)
+                if modified is None or (path, segment_id) in removed:
+                    continue  # Segment trashed or never finished uploading, or the file was deleted
+                current = files.get(path)
+                if current is None or modified >= current['modified']:
+                    files[path] = {'path': path, 'pack': index, 'size': size, 'md5': md5, 'mtime': mtime,
+                                   'modified': modified}
+
+    def file_entry(self, path, item):
+        return {
+            'path': path,
+            'id': item['id'],
+            'codec': remote_codec(item),
+            'stored_md5': item.get('md5Checksum'),
+            'stored_size': int(item.get('fileSize') or 0),
+            'md5': remote_md5(item),
+            'size': remote_size(item),
+            'modified': item.get('modifiedDate', ''),
+        }
+
+    def fetch(self, entry, http, out=None):
+        """Download one file's original content into out (or nowhere) and return its MD5
+
+        Checks every checksum the backup recorded on the way: the stored
+        content against Drive's md5Checksum, chunks against their SHA-256
+        and a chunked file against its manifest, and packed files against
+        the MD5 in their pack index (older indexes only have the size).
+        Raises ChecksumMismatch.
+        """
+        digest = hashlib.md5()
+
+        if 'pack' in entry:
+            data = fetch_packed_file(http, entry['pack'], entry['path'])
+            if len(data) != entry['size']:
+                raise ChecksumMismatch(f"{entry['path']}: got {len(data)} bytes from its pack, expected {entry['size']}")
+            digest.update(data)
+            if entry['md5'] and digest.hexdigest() != entry['md5']:
+                raise ChecksumMismatch(f"{entry['path']}: content in its pack doesn't match the index checksum")
+            self.add_bytes(entry, len(data))
+            if out:
+                out.write(data)
+            return digest.hexdigest()
+
+        if entry['codec'] == 'chunks':
+            pieces = download_pieces(http, entry['id'], entry['stored_size'], self.chunk_size)
+            manifest = load_chunk_manifest(b''.join(pieces))
+            for chunk_hash, length in manifest['chunks']:
+                chunk_id = self.chunk_ids.get(chunk_hash)
+                if chunk_id is None:
+                    raise Exception(f"{entry['path']}: chunk {chunk_hash} is missing from the backup")
+                data = b''.join(download_pieces(http, chunk_id, length, self.chunk_size))
+                if hashlib.sha256(data).hexdigest() != chunk_hash:
+                    raise ChecksumMismatch(f"{entry['path']}: chunk {chunk_hash} is corrupt")
+                self.add_bytes(entry, len(data))
+                if out:
+                    out.write(data)
+                digest.update(data)
+            if digest.hexdigest() != manifest['md5']:
+                raise ChecksumMismatch(f"{entry['path']}: MD5 doesn't match its chunk manifest")
+            return digest.hexdigest()
+
+        if entry['codec'] not in ('identity', 'gzip'):
+            raise Exception(f"{entry['path']}: unknown codec {entry['codec']}")
+        stored = hashlib.md5()
+        decompressor = zlib.decompressobj(31) if entry['codec'] == 'gzip' else None  # 31 = gzip container
+        for piece in download_pieces(http, entry['id'], entry['stored_size'], self.chunk_size):
+            stored.update(piece)
+            self.add_bytes(entry, len(piece))
+            for data in inflate(decompressor, piece, self.chunk_size) if decompressor else (piece,):
+                if out:
+                    out.write(data)
+                digest.update(data)
+        if entry['stored_md5'] and stored.hexdigest() != entry['stored_md5']:
+            raise ChecksumMismatch(f"{entry['path']}: MD5 doesn't match Drive's md5Checksum")
+        if decompressor and not decompressor.eof:
+            raise ChecksumMismatch(f"{entry['path']}: compressed content is truncated")
+        return digest.hexdigest()
+
+    def add_bytes(self, entry, count):
+        if self.progress:
+            self.progress.add_bytes(entry['path'], count)
+
+    def transfer_size(self, entry):
+        """Bytes fetch() reports for an entry, for progress totals"""
+        return entry['size'] if 'pack' in entry or entry['codec'] == 'chunks' else entry['stored_size']
+
+    def local_path(self, folder_path, relative_path):
+        """Map a backup path under folder_path, refusing any that would land outside it"""
+        parts = relative_path.split('/')
+        if not all(is_safe_name(part) for part in parts):
+            raise Exception(f"Unsafe path in the backup: {relative_path!r}")
+        return os.path.join(folder_path, *parts)
+
+    def is_restored(self, entry, target):
+        """Check whether target already holds the content of entry"""
+        try:
+            stat = os.stat(target)
+        except OSError:
+            return False
+        if stat.st_size != entry['size']:
+            return False
+        if entry['md5']:
+            return file_md5(target) == entry['md5']
+        # Packed files have no checksum, but get their mtime back when restored
+        return entry.get('mtime') is not None and stat.st_mtime == entry['mtime']
+
+    def restore_file(self, entry, target, http):
+        """Download one file next to its target and move it into place once verified"""
+        fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix='.part',
+                                         dir=os.path.dirname(target))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                md5 = self.fetch(entry, http, f)
+            if entry['md5'] and md5 != entry['md5']:
+                raise ChecksumMismatch(f"{entry['path']}: MD5 doesn't match the backup")
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if entry.get('mtime') is not None:
+            os.utime(target, (entry['mtime'], entry['mtime']))
+
+    def start_restore(self, backup_id, target_path, progress_callback=None):
+        """Restore a backup folder into target_path
+
+        Files already in target_path with the backed up content are left
+        alone, so an interrupted restore picks up where it stopped.
+        Returns (success, message).
+        """
+        progress_callback = self.progress = ProgressTracker.wrap(progress_callback)
+        counts = {'restored': 0, 'skipped': 0, 'failed': 0, 'done': 0}
+        self.last_counts = counts
+        try:
+            # Step 1: List the backup
+            progress_callback(0, "🔎 Listing the backup...")
+            files, folders = self.list_backup(backup_id, progress_callback)
+
+            # Step 2: Recreate the folder layout
+            os.makedirs(target_path, exist_ok=True)
+            for folder in folders:
+                os.makedirs(self.local_path(target_path, folder), exist_ok=True)
+            progress_callback(0.1, f"📁 Created {len(folders)} folders")
+
+            # Step 3: Download the files in parallel
+            entries = list(files.values())
+            total_bytes = sum(self.transfer_size(entry) for entry in entries)
+            progress_callback.set_totals(len(entries), total_bytes)
+            progress_callback.set_span(0.1, 1.0)
+
+            def restore_task(entry, http):
+                target = self.local_path(target_path, entry['path'])
+                if self.is_restored(entry, target):
+                    return 'skipped'
+                self.restore_file(entry, target, http)
+                return 'restored'
+
+            def on_result(entry, success, outcome):
+                counts['done'] += 1
+                if success:
+                    counts[outcome] += 1
+                else:
+                    counts['failed'] += 1
+                    print(f"Failed to restore {entry['path']}: {outcome}")
+                progress_callback.file_done(entry['path'], self.transfer_size(entry))
+                progress = 0.1 + progress_callback.fraction() * 0.9
+                progress_callback(progress, f"⬇️ Restored: {entry['path']} ({counts['done']}/{len(entries)})")
+
+            pool = UploadPool(self.max_workers, order='mixed')
+            pool.run(entries, restore_task, self.backend.new_client, on_result, self.backend.release_client)
+
+            # Step 4: Report
+            progress_callback.flush()
+            progress_callback(1.0, "Restore complete!")
+            message = f"Restored {counts['restored']} files to {target_path}"
+            if counts['skipped']:
+                message += f", {counts['skipped']} already up to date"
+            if counts['failed']:
+                message += f", {counts['failed']} files failed"
+            return True, message
+
+        except Exception as e:
+            return False, f"Restore failed: {str(e)}"
+        finally:
+            self.progress = None
+
+    def start_verify(self, backup_id, folder_path, progress_callback=None, exclusions=None):
+        """Compare a local folder to a backup folder without downloading it
+
+        Local files are hashed and checked against the MD5 the backup
+        recorded; only packed files from indexes that predate per-file
+        checksums are downloaded to compare. Local files the exclusions (ExclusionRules,
+        None for the defaults) skip don't count as missing from the backup.
+        The paths that differ end up in last_report.
+        Returns (success, message).
+        """
+        progress_callback = self.progress = ProgressTracker.wrap(progress_callback)
+        report = {'missing': [], 'changed': [], 'extra': [], 'failed': [], 'matched': 0}
+        self.last_report = report
+        try:
+            # Step 1: List the backup
+            progress_callback(0, "🔎 Listing the backup...")
+            files, _ = self.list_backup(backup_id, progress_callback)
+
+            # Step 2: Find local files the backup doesn't have
+            scanner = FileScanner(folder_path, exclusions)
+            for item in scanner.walk():
+                if item['type'] == 'file' and item['relative_path'] not in files:
+                    report['extra'].append(item['relative_path'])
+            progress_callback(0.1, f"📂 Found {len(report['extra'])} files that aren't in the backup")
+
+            # Step 3: Check the backed up files in parallel
+            entries = list(files.values())
+            progress_callback.set_totals(len(entries), sum(entry['size'] for entry in entries))
+            progress_callback.set_span(0.1, 1.0)
+
+            def verify_task(entry, http):
+                local = self.local_path(folder_path, entry['path'])
+                try:
+                    size = os.path.getsize(local)
+                except OSError:
+                    return 'missing'
+                if size != entry['size']:
+                    return 'changed'
+                expected = entry['md5'] or self.fetch(entry, http)
+                return 'matched' if file_md5(local) == expected else 'changed'
+
+            def on_result(entry, success, outcome):
+                if not success:
+                    report['failed'].append(entry['path'])
+                    print(f"Failed to verify {entry['path']}: {outcome}")
+                elif outcome == 'matched':
+                    report['matched'] += 1
+                else:
+                    report[outcome].append(entry['path'])
+                progress_callback.file_done(entry['path'], entry['size'])
+                progress = 0.1 + progress_callback.fraction() * 0.9
+                progress_callback(progress, f"🔍 Checked: {entry['path']}")
+
+            pool = UploadPool(self.max_workers, order='mixed')
+            pool.run(entries, verify_task, self.backend.new_client, on_result, self.backend.release_client)
+
+            # Step 4: Report
+            for paths in (report['missing'], report['changed'], report['extra'], report['failed']):
+                paths.sort()
+            progress_callback.flush()
+            progress_callback(1.0, "Verification complete!")
+            message = (f"Verified {len(entries)} files: {report['matched']} match, {len(report['changed'])} differ, "
+                       f"{len(report['missing'])} missing locally, {len(report['extra'])} not in the backup")
+            if report['failed']:
+                message += f", {len(report['failed'])} could not be checked"
+            return True, message
+
+        except Exception as e:
+            return False, f"Verification failed: {str(e)}"
+        finally:
+            self.progress = None
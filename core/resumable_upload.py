@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import time
+
+from core.drive_backend import DriveHttpError
+from core.state import get_state_dir
+from core.upload_pool import retry_delay
+
+UPLOAD_URL = 'https://www.googleapis.com/upload/drive/v2/files'
+CHUNK_ALIGN = 256 * 1024  # Drive requires chunks in multiples of 256 KiB
+SESSION_MAX_AGE = 6 * 24 * 3600  # Drive expires resumable sessions after a week
+
+
+def align_chunk_size(chunk_size):
+    """Round a chunk size down to a multiple of 256 KiB (at least one)"""
+    return max(CHUNK_ALIGN, chunk_size - chunk_size % CHUNK_ALIGN)
+
+
+class CheckpointStore:
+    """Keeps the session URI and committed offset of unfinished uploads on disk"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or get_state_dir() / 'uploads'
+        os.makedirs(self.directory, exist_ok=True)
+        self.purge_expired()
+
+    def key(self, file_path, size, mtime, target):
+        """Identify an upload by file, version and destination"""
+        raw = f"{os.path.abspath(file_path)}|{size}|{mtime}|{target}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, checkpoint):
+        # Write then rename so a crash never leaves a half-written checkpoint
+        temp_path = self.path(key) + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.path(key))
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def purge_expired(self):
+        """Drop checkpoints whose sessions Drive has already expired"""
+        cutoff = time.time() - SESSION_MAX_AGE
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class ResumableUpload:
+    """Uploads one file with Drive's resumable protocol, one chunk at a time
+
+    The session URI and last acknowledged offset are checkpointed after every
+    chunk, so a dropped connection or a restarted backup picks up from there.
+    """
+
+    def __init__(self, http, checkpoints, chunk_size=8 * 1024 * 1024, max_retries=5, on_progress=None,
+                 on_retry=None, throttle=None):
+        self.http = http
+        self.checkpoints = checkpoints
+        self.chunk_size = align_chunk_size(chunk_size)
+        self.max_retries = max_retries
+        self.on_progress = on_progress  # on_progress(byte_count) after each acknowledged chunk
+        self.on_retry = on_retry  # on_retry(error) before a failed chunk is retried
+        self.throttle = throttle  # throttle(byte_count) before each chunk is sent, may block
+
+    def upload(self, file_path, metadata, file_id=None):
+        """Upload file_path and return the Drive file resource
+
+        metadata is the Drive v2 file body for a new file; with file_id the
+        existing file is updated in place instead.
+        """
+        stat = os.stat(file_path)
+        size = stat.st_size
+        target = file_id or json.dumps(metadata.get('parents'), sort_keys=True)
+        key = self.checkpoints.key(file_path, size, stat.st_mtime, target)
+
+        with open(file_path, 'rb') as f:
+            def read_at(offset, length):
+                f.seek(offset)
+                return f.read(length)
+
+            return self.upload_chunks(key, read_at, size, metadata, file_id, file_path)
+
+    def upload_stream(self, file_path, stream_factory, metadata, file_id=None):
+        """Upload a stream generated from file_path whose length isn't known up front
+
+        stream_factory() must return an object with a chunks() generator that
+        yields identical bytes every time, so a resumed upload can regenerate
+        it and skip what Drive already has. Returns (file_resource, stream).
+        """
+        stat = os.stat(file_path)
+        target = file_id or json.dumps(metadata.get('parents'), sort_keys=True)
+        key = self.checkpoints.key(file_path, stat.st_size, stat.st_mtime, f"stream:{target}")
+        reader = StreamReader(stream_factory)
+        result = self.upload_chunks(key, reader.read_at, None, metadata, file_id, file_path)
+        return result, reader.stream
+
+    def upload_chunks(self, key, read_at, size, metadata, file_id, file_path):
+        """Run the resumable protocol, reading chunks with read_at(offset, length)
+
+        size may be None for streams; the total is then sent with the last chunk.
+        """
+        checkpoint = self.checkpoints.load(key)
+        session_uri = checkpoint['session_uri'] if checkpoint else None
+        offset = None
+
+        if session_uri:
+            # Ask Drive how much of the previous attempt it kept
+            offset, result = self.query_offset(session_uri, size)
+            if result is not None:
+                self.checkpoints.remove(key)
+                return result
+            if offset is None:
+                session_uri = None  # Session expired, start over
+
+        if not session_uri:
+            session_uri = self.start_session(metadata, size, file_id)
+            offset = 0
+            self.checkpoints.save(key, {'session_uri': session_uri, 'offset': 0, 'file_path': file_path})
+
+        retries = 0
+        while True:
+            chunk = read_at(offset, self.chunk_size)
+            # A short read from a stream is its last chunk, which fixes the total
+            total = size if size is not None else (offset + len(chunk) if len(chunk) < self.chunk_size else None)
+            if self.throttle:
+                self.throttle(len(chunk))
+            try:
+                new_offset, result = self.send_chunk(session_uri, chunk, offset, total)
+            except DriveHttpError as e:
+                if e.status < 500 and e.status != 429:
+                    if e.status in (404, 410):
+                        self.checkpoints.remove(key)
+                    raise
+                new_offset, result = None, None
+                error = e
+            except (OSError, ConnectionError) as e:
+                # httplib2 surfaces dropped connections as socket errors
+                new_offset, result = None, None
+                error = e
+
+            if result is not None:
+                self.checkpoints.remove(key)
+                return result
+
+            if new_offset is None:
+                retries += 1
+                if retries > self.max_retries:
+                    raise error
+                if self.on_retry:
+                    self.on_retry(error)
+                time.sleep(retry_delay(retries))
+                # Find out what actually made it before retrying
+                try:
+                    new_offset, result = self.query_offset(session_uri, size)
+                except (DriveHttpError, OSError, ConnectionError):
+                    continue
+                if result is not None:
+                    self.checkpoints.remove(key)
+                    return result
+                if new_offset is None:
+                    self.checkpoints.remove(key)
+                    raise error
+            else:
+                retries = 0
+
+            if self.on_progress and new_offset > offset:
+                self.on_progress(new_offset - offset)
+            offset = new_offset
+            self.checkpoints.save(key, {'session_uri': session_uri, 'offset': offset, 'file_path': file_path})
+
+    def start_session(self, metadata, size, file_id=None):
+        """Open an upload session and return its URI"""
+        if file_id:
+            url, method = f"{UPLOAD_URL}/{file_id}?uploadType=resumable", 'PUT'
+        else:
+            url, method = f"{UPLOAD_URL}?uploadType=resumable", 'POST'
+
+        headers = {
+            'Content-Type': 'application/json; charset=UTF-8',
+            'X-Upload-Content-Type': metadata.get('mimeType', 'application/octet-stream'),
+        }
+        if size is not None:
+            headers['X-Upload-Content-Length'] = str(size)
+        resp, content = self.http.request(url, method, body=json.dumps(metadata), headers=headers)
+        if resp.status != 200 or 'location' not in resp:
+            raise DriveHttpError(resp.status, content)
+        return resp['location']
+
+    def send_chunk(self, session_uri, chunk, offset, total):
+        """Send one chunk; returns (next_offset, None) or (None, file_resource) when done
+
+        total is None while a stream's length is still unknown.
+        """
+        total_text = '*' if total is None else str(total)
+        headers = {'Content-Length': str(len(chunk))}
+        if chunk:
+            headers['Content-Range'] = f"bytes {offset}-{offset + len(chunk) - 1}/{total_text}"
+        else:
+            headers['Content-Range'] = f"bytes */{total_text}"
+
+        resp, content = self.http.request(session_uri, 'PUT', body=chunk, headers=headers)
+        return self.parse_response(resp, content)
+
+    def query_offset(self, session_uri, size):
+        """Get the committed offset of a session, (None, None) if it expired"""
+        total_text = '*' if size is None else str(size)
+        headers = {'Content-Length': '0', 'Content-Range': f"bytes */{total_text}"}
+        resp, content = self.http.request(session_uri, 'PUT', body=b'', headers=headers)
+        if resp.status in (404, 410):
+            return None, None
+        return self.parse_response(resp, content)
+
+    def parse_response(self, resp, content):
+        if resp.status in (200, 201):
+            return None, json.loads(content)
+        if resp.status == 308:
+            # Range is inclusive ("bytes=0-1048575"); no Range means nothing kept
+            committed = resp.get('range')
+            if not committed:
+                return 0, None
+            return int(committed.rsplit('-', 1)[1]) + 1, None
+        raise DriveHttpError(resp.status, content)
+
+
+class StreamReader:
+    """Random-ish access over a regenerable stream
+
+    Reads normally move forward; seeking backwards (after a failed chunk)
+    regenerates the stream and skips up to the requested offset.
+    """
+
+    def __init__(self, stream_factory):
+        self.stream_factory = stream_factory
+        self.stream = None
+        self.pieces = None
+        self.position = 0
+        self.buffer = b''
+
+    def restart(self):
+        self.stream = self.stream_factory()
+        self.pieces = self.stream.chunks()
+        self.position = 0
+        self.buffer = b''
+
+    def read_at(self, offset, length):
+        if self.pieces is None or offset < self.position:
+            self.restart()
+        # Drop everything before offset, then fill up to length
+        while self.position + len(self.buffer) < offset + length:
+            piece = next(self.pieces, None)
+            if piece is None:
+                break
+            self.buffer += piece
+        skip = offset - self.position
+        if skip > 0:
+            self.buffer = self.buffer[skip:]
+            self.position = offset
+        return self.buffer[:length]
@@ -0,0 +1,109 @@
+import json
+import os
+import time
+
+from core.sqlite_store import SQLiteStore
+from core.state import state_path
+
+FULL_SCAN_INTERVAL = 24 * 3600  # Seconds a cache is trusted before the next scan starts over
+RACY_WINDOW_NS = 2 * 10 ** 9  # Folders changed this close to a scan are listed again next time (FAT has 2s mtimes)
+
+
+class ScanCache(SQLiteStore):
+    """Per-folder listings of a source tree, kept between scans
+
+    Each folder is stored with the mtime and inode it had when it was
+    listed, its subfolder names and the name, size and mtime of each of
+    its files, plus their count and total size. Adding, removing or
+    renaming an entry bumps a folder's mtime, so a folder whose mtime and
+    inode still match can be reused without listing it or stat'ing its
+    files. Files edited in place don't touch their folder, which is why
+    the whole cache is dropped after max_age seconds and when the source
+    root itself was replaced. With full_scan=True it is dropped right
+    away, so the walk lists everything and refills it. Folders lost to a
+    crash before their batch was committed are just listed again.
+    """
+
+    def __init__(self, source_folder, db_path=None, max_age=FULL_SCAN_INTERVAL, full_scan=False):
+        self.source_folder = os.path.abspath(source_folder)
+        self.max_age = max_age
+        self.full_scan = full_scan
+        self.hits = 0
+        self.misses = 0
+        super().__init__(db_path or state_path('scan', source_folder, '.sqlite'), """
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                files INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                listing TEXT NOT NULL
+            );
+        """)
+
+    def validate(self):
+        """Drop the cache if the source root was replaced, it is due for a full scan or full_scan is set
+
+        Returns True if the cache was kept.
+        """
+        try:
+            stat = os.stat(self.source_folder)
+            root = f"{self.source_folder}:{stat.st_dev}:{stat.st_ino}"
+        except OSError:
+            root = None
+        with self.lock:
+            rows = dict(self.conn.execute("SELECT key, value FROM meta"))
+            started_at = float(rows.get('full_scan_at') or 0)
+            if root and rows.get('root') == root and time.time() - started_at < self.max_age and not self.full_scan:
+                return True
+            self.conn.execute("DELETE FROM folders")
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('root', ?)", (root,))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('full_scan_at', ?)",
+                              (str(time.time()),))
+            self.conn.commit()
+            return False
+
+    def get(self, path, stat):
+        """Get (subfolder names, [[name, size, mtime], ...]) of a folder if stat shows it unchanged"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT mtime_ns, inode, listing FROM folders WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None or row[0] != stat.st_mtime_ns or row[1] != stat.st_ino:
+            self.misses += 1
+            return None
+        self.hits += 1
+        listing = json.loads(row[2])
+        return listing['dirs'], listing['files']
+
+    def put(self, path, stat, dirs, files, scan_started_ns):
+        """Remember a folder listed from disk, unless it changed too close to the scan to be trusted"""
+        if stat.st_mtime_ns >= scan_started_ns - RACY_WINDOW_NS:
+            with self.lock:
+                self.conn.execute("DELETE FROM folders WHERE path = ?", (path,))
+            return
+        listing = json.dumps({'dirs': dirs, 'files': files}, separators=(',', ':'))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO folders (path, mtime_ns, inode, files, bytes, listing) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, stat.st_mtime_ns, stat.st_ino, len(files), sum(entry[1] for entry in files), listing)
+            )
+            self._maybe_commit()
+
+    def prune(self, seen_paths):
+        """Forget folders a complete walk of the tree no longer found"""
+        with self.lock:
+            stale = [path for (path,) in self.conn.execute("SELECT path FROM folders") if path not in seen_paths]
+            self.conn.executemany("DELETE FROM folders WHERE path = ?", ((path,) for path in stale))
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def totals(self):
+        """Get (files, bytes) of every cached folder, before exclusions"""
+        with self.lock:
+            files, total_bytes = self.conn.execute("SELECT SUM(files), SUM(bytes) FROM folders").fetchone()
+        return files or 0, total_bytes or 0
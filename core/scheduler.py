@@ -0,0 +1,153 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+# 'walk' keeps the order tasks arrive in; the others reorder within a lookahead window
+UPLOAD_ORDERS = ('mixed', 'small-first', 'large-first', 'walk')
+
+
+def task_size(task):
+    """Bytes a task will upload; folders, trash and other tasks count as 0"""
+    return task.get('size', 0) if isinstance(task, dict) else 0
+
+
+class UploadScheduler:
+    """Decides which queued upload task each free worker takes next
+
+    A feeder thread pulls tasks from the source into a lookahead window of
+    at most `window` tasks, so a streaming walk stays bounded in memory.
+    Workers then take from the window by policy:
+
+    - walk: the order tasks arrive in
+    - small-first / large-first: smallest / largest task in the window
+    - mixed: files of large_threshold bytes and up go to a large lane that
+      at most large_slots workers serve at a time, while the rest keep the
+      small lane moving. A worker that finds no small file queued helps
+      out with the large lane rather than sitting idle.
+
+    A task waiting to be retried is deferred rather than slept on, so the
+    worker takes other tasks meanwhile; once its delay is up it goes ahead
+    of the window.
+    """
+
+    def __init__(self, policy='mixed', large_threshold=32 * 1024 * 1024, large_slots=1, window=1000):
+        if policy not in UPLOAD_ORDERS:
+            raise ValueError(f"Unknown upload order: {policy}")
+        self.policy = policy
+        self.large_threshold = large_threshold
+        self.large_slots = max(1, large_slots)
+        self.window = window
+        self.condition = threading.Condition()
+        self.small = collections.deque()  # Mixed lanes, in arrival order; walk only uses this one
+        self.large = collections.deque()
+        self.deferred = []  # (ready at, arrival, task) of tasks waiting to be retried
+        self.heap = []  # (sort key, arrival, task) for small-first / large-first
+        self.arrivals = itertools.count()
+        self.buffered = 0
+        self.large_in_flight = 0
+        self.source_done = False
+        self.source_error = None
+        self.closed = False
+
+    def start(self, tasks):
+        """Start pulling from the tasks iterable in the background; once per scheduler"""
+        feeder = threading.Thread(target=self.feed, args=(iter(tasks),), daemon=True)
+        feeder.start()
+
+    def feed(self, task_iter):
+        try:
+            while True:
+                with self.condition:
+                    while self.buffered >= self.window and not self.closed:
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                # Outside the lock: the source may block, e.g. on a walk or on folder creation
+                task = next(task_iter, None)
+                if task is None:
+                    break
+                self.put(task)
+        except Exception as e:
+            with self.condition:
+                self.source_error = e
+        with self.condition:
+            self.source_done = True
+            self.condition.notify_all()
+
+    def put(self, task):
+        size = task_size(task)
+        with self.condition:
+            if self.policy == 'walk':
+                self.small.append(task)
+            elif self.policy == 'mixed':
+                (self.large if size >= self.large_threshold else self.small).append(task)
+            else:
+                key = size if self.policy == 'small-first' else -size
+                heapq.heappush(self.heap, (key, next(self.arrivals), task))
+            self.buffered += 1
+            self.condition.notify_all()
+
+    def next_task(self):
+        """Block until a task is available; None once the source is drained and no retry is pending
+
+        Raises the source's error, if it failed, once everything before it
+        was handed out. Also None once the scheduler is closed.
+        """
+        with self.condition:
+            while True:
+                if self.closed:
+                    return None
+                now = time.monotonic()
+                if self.deferred and self.deferred[0][0] <= now:
+                    task = heapq.heappop(self.deferred)[2]
+                    if self.is_large(task):
+                        self.large_in_flight += 1
+                    return task
+                task = self.pop() if self.buffered else None
+                if task is not None:
+                    self.buffered -= 1
+                    self.condition.notify_all()
+                    return task
+                if self.source_done and not self.deferred:
+                    if self.source_error is not None:
+                        error, self.source_error = self.source_error, None
+                        raise error
+                    return None
+                self.condition.wait(self.deferred[0][0] - now if self.deferred else None)
+
+    def defer(self, task, delay):
+        """Hand a task out again once delay seconds have passed"""
+        with self.condition:
+            heapq.heappush(self.deferred, (time.monotonic() + delay, next(self.arrivals), task))
+            self.condition.notify_all()
+
+    def is_large(self, task):
+        return self.policy == 'mixed' and task_size(task) >= self.large_threshold
+
+    def pop(self):
+        """Take the next task by policy, or None if this worker should wait"""
+        if self.policy == 'walk':
+            return self.small.popleft()
+        if self.policy != 'mixed':
+            return heapq.heappop(self.heap)[2]
+        if self.large and (self.large_in_flight < self.large_slots or not self.small):
+            self.large_in_flight += 1
+            return self.large.popleft()
+        if self.small:
+            return self.small.popleft()
+        return None
+
+    def task_done(self, task):
+        """Free the lane slot of a task that was handed out, whether it finished or was deferred"""
+        if self.is_large(task):
+            with self.condition:
+                self.large_in_flight -= 1
+                self.condition.notify_all()
+
+    def close(self):
+        """Stop the feeder, e.g. when the workers stopped early"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
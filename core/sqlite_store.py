@@ -0,0 +1,40 @@
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """A SQLite file shared by worker threads, with batched commits
+
+    Writers hold self.lock and call _maybe_commit() after each row, so a
+    run commits every COMMIT_EVERY rows instead of once per row. A crash
+    only loses the uncommitted tail, which the owner must be able to
+    rebuild.
+    """
+
+    COMMIT_EVERY = 500
+
+    def __init__(self, db_path, schema):
+        self.db_path = str(db_path)
+        self.lock = threading.Lock()
+        self.pending_writes = 0
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(schema)
+        self.conn.commit()
+
+    def _maybe_commit(self):
+        self.pending_writes += 1
+        if self.pending_writes >= self.COMMIT_EVERY:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,24 @@
+import hashlib
+import os
+from pathlib import Path
+
+# Local state (indexes, checkpoints, journals) lives outside the source tree
+STATE_DIR_ENV = 'DRIVE_BACKUP_STATE_DIR'
+
+
+def get_state_dir():
+    """Get the directory for local backup state, creating it if needed"""
+    state_dir = Path(os.environ.get(STATE_DIR_ENV) or Path.home() / '.drive_backup')
+    state_dir.mkdir(parents=True, exist_ok=True)
+    return state_dir
+
+
+def source_key(source_folder):
+    """Get a short stable key identifying a source folder"""
+    absolute = os.path.normcase(os.path.abspath(source_folder))
+    return hashlib.sha1(absolute.encode('utf-8')).hexdigest()[:16]
+
+
+def state_path(prefix, source_folder, suffix):
+    """Get the path of a per-source state file"""
+    return get_state_dir() / f"{prefix}_{source_key(source_folder)}{suffix}"
@@ -0,0 +1,271 @@
+import errno
+import http.client
+import random
+import socket
+import threading
+import time
+
+from core.scheduler import UploadScheduler
+
+# Drive reports throttling as 429, or 403 with one of these reasons
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'sharingRateLimitExceeded')
+
+# Tries per task, by error class, before it counts as failed; throttling is
+# retried separately, with the pool's adaptive backoff
+RETRY_ATTEMPTS = {'server': 5, 'network': 5, 'auth': 2, 'unknown': 2, 'local': 1, 'client': 1}
+RETRY_BASE_DELAY = 1.0  # Seconds; doubles with each attempt, with full jitter
+RETRY_MAX_DELAY = 30.0
+THROTTLE_MAX_DELAY = 64.0  # Drive asks for up to a minute of backoff when rate limiting
+NETWORK_ERRNOS = (errno.ECONNRESET, errno.ECONNABORTED, errno.ECONNREFUSED, errno.ETIMEDOUT, errno.EPIPE,
+                  errno.ENETUNREACH, errno.EHOSTUNREACH, errno.ENETDOWN)
+
+
+def get_error_status(error):
+    """Get the HTTP status of a Drive API error, or None if it has none"""
+    # googleapiclient HttpError
+    resp = getattr(error, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None):
+        return int(resp.status)
+    # pydrive2 ApiRequestError keeps the decoded error body
+    details = getattr(error, 'error', None)
+    if isinstance(details, dict) and details.get('code'):
+        return int(details['code'])
+    return None
+
+
+def is_rate_limit_error(error):
+    """Check whether a Drive error means we are being throttled"""
+    status = get_error_status(error)
+    if status == 429:
+        return True
+    text = str(error)
+    if status in (403, None):
+        return any(reason in text for reason in RATE_LIMIT_REASONS)
+    return False
+
+
+def classify_error(error):
+    """Sort an upload error into a class that decides how it is retried
+
+    'throttled' (rate limits), 'server' (5xx), 'network' (timeouts, dropped
+    connections), 'auth' (401), 'client' (other 4xx, retrying won't help),
+    'local' (the file couldn't be read) or 'unknown'.
+    """
+    if is_rate_limit_error(error):
+        return 'throttled'
+    status = get_error_status(error)
+    if status is not None:
+        if status >= 500:
+            return 'server'
+        if status == 401:
+            return 'auth'
+        if status == 408:
+            return 'network'
+        return 'client'
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout, http.client.HTTPException)):
+        return 'network'
+    # httplib2's errors (server not found, redirects, ...) don't share a base with the above
+    if type(error).__module__.startswith('httplib2'):
+        return 'network'
+    if isinstance(error, OSError):
+        return 'network' if error.errno in NETWORK_ERRNOS else 'local'
+    return 'unknown'
+
+
+def retry_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter before retry number `attempt`
+
+    The one backoff every retry loop uses, so workers never retry in lockstep.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class TaskFailure:
+    """Outcome of a task that failed for good; str() gives the error message"""
+
+    def __init__(self, error, error_class, attempts):
+        self.message = str(error)
+        self.error_class = error_class
+        self.attempts = attempts
+
+    def __str__(self):
+        return self.message
+
+
+def call_with_backoff(func, max_attempts=5, on_retry=None):
+    """Call func(), retrying rate limit, server and network errors with jittered exponential backoff"""
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            attempt += 1
+            retryable = classify_error(e) in ('throttled', 'server', 'network')
+            if attempt >= max_attempts or not retryable:
+                raise
+            if on_retry:
+                on_retry(e)
+            time.sleep(retry_delay(attempt))
+
+
+class AdaptiveLimiter:
+    """Bounds in-flight uploads; halves the limit when throttled, grows it back when healthy
+
+    Like TCP's congestion window: the limit is halved at most once per
+    `limit` finished requests, so a burst of throttled requests that were
+    already in flight counts as one signal rather than collapsing it to
+    1, and grows by one after `limit` successes in a row. Only successes
+    grow it.
+    """
+
+    def __init__(self, max_limit):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self.successes = 0
+        self.since_decrease = 0  # Requests finished since the limit was last halved
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, outcome='success'):
+        """Release a slot; outcome is 'success', 'throttled' or 'failed' (which neither grows nor shrinks it)"""
+        with self.condition:
+            self.in_flight -= 1
+            self.since_decrease += 1
+            if outcome == 'throttled':
+                self.successes = 0
+                if self.since_decrease >= self.limit:
+                    self.limit = max(1, self.limit // 2)
+                    self.since_decrease = 0
+            elif outcome == 'success':
+                self.successes += 1
+                if self.successes >= self.limit:
+                    self.successes = 0
+                    if self.limit < self.max_limit:
+                        self.limit += 1
+            self.condition.notify_all()
+
+
+class UploadPool:
+    """Drains an iterable of upload tasks with a pool of worker threads
+
+    Each worker gets its own client from client_factory, because the
+    httplib2 connection behind a Drive client is not thread-safe. Failed
+    tasks are retried by error class (see classify_error), all with
+    retry_delay's backoff: throttling up to max_throttle_retries times
+    while the adaptive limiter cuts concurrency, other transient errors
+    up to retry_attempts times. A task waiting out its backoff is handed
+    back to the scheduler, so its worker moves on to other tasks.
+    """
+
+    def __init__(self, max_workers=4, max_throttle_retries=8, on_retry=None, order='walk',
+                 large_threshold=32 * 1024 * 1024, retry_attempts=None, retry_base_delay=RETRY_BASE_DELAY):
+        self.max_workers = max(1, max_workers)
+        self.max_throttle_retries = max_throttle_retries
+        self.retry_attempts = dict(RETRY_ATTEMPTS, **(retry_attempts or {}))
+        self.retry_base_delay = retry_base_delay
+        self.on_retry = on_retry  # on_retry(error) before each failed task is retried
+        self.order = order  # One of scheduler.UPLOAD_ORDERS
+        self.large_threshold = large_threshold  # Where the 'mixed' order's large lane starts
+        self.limiter = AdaptiveLimiter(self.max_workers)
+
+    def run(self, tasks, upload_func, client_factory, result_callback, client_release=None):
+        """Run upload_func(task, client) for every task
+
+        result_callback(task, success, result_or_failure) is called once per
+        task, serialized under a lock so callers can keep plain counters;
+        a failure is a TaskFailure.
+        Each worker's client is passed to client_release, if given, when
+        the worker is done with it.
+        """
+        result_lock = threading.Lock()
+        errors = []
+        retries = {}  # id(task) -> [attempts, throttled attempts] of tasks waiting to be retried
+
+        # A quarter of the workers for big files leaves the rest for the small ones
+        scheduler = UploadScheduler(self.order, self.large_threshold, max(1, self.max_workers // 4))
+        scheduler.start(tasks)
+
+        def worker():
+            try:
+                client = client_factory()
+            except Exception as e:
+                errors.append(e)
+                return
+
+            try:
+                while True:
+                    try:
+                        task = scheduler.next_task()
+                    except Exception as e:
+                        errors.append(e)
+                        return
+                    if task is None:
+                        return
+
+                    with result_lock:
+                        attempts = retries.pop(id(task), [0, 0])
+                    success, outcome, delay = self.attempt(task, upload_func, client, attempts)
+                    scheduler.task_done(task)
+                    if delay is not None:
+                        with result_lock:
+                            retries[id(task)] = attempts
+                        scheduler.defer(task, delay)
+                        continue
+                    with result_lock:
+                        try:
+                            result_callback(task, success, outcome)
+                        except Exception as e:
+                            # Stop the other workers too; run() raises it
+                            errors.append(e)
+                            scheduler.close()
+                            return
+            finally:
+                if client_release:
+                    client_release(client)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.max_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        scheduler.close()
+
+        if errors:
+            raise errors[0]
+
+    def attempt(self, task, upload_func, client, attempts):
+        """Try one task once
+
+        attempts is the task's [attempts, throttled attempts] so far, updated
+        in place. Returns (success, result or TaskFailure, delay); a delay
+        that isn't None means the task should be retried after that long.
+        """
+        self.limiter.acquire()
+        try:
+            result = upload_func(task, client)
+        except Exception as e:
+            error_class = classify_error(e)
+            attempts[0] += 1
+            if error_class == 'throttled':
+                self.limiter.release('throttled')
+                attempts[1] += 1
+                retry = attempts[1] <= self.max_throttle_retries
+                delay = retry_delay(attempts[1], self.retry_base_delay, THROTTLE_MAX_DELAY)
+            else:
+                self.limiter.release('failed')
+                retry = attempts[0] - attempts[1] < self.retry_attempts.get(error_class, 1)
+                delay = retry_delay(attempts[0] - attempts[1], self.retry_base_delay)
+            if not retry:
+                return False, TaskFailure(e, error_class, attempts[0]), None
+            if self.on_retry:
+                self.on_retry(e)
+            return False, None, delay
+
+        self.limiter.release()
+        return True, result, None
@@ -0,0 +1,339 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from core.exclusions import ExclusionRules
+from core.state import get_state_dir
+
+# inotify event bits (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONTFOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONTFOLLOW | IN_EXCL_UNLINK)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+READ_SIZE = 64 * 1024
+
+
+class Inotify:
+    """Minimal ctypes binding of the Linux inotify API"""
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.libc.inotify_init1.argtypes = [ctypes.c_int]
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            self.raise_errno("inotify_init1")
+
+    def raise_errno(self, call, path=None):
+        code = ctypes.get_errno()
+        raise OSError(code, f"{call}: {os.strerror(code)}", path)
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        """Watch a folder; re-adding an already watched folder returns its existing descriptor"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self.raise_errno("inotify_add_watch", path)
+        return wd
+
+    def rm_watch(self, wd):
+        # Fails if the folder is already gone, which removed the watch anyway
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """Wait up to timeout seconds and get the pending (wd, mask, cookie, name) events"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            pos += EVENT_HEADER.size
+            name = data[pos:pos + length].rstrip(b'\0')
+            pos += length
+            events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def parent_paths(path):
+    """Yield the relative folders above a relative path, ending with the root ''"""
+    while path:
+        path = path.rpartition('/')[0]
+        yield path
+
+
+def collapse_paths(paths):
+    """Drop paths that are inside another path of the list; '' covers everything"""
+    kept = set()
+    for path in sorted(set(paths), key=lambda path: path.count('/') if path else -1):
+        if not any(parent in kept for parent in parent_paths(path)):
+            kept.add(path)
+    return sorted(kept)
+
+
+class TreeWatcher:
+    """Collects the relative paths that changed under a source folder
+
+    Every folder gets an inotify watch; folders that appear later are
+    watched as they show up and reported whole, since files may land in
+    them before their watch exists. When the watch limit is reached
+    (ENOSPC), the folders left without a watch are rescanned whole every
+    rescan_interval seconds instead, as is the entire tree where inotify
+    isn't available. If the kernel drops events, the whole tree is
+    reported.
+
+    A path is ready once it had no events for `debounce` seconds, or has
+    been changing for max_delay seconds, so a burst of writes to the same
+    file turns into one upload. Folders the exclusion rules prune don't
+    get watches at all.
+    """
+
+    def __init__(self, root, debounce=2.0, max_delay=60.0, rescan_interval=600.0, ignored=(), rules=None):
+        self.root = os.path.abspath(root)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.rescan_interval = rescan_interval
+        self.ignored = tuple(ignored)  # Relative paths never reported, e.g. a state folder inside the source
+        self.rules = rules  # ExclusionRules, if any
+        self.inotify = None
+        self.watches = {}  # Watch descriptor -> relative folder
+        self.unwatched = {}  # Relative folder without watches -> when it was last rescanned
+        self.changed = {}  # Relative path -> (first event time, last event time)
+        self.warned = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        try:
+            self.inotify = Inotify()
+        except OSError as e:
+            print(f"⚠️ File watching unavailable ({e}); rescanning every {self.rescan_interval:.0f}s instead")
+            self.unwatched[''] = time.monotonic()
+            return
+        self.watch_tree('')
+
+    def stop(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    def absolute(self, path):
+        return os.path.join(self.root, *path.split('/')) if path else self.root
+
+    def is_ignored(self, path):
+        return any(path == ignored or path.startswith(f"{ignored}/") for ignored in self.ignored)
+
+    def is_excluded_folder(self, folder):
+        if not self.rules or not folder:
+            return False
+        return self.rules.prepare(self.root, folder) or self.rules.excludes_folder(folder)
+
+    def watch_tree(self, folder):
+        """Add watches to a folder and every folder below it"""
+        pending = [folder]
+        while pending:
+            folder = pending.pop()
+            if self.is_ignored(folder) or self.is_excluded_folder(folder):
+                continue
+            try:
+                wd = self.inotify.add_watch(self.absolute(folder))
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    self.fall_back(folder)
+                # Otherwise it's gone or unreadable; the scan reports that
+                continue
+            self.watches[wd] = folder
+            try:
+                with os.scandir(self.absolute(folder)) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(f"{folder}/{entry.name}" if folder else entry.name)
+            except OSError:
+                pass
+
+    def unwatch_tree(self, folder):
+        """Drop the watches of a folder that was deleted or moved away, and of everything below it"""
+        prefix = f"{folder}/"
+        for wd, path in list(self.watches.items()):
+            if path == folder or path.startswith(prefix):
+                del self.watches[wd]
+                self.inotify.rm_watch(wd)
+        for path in list(self.unwatched):
+            if path == folder or path.startswith(prefix):
+                del self.unwatched[path]
+
+    def fall_back(self, folder):
+        """Rescan a folder periodically because it couldn't get a watch"""
+        if not self.warned:
+            self.warned = True
+            print("⚠️ Out of inotify watches (see fs.inotify.max_user_watches); "
+                  f"rescanning the rest every {self.rescan_interval:.0f}s")
+        self.unwatched[folder] = time.monotonic()
+
+    def poll(self, timeout=1.0):
+        """Wait up to timeout seconds for file system events and record them"""
+        if self.inotify is None:
+            time.sleep(timeout)
+            return
+        for event in self.inotify.read_events(timeout):
+            self.handle(*event)
+
+    def handle(self, wd, mask, cookie, name):
+        if mask & IN_Q_OVERFLOW:
+            # The kernel dropped events; only a full rescan can tell what changed
+            self.mark('')
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        folder = self.watches.get(wd)
+        if folder is None:
+            return
+        path = f"{folder}/{name}" if folder and name else (name or folder)
+        if self.is_ignored(path):
+            return
+        if mask & IN_ISDIR:
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self.unwatch_tree(path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self.watch_tree(path)
+        self.mark(path)
+
+    def mark(self, path):
+        """Record a change to a relative path; a folder means its whole subtree"""
+        now = time.monotonic()
+        with self.lock:
+            first, _ = self.changed.get(path, (now, now))
+            self.changed[path] = (first, now)
+
+    def take_ready(self):
+        """Get the changed paths that have settled, and the unwatched folders due for a rescan"""
+        now = time.monotonic()
+        with self.lock:
+            ready = [
+                path for path, (first, last) in self.changed.items()
+                if now - last >= self.debounce or now - first >= self.max_delay
+            ]
+            for path in ready:
+                del self.changed[path]
+        for folder, last_scan in list(self.unwatched.items()):
+            if now - last_scan < self.rescan_interval:
+                continue
+            ready.append(folder)
+            if self.inotify is None:
+                self.unwatched[folder] = now
+            else:
+                # Watches may have been freed since; whatever still doesn't fit falls back again
+                del self.unwatched[folder]
+                self.watch_tree(folder)
+        return collapse_paths(ready)
+
+
+class BackupDaemon:
+    """Keeps a backup up to date by backing up what a TreeWatcher reports
+
+    The first run is a normal incremental backup, which reconciles the
+    backup with the local index, so after a restart only what changed
+    while the daemon was down gets uploaded. After that each batch of
+    settled changes is backed up with changed_paths, so only those paths
+    are rescanned. A batch that failed, in whole or in part, is retried
+    after retry_delay seconds.
+    """
+
+    def __init__(self, engine, folder_path, backup_name, watcher=None, debounce=2.0, retry_delay=60.0,
+                 on_result=None, **backup_options):
+        self.engine = engine
+        self.folder_path = folder_path
+        self.backup_name = backup_name
+        # The same rules for the watches and every scan, so pruned folders cost nothing
+        if backup_options.get('exclusions') is None:
+            backup_options['exclusions'] = ExclusionRules.load()
+        self.backup_options = backup_options  # Passed on to start_backup
+        self.watcher = watcher or TreeWatcher(
+            folder_path, debounce, ignored=self.own_paths(), rules=backup_options['exclusions']
+        )
+        self.retry_delay = retry_delay
+        self.on_result = on_result or self.print_result
+        self.retry_paths = set()
+        self.retry_at = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        """Back up changes until stop() is called"""
+        # Watch first, so nothing that changes during the first run is missed
+        self.watcher.start()
+        try:
+            self.backup(None)
+            while not self.stopped.is_set():
+                self.watcher.poll(1.0)
+                paths = self.watcher.take_ready()
+                if self.retry_at is not None and time.monotonic() >= self.retry_at:
+                    paths = collapse_paths(paths + list(self.retry_paths))
+                    self.retry_paths = set()
+                    self.retry_at = None
+                if paths:
+                    self.backup(paths)
+        finally:
+            self.watcher.stop()
+
+    def stop(self):
+        self.stopped.set()
+
+    def own_paths(self):
+        """Get the relative path of the state folder if it is inside the source, so our writes aren't backed up"""
+        state_dir = os.path.relpath(os.path.realpath(get_state_dir()), os.path.realpath(self.folder_path))
+        if state_dir == os.curdir or state_dir.startswith(os.pardir):
+            return ()
+        return (state_dir.replace(os.sep, '/'),)
+
+    def backup(self, changed_paths):
+        if not os.path.isdir(self.folder_path):
+            # Unmounted or moved: don't take the missing files for deleted ones
+            self.retry_paths.update(changed_paths if changed_paths is not None else [''])
+            self.retry_at = time.monotonic() + self.retry_delay
+            self.on_result(False, f"Source folder not found: {self.folder_path}", changed_paths)
+            return
+        success, message = self.engine.start_backup(
+            self.folder_path, None, self.backup_name, incremental=True, changed_paths=changed_paths,
+            **self.backup_options
+        )
+        if not success or self.engine.last_counts.get('failed'):
+            # Failed files weren't recorded in the index, so rescanning their paths finds them again
+            self.retry_paths.update(changed_paths if changed_paths is not None else [''])
+            self.retry_at = time.monotonic() + self.retry_delay
+        self.on_result(success, message, changed_paths)
+
+    def print_result(self, success, message, changed_paths):
+        timestamp = time.strftime("%H:%M:%S")
+        scope = "full check" if changed_paths is None else f"{len(changed_paths)} changed paths"
+        print(f"[{timestamp}] {'✅' if success else '❌'} ({scope}) {message}", flush=True)
@@ -1,5 +1,11 @@
-from ui import MainWindow
+import sys
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Any arguments mean a headless run; the GUI stack is never imported
+        from cli import main
+        sys.exit(main())
+    
+    from ui import MainWindow
     app = MainWindow()
-    app.run()
\ No newline at end of file
+    app.run()
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.fake_drive import FakeDrive  # noqa: E402
+from core.folder_tree import FOLDER_MIME_TYPE  # noqa: E402
+from core.state import STATE_DIR_ENV  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    """Keep indexes, caches and journals of every test in its own folder"""
+    path = tmp_path / 'state'
+    monkeypatch.setenv(STATE_DIR_ENV, str(path))
+    return path
+
+
+@pytest.fixture
+def drive(tmp_path):
+    return FakeDrive(str(tmp_path / 'drive'))
+
+
+def write_tree(root, files):
+    """Create {relative path: text} under root"""
+    for relative_path, text in files.items():
+        path = os.path.join(root, *relative_path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+def drive_paths(drive, root_id):
+    """Map relative path -> item for every untrashed file under a Drive folder"""
+    paths = {root_id: ''}
+    files = {}
+    pending = [root_id]
+    while pending:
+        parent_id = pending.pop()
+        for item in drive.files.values():
+            if parent_id in item['parents'] and not item.get('trashed'):
+                path = f"{paths[parent_id]}/{item['title']}" if paths[parent_id] else item['title']
+                if item['mimeType'] == FOLDER_MIME_TYPE:
+                    paths[item['id']] = path
+                    pending.append(item['id'])
+                else:
+                    files[path] = item
+    return files
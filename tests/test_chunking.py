@@ -0,0 +1,58 @@
+import hashlib
+import random
+
+import pytest
+
+from core import chunking
+from core.chunking import ContentChunker, cut_finder, find_cut
+from core.hashing import file_md5
+
+MIN_SIZE, MAX_SIZE, AVG_BITS = 1024, 16 * 1024, 11
+CUT_MASK = ((1 << AVG_BITS) - 1) << (64 - AVG_BITS)
+
+
+def sequential_cuts(data):
+    cuts = []
+    pos = 0
+    while pos < len(data):
+        pos = find_cut(data, pos, MIN_SIZE, MAX_SIZE, CUT_MASK)
+        cuts.append(pos)
+    return cuts
+
+
+def sample(size, seed=7):
+    rng = random.Random(seed)
+    # Random bytes with long runs, so both hash cuts and max_size cuts happen
+    data = bytearray(rng.randbytes(size))
+    data[size // 3:size // 3 + 5 * MAX_SIZE] = bytes(5 * MAX_SIZE)
+    return bytes(data)
+
+
+def test_numpy_scan_finds_the_same_cuts_as_find_cut(monkeypatch):
+    pytest.importorskip('numpy')
+    monkeypatch.setattr(chunking, 'SCAN_BLOCK', 5000)
+    data = sample(300 * 1024)
+    find = cut_finder(data, MIN_SIZE, MAX_SIZE, CUT_MASK)
+    cuts = []
+    pos = 0
+    while pos < len(data):
+        pos = find(pos)
+        cuts.append(pos)
+    assert cuts == sequential_cuts(data)
+
+
+def test_chunks_match_one_sequential_pass_with_their_hashes(tmp_path):
+    data = sample(600 * 1024, seed=3)
+    path = tmp_path / 'big.bin'
+    path.write_bytes(data)
+    chunker = ContentChunker(max_workers=2, min_size=MIN_SIZE, avg_bits=AVG_BITS, max_size=MAX_SIZE,
+                             segment_size=50 * 1024)
+    try:
+        chunks, md5 = chunker.chunks(str(path), len(data))
+    finally:
+        chunker.shutdown()
+
+    assert [offset + length for offset, length, _ in chunks] == sequential_cuts(data)
+    for offset, length, digest in chunks:
+        assert digest == hashlib.sha256(data[offset:offset + length]).hexdigest()
+    assert md5 == file_md5(str(path))
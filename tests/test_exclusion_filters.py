@@ -0,0 +1,53 @@
+import os
+import time
+
+import pytest
+from conftest import drive_paths, write_tree
+
+from core.backup_engine import BackupEngine
+from core.exclusions import ExclusionRules
+from core.file_scanner import FileScanner
+from core.manifest_db import ManifestDB
+
+
+def backup_twice(tmp_path, drive, rules, streaming):
+    source = tmp_path / 'src'
+    write_tree(source, {'old.txt': 'old', 'fresh.txt': 'fresh', 'gone.txt': 'gone'})
+    old = time.time() - 3600
+    for name in ('old.txt', 'fresh.txt', 'gone.txt'):
+        os.utime(source / name, (old, old))
+    engine = BackupEngine(backend=drive)
+    success, message = engine.start_backup(str(source), None, 'bk')
+    assert success
+
+    # fresh.txt is edited just now, gone.txt is deleted
+    (source / 'fresh.txt').write_text('edited')
+    os.remove(source / 'gone.txt')
+    scan_results = None
+    if not streaming:
+        scanner = FileScanner(source, rules)
+        folders_found, files_count, total_size = scanner.scan_files()
+        scan_results = {'folders_found': folders_found, 'files_count': files_count, 'total_size': total_size,
+                        'manifest': scanner.manifest, 'skipped': scanner.skipped}
+    success, message = engine.start_backup(str(source), scan_results, 'bk', incremental=True,
+                                           delete_removed=True, exclusions=rules)
+    assert success
+    return source, engine
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_min_age_skips_recent_files_without_trashing_their_backup(tmp_path, drive, streaming):
+    source, engine = backup_twice(tmp_path, drive, ExclusionRules(min_age=600), streaming)
+
+    root_id = ManifestDB(str(source)).get_meta('root_folder_id')
+    assert set(drive_paths(drive, root_id)) == {'old.txt', 'fresh.txt'}
+    assert set(ManifestDB(str(source)).load_files()) == {'old.txt', 'fresh.txt'}
+    assert engine.last_counts['unchanged'] == 2
+
+
+def test_max_age_keeps_backups_of_files_that_stopped_changing(tmp_path, drive):
+    source, engine = backup_twice(tmp_path, drive, ExclusionRules(max_age=600), False)
+
+    root_id = ManifestDB(str(source)).get_meta('root_folder_id')
+    assert set(drive_paths(drive, root_id)) == {'old.txt', 'fresh.txt'}
+    assert set(ManifestDB(str(source)).load_files()) == {'old.txt', 'fresh.txt'}
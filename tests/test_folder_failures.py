@@ -0,0 +1,121 @@
+import pytest
+from conftest import drive_paths, write_tree
+
+from core.backup_engine import BackupEngine
+from core.drive_backend import DriveHttpError
+from core.fake_drive import FakeDrive
+from core.file_scanner import FileScanner
+from core.manifest_db import ManifestDB
+
+FILES = {'top.txt': 'top', 'a/one.txt': 'one', 'a/deep/same.txt': 'deep', 'a/deep/er/x.txt': 'x', 'b/two.txt': 'two'}
+
+
+class FolderFailingDrive(FakeDrive):
+    """Fails to create folders with the given names, with the given errors in turn"""
+
+    def __init__(self, root_dir, names, errors):
+        super().__init__(root_dir)
+        self.names = names
+        self.errors = list(errors)
+
+    def failure(self, name):
+        if name in self.names and self.errors:
+            return self.errors.pop(0) if len(self.errors) > 1 else self.errors[0]
+        return None
+
+    def create_folders(self, folders, http=None):
+        results = []
+        for name, parent_id in folders:
+            error = self.failure(name)
+            results.append((None, error) if error else (self.create_folder(name, parent_id), None))
+        return results
+
+    def create_folder(self, name, parent_id, http=None):
+        error = self.failure(name)
+        if error:
+            raise error
+        return super().create_folder(name, parent_id, http)
+
+
+def scan(source):
+    scanner = FileScanner(source)
+    folders_found, files_count, total_size = scanner.scan_files()
+    return {'folders_found': folders_found, 'files_count': files_count, 'total_size': total_size,
+            'manifest': scanner.manifest}
+
+
+def test_files_under_a_missing_folder_fail_instead_of_landing_in_the_root(tmp_path):
+    source = tmp_path / 'src'
+    write_tree(source, FILES)
+    drive = FolderFailingDrive(str(tmp_path / 'drive'), {'deep'}, [DriveHttpError(400, 'Bad Request')])
+    engine = BackupEngine(backend=drive)
+
+    success, message = engine.start_backup(str(source), scan(source), 'bk')
+
+    assert success
+    assert engine.last_counts['failed'] == 2
+    root_id = ManifestDB(str(source)).get_meta('root_folder_id')
+    assert set(drive_paths(drive, root_id)) == {'top.txt', 'a/one.txt', 'b/two.txt'}
+    manifest_db = ManifestDB(str(source))
+    assert set(manifest_db.load_files()) == {'top.txt', 'a/one.txt', 'b/two.txt'}
+    assert set(manifest_db.load_failures()) == {'a/deep/same.txt', 'a/deep/er/x.txt'}
+
+    # The next run creates the folder and uploads the journaled files where they belong
+    drive.names = set()
+    success, message = engine.start_backup(str(source), None, 'bk', incremental=True)
+    assert success
+    assert set(drive_paths(drive, root_id)) == set(FILES)
+    assert not ManifestDB(str(source)).load_failures()
+
+
+def test_streaming_backup_never_falls_back_to_the_root(tmp_path):
+    source = tmp_path / 'src'
+    write_tree(source, FILES)
+    drive = FolderFailingDrive(str(tmp_path / 'drive'), {'deep'}, [DriveHttpError(400, 'Bad Request')])
+    engine = BackupEngine(backend=drive)
+
+    success, message = engine.start_backup(str(source), None, 'bk')
+
+    assert success
+    root_id = ManifestDB(str(source)).get_meta('root_folder_id')
+    assert set(drive_paths(drive, root_id)) == {'top.txt', 'a/one.txt', 'b/two.txt'}
+    assert set(ManifestDB(str(source)).load_failures()) == {'a/deep/same.txt', 'a/deep/er/x.txt'}
+
+
+def test_network_errors_creating_folders_are_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    source = tmp_path / 'src'
+    write_tree(source, FILES)
+    drive = FolderFailingDrive(str(tmp_path / 'drive'), {'deep'}, [ConnectionResetError(104, 'reset'), None])
+    engine = BackupEngine(backend=drive)
+
+    success, message = engine.start_backup(str(source), scan(source), 'bk')
+
+    assert success
+    assert engine.last_counts['failed'] == 0
+    root_id = ManifestDB(str(source)).get_meta('root_folder_id')
+    assert set(drive_paths(drive, root_id)) == set(FILES)
+
+
+def test_clients_taken_for_an_upload_are_given_back(tmp_path, drive, monkeypatch):
+    taken = []
+    monkeypatch.setattr(drive, 'new_client', lambda real=drive.new_client: taken.append(real()) or taken[-1])
+    monkeypatch.setattr(drive, 'release_client', taken.remove)
+    source = tmp_path / 'src'
+    write_tree(source, {'big.txt': 'big ' * 1000})
+    folder_id = drive.create_folder('bk', 'root')
+
+    # Resumable and streamed compressed uploads
+    engine = BackupEngine(backend=drive, large_file_threshold=1024)
+    for compress in (False, True):
+        engine._upload_file(str(source / 'big.txt'), folder_id, compress=compress)
+    assert taken == []
+
+    # And a compressed upload that fails
+    monkeypatch.setattr(drive, 'upload_bytes', lambda *args, **kwargs: 1 / 0)
+    engine.large_file_threshold = 32 * 1024 * 1024
+    success, error = engine.upload_file_to_drive(str(source / 'big.txt'), folder_id)
+    assert success
+    with pytest.raises(ZeroDivisionError):
+        engine._upload_file(str(source / 'big.txt'), folder_id, compress=True)
+    assert taken == []
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import tarfile
+
+from conftest import write_tree
+
+from core.backup_engine import BackupEngine
+from core.drive_backend import DriveHttpError
+from core.hashing import file_md5
+from core.manifest_db import ManifestDB
+from core.packer import PACKS_FOLDER_NAME, SmallFilePacker, load_pack_index
+from core.restore_engine import RestoreEngine
+
+FILES = {'a.txt': 'alpha' * 50, 'b/b.txt': 'bravo' * 300, 'b/c.txt': 'charlie', 'd.txt': 'delta' * 1000}
+
+
+def file_infos(source):
+    return [{'file_path': str(source / path), 'relative_path': path, 'filename': os.path.basename(path)}
+            for path in sorted(FILES)]
+
+
+def test_a_file_that_fails_part_way_is_cut_back_out_of_the_segment(tmp_path, monkeypatch):
+    source = tmp_path / 'src'
+    write_tree(source, FILES)
+    real_fstat = os.fstat
+    shrunk = os.stat(source / 'b' / 'b.txt').st_ino
+
+    def fstat(fd):
+        # b/b.txt claims to be bigger than it is, as if it shrank after the stat
+        stat = real_fstat(fd)
+        if stat.st_ino != shrunk:
+            return stat
+        return os.stat_result((stat.st_mode, stat.st_ino, stat.st_dev, stat.st_nlink, stat.st_uid, stat.st_gid,
+                               stat.st_size + 4096, stat.st_atime, stat.st_mtime, stat.st_ctime))
+
+    monkeypatch.setattr(os, 'fstat', fstat)
+    segments = list(SmallFilePacker(temp_dir=str(tmp_path)).pack(file_infos(source)))
+
+    assert len(segments) == 1
+    segment_path, _, entries = segments[0]
+    assert [entry[0]['relative_path'] for entry in entries] == ['a.txt', 'b/c.txt', 'd.txt']
+    with tarfile.open(segment_path) as tar:
+        assert tar.getnames() == ['a.txt', 'b/c.txt', 'd.txt']
+    with open(segment_path, 'rb') as f:
+        data = f.read()
+    for file_info, data_offset, size, _, md5 in entries:
+        assert md5 == file_md5(file_info['file_path'])
+        assert hashlib.md5(data[data_offset:data_offset + size]).hexdigest() == md5
+
+
+def test_pack_index_checksums_catch_corrupted_segments(tmp_path, drive):
+    source = tmp_path / 'src'
+    write_tree(source, FILES)
+    engine = BackupEngine(backend=drive)
+    success, message = engine.start_backup(str(source), None, 'bk', pack_small_files=True)
+    assert success
+    backup_id = ManifestDB(str(source)).get_meta('root_folder_id')
+
+    # The index records every file's MD5
+    packs_id = next(item['id'] for item in drive.files.values() if item['title'] == PACKS_FOLDER_NAME)
+    index_item = next(item for item in drive.files.values()
+                      if packs_id in item['parents'] and item['title'].startswith('index-'))
+    with open(drive.object_path(index_item['id']), 'rb') as f:
+        index = load_pack_index(f.read())
+    assert {path: record[4] for path, record in index['files'].items()} == {
+        path: file_md5(str(source / path)) for path in FILES
+    }
+
+    # Flip one byte of d.txt inside its segment, keeping the size
+    segment_name, data_offset = index['files']['d.txt'][:2]
+    segment_path = drive.object_path(index['segments'][segment_name])
+    with open(segment_path, 'r+b') as f:
+        f.seek(data_offset)
+        f.write(b'D')
+
+    restorer = RestoreEngine(backend=drive)
+    success, message = restorer.start_restore(backup_id, str(tmp_path / 'out'))
+    assert success
+    assert restorer.last_counts['failed'] == 1
+    assert restorer.last_counts['restored'] == len(FILES) - 1
+    assert not os.path.exists(tmp_path / 'out' / 'd.txt')
+    assert (tmp_path / 'out' / 'b' / 'b.txt').read_text() == FILES['b/b.txt']
+
+
+def test_files_that_fail_to_pack_are_journaled(tmp_path, drive, monkeypatch):
+    source = tmp_path / 'src'
+    write_tree(source, FILES)
+    real_open = open
+
+    def flaky_open(path, *args, **kwargs):
+        if str(path).endswith('c.txt'):
+            raise PermissionError(13, 'Permission denied', str(path))
+        return real_open(path, *args, **kwargs)
+
+    engine = BackupEngine(backend=drive)
+    with monkeypatch.context() as patch:
+        patch.setattr('builtins.open', flaky_open)
+        success, message = engine.start_backup(str(source), None, 'bk', pack_small_files=True)
+
+    assert success
+    assert engine.last_counts['failed'] == 1
+    assert engine.last_counts['done'] == engine.last_counts['total']
+    manifest = ManifestDB(str(source))
+    assert set(manifest.load_failures()) == {'b/c.txt'}
+    assert 'b/c.txt' not in manifest.load_files()
+
+
+def test_packed_files_are_only_recorded_once_their_index_is_stored(tmp_path, drive, monkeypatch):
+    source = tmp_path / 'src'
+    write_tree(source, FILES)
+    real_upload = drive.upload_file
+
+    def upload_file(file_path, metadata, http=None):
+        if metadata.get('title', '').startswith('index-'):
+            raise DriveHttpError(503, 'Backend Error')
+        return real_upload(file_path, metadata, http)
+
+    monkeypatch.setattr(drive, 'upload_file', upload_file)
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    engine = BackupEngine(backend=drive)
+    success, message = engine.start_backup(str(source), None, 'bk', pack_small_files=True)
+
+    assert success
+    assert engine.last_counts['failed'] == len(FILES)
+    assert engine.last_counts['packed'] == 0
+    manifest = ManifestDB(str(source))
+    assert set(manifest.load_failures()) == set(FILES)
+    assert manifest.load_files() == {}
+
+
+def test_packed_files_deleted_locally_are_not_restored(tmp_path, drive):
+    source = tmp_path / 'src'
+    write_tree(source, FILES)
+    engine = BackupEngine(backend=drive)
+    assert engine.start_backup(str(source), None, 'bk', pack_small_files=True)[0]
+    os.remove(source / 'b' / 'c.txt')
+
+    engine = BackupEngine(backend=drive)
+    success, message = engine.start_backup(str(source), None, 'bk', incremental=True, delete_removed=True,
+                                           pack_small_files=True)
+    assert success
+    assert 'b/c.txt' not in ManifestDB(str(source)).load_files()
+
+    backup_id = ManifestDB(str(source)).get_meta('root_folder_id')
+    restorer = RestoreEngine(backend=drive)
+    assert restorer.start_restore(backup_id, str(tmp_path / 'out'))[0]
+    assert restorer.last_counts['restored'] == len(FILES) - 1
+    assert not os.path.exists(tmp_path / 'out' / 'b' / 'c.txt')
+    assert (tmp_path / 'out' / 'b' / 'b.txt').read_text() == FILES['b/b.txt']
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+from conftest import write_tree
+
+import cli
+from core.backup_engine import BackupEngine
+from core.compression import CODEC_PROPERTY, ORIGINAL_MD5_PROPERTY, ORIGINAL_SIZE_PROPERTY
+from core.hashing import file_md5
+from core.manifest_db import ManifestDB
+from core.remote_index import get_property, remote_md5, remote_size
+from core.restore_engine import RestoreEngine
+
+
+@pytest.mark.parametrize('mode', ['--restore', '--verify'])
+def test_dry_run_is_rejected_with_restore_and_verify(tmp_path, capsys, mode):
+    target = tmp_path / 'target'
+
+    assert cli.main([str(target), mode, '--dry-run']) == cli.EXIT_USAGE
+    assert '--dry-run' in capsys.readouterr().err
+    assert not target.exists()
+
+
+def test_titles_that_would_escape_the_target_are_skipped(tmp_path, drive):
+    source = tmp_path / 'src'
+    write_tree(source, {'a.txt': 'a', 'sub/b.txt': 'b'})
+    engine = BackupEngine(backend=drive)
+    success, message = engine.start_backup(str(source), None, 'bk')
+    assert success
+    backup_id = ManifestDB(str(source)).get_meta('root_folder_id')
+
+    # Titles nobody's local backup would produce
+    drive.upload_bytes(b'evil', {'title': '..', 'parents': [{'id': backup_id}]})
+    drive.upload_bytes(b'evil', {'title': '../../escaped.txt', 'parents': [{'id': backup_id}]})
+    dots = drive.create_folder('..', backup_id)
+    drive.upload_bytes(b'evil', {'title': 'escaped.txt', 'parents': [{'id': dots}]})
+
+    target = tmp_path / 'restore' / 'target'
+    restorer = RestoreEngine(backend=drive)
+    success, message = restorer.start_restore(backup_id, str(target))
+
+    assert success
+    assert restorer.last_counts['restored'] == 2
+    assert sorted(os.listdir(tmp_path / 'restore')) == ['target']
+    assert (target / 'sub' / 'b.txt').read_text() == 'b'
+    with pytest.raises(Exception):
+        restorer.local_path(str(target), '../escaped.txt')
+
+
+@pytest.mark.parametrize('large_file_threshold', [32 * 1024 * 1024, 1024])
+def test_raw_updates_clear_the_original_properties_of_a_compressed_revision(tmp_path, drive, large_file_threshold):
+    source = tmp_path / 'src'
+    write_tree(source, {'a.txt': 'alpha ' * 1000})
+    engine = BackupEngine(backend=drive, large_file_threshold=large_file_threshold)
+    assert engine.start_backup(str(source), None, 'bk', compress=True)[0]
+    item = next(item for item in drive.files.values() if item['title'] == 'a.txt')
+    assert get_property(item, CODEC_PROPERTY) == 'gzip'
+
+    # Updated in place, raw this time
+    write_tree(source, {'a.txt': 'bravo ' * 2000})
+    engine = BackupEngine(backend=drive, large_file_threshold=large_file_threshold)
+    assert engine.start_backup(str(source), None, 'bk', incremental=True)[0]
+
+    item = next(item for item in drive.files.values() if item['title'] == 'a.txt')
+    assert get_property(item, CODEC_PROPERTY) == 'identity'
+    assert not get_property(item, ORIGINAL_MD5_PROPERTY)
+    assert not get_property(item, ORIGINAL_SIZE_PROPERTY)
+    assert remote_md5(item) == file_md5(str(source / 'a.txt'))
+    assert remote_size(item) == os.path.getsize(source / 'a.txt')
+
+
+def test_stale_original_properties_of_a_raw_revision_are_ignored():
+    # Written by a version that left them behind when a compressed file was updated raw
+    item = {'id': 'f', 'md5Checksum': 'b' * 32, 'fileSize': '2000', 'properties': [
+        {'key': CODEC_PROPERTY, 'value': 'identity'},
+        {'key': ORIGINAL_SIZE_PROPERTY, 'value': '1000'},
+        {'key': ORIGINAL_MD5_PROPERTY, 'value': 'a' * 32},
+    ]}
+    assert (remote_md5(item), remote_size(item)) == ('b' * 32, 2000)
+    entry = RestoreEngine(backend=object()).file_entry('a.txt', item)
+    assert (entry['md5'], entry['size']) == ('b' * 32, 2000)
+
+    item['properties'][0]['value'] = 'gzip'
+    assert (remote_md5(item), remote_size(item)) == ('a' * 32, 1000)
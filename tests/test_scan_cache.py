@@ -0,0 +1,39 @@
+import os
+import time
+
+from conftest import write_tree
+
+from core.backup_engine import BackupEngine
+from core.hashing import file_md5
+from core.manifest_db import ManifestDB
+
+
+def edit_in_place(path, text):
+    # Same size, no folder mtime change, as an in-place edit looks to the cache
+    folder = os.path.dirname(path)
+    stat = os.stat(folder)
+    with open(path, 'r+') as f:
+        f.write(text)
+    os.utime(folder, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_delete_removed_runs_list_everything_despite_the_cache(tmp_path, drive):
+    source = tmp_path / 'src'
+    write_tree(source, {'sub/a.txt': 'aaaa', 'b.txt': 'b'})
+    old = time.time() - 3600
+    for folder in (source, source / 'sub'):
+        os.utime(folder, (old, old))
+    engine = BackupEngine(backend=drive)
+    success, message = engine.start_backup(str(source), None, 'bk', scan_cache=True)
+    assert success
+
+    edit_in_place(source / 'sub' / 'a.txt', 'AAAA')
+    success, message = engine.start_backup(str(source), None, 'bk', incremental=True, scan_cache=True)
+    assert success
+    assert engine.last_counts['uploaded'] == 0  # Stale until the next full scan
+
+    success, message = engine.start_backup(str(source), None, 'bk', incremental=True, delete_removed=True,
+                                           scan_cache=True)
+    assert success
+    assert engine.last_counts['uploaded'] == 1
+    assert ManifestDB(str(source)).load_files()['sub/a.txt'][2] == file_md5(str(source / 'sub' / 'a.txt'))
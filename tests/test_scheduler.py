@@ -0,0 +1,17 @@
+from core.scheduler import UploadScheduler
+
+MB = 1024 * 1024
+
+
+def test_idle_workers_take_large_tasks_while_the_source_is_still_open():
+    scheduler = UploadScheduler('mixed', large_threshold=MB, large_slots=1)
+    for name in ('big1', 'big2', 'big3', 'small'):
+        scheduler.put({'name': name, 'size': 10 * MB if name.startswith('big') else 10})
+
+    # The small file goes first once the large slot is taken
+    taken = [scheduler.next_task()['name'] for _ in range(2)]
+    assert taken == ['big1', 'small']
+    # No small file is queued and the source isn't drained, yet idle workers still get work
+    assert scheduler.next_task()['name'] == 'big2'
+    assert scheduler.next_task()['name'] == 'big3'
+    assert scheduler.large_in_flight == 3
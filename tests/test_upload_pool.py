@@ -0,0 +1,60 @@
+import pytest
+
+from core import upload_pool
+from core.drive_backend import DriveHttpError
+from core.upload_pool import AdaptiveLimiter, UploadPool
+
+
+def test_failures_dont_grow_the_limiter():
+    limiter = AdaptiveLimiter(4)
+    limiter.limit = 2
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release('failed')
+    assert limiter.limit == 2
+    for _ in range(2):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 3
+
+
+def test_a_burst_of_throttling_halves_the_limit_once():
+    limiter = AdaptiveLimiter(8)
+    for _ in range(8):
+        limiter.acquire()
+    for _ in range(8):
+        limiter.release('throttled')
+    assert limiter.limit == 4
+
+
+def test_a_worker_moves_on_while_a_throttled_task_waits(monkeypatch):
+    monkeypatch.setattr(upload_pool, 'retry_delay', lambda attempt, base=1.0, cap=30.0: 0.2)
+    throttled = {'a'}
+    results = []
+
+    def upload(task, client):
+        if task in throttled:
+            throttled.discard(task)
+            raise DriveHttpError(429, 'Too Many Requests')
+        return task
+
+    pool = UploadPool(1, order='walk')
+    pool.run(['a', 'b', 'c'], upload, lambda: None, lambda task, success, result: results.append((task, success)))
+
+    assert results == [('b', True), ('c', True), ('a', True)]
+
+
+def test_a_failing_result_callback_stops_the_run_and_is_raised():
+    released = []
+    seen = []
+
+    def on_result(task, success, result):
+        seen.append(task)
+        if task == 3:
+            raise ValueError('callback failed')
+
+    pool = UploadPool(4, order='walk')
+    with pytest.raises(ValueError, match='callback failed'):
+        pool.run(range(1000), lambda task, client: task, object, on_result, released.append)
+    assert len(seen) < 1000
+    assert len(released) == 4
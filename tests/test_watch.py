@@ -0,0 +1,39 @@
+from conftest import drive_paths, write_tree
+
+import cli
+from core.backup_engine import BackupEngine
+from core.manifest_db import ManifestDB
+from core.packer import PACKS_FOLDER_NAME
+
+
+def test_watch_forwards_dedup_and_packing(tmp_path, monkeypatch):
+    options = {}
+
+    class RecordingDaemon:
+        def __init__(self, engine, folder_path, backup_name, **backup_options):
+            options.update(backup_options)
+
+        def run(self):
+            pass
+
+    monkeypatch.setattr('core.watcher.BackupDaemon', RecordingDaemon)
+    assert cli.main([str(tmp_path), '--watch', '--quiet', '--dedup', '--pack-small-files']) == cli.EXIT_OK
+    assert options['deduplicate'] and options['pack_small_files']
+
+
+def test_changed_paths_backup_dedups_and_packs(tmp_path, drive):
+    source = tmp_path / 'src'
+    write_tree(source, {'a.txt': 'same', 'sub/b.txt': 'other'})
+    engine = BackupEngine(backend=drive)
+    success, message = engine.start_backup(str(source), None, 'bk', deduplicate=True, pack_small_files=True)
+    assert success
+
+    # What a watch run does after sub/ changed
+    write_tree(source, {'sub/copy.txt': 'same', 'sub/new.txt': 'new'})
+    success, message = engine.start_backup(str(source), None, 'bk', incremental=True, changed_paths=['sub'],
+                                           deduplicate=True, pack_small_files=True)
+    assert success
+    assert engine.last_counts['failed'] == 0
+    assert set(ManifestDB(str(source)).load_files()) == {'a.txt', 'sub/b.txt', 'sub/copy.txt', 'sub/new.txt'}
+    root_id = ManifestDB(str(source)).get_meta('root_folder_id')
+    assert all(path.startswith(PACKS_FOLDER_NAME + '/') for path in drive_paths(drive, root_id))
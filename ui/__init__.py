@@ -1,2 +1,3 @@
 from .main_window import MainWindow
-from .progress_widget import ProgressWidget
\ No newline at end of file
+from .progress_widget import ProgressWidget
+from .results_view import ResultsView
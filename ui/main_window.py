@@ -4,8 +4,10 @@ import threading
 import datetime
 from core import FileScanner
 from core import BackupEngine
+from core import ProgressTracker
 
 from ui.progress_widget import ProgressWidget
+from ui.results_view import ResultsView
 
 class MainWindow:
     def __init__(self):
@@ -76,6 +78,14 @@ class MainWindow:
             width=400
         )
         self.backup_name_entry.pack(pady=(0,10))
+        
+        # Incremental backups update the previous backup of this folder
+        self.incremental_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(
+            self.name_frame,
+            text="Incremental (only upload new and changed files)",
+            variable=self.incremental_var
+        ).pack(pady=(0,10))
     
     def create_progress_section(self):
         """Create the progress bar section"""
@@ -90,7 +100,17 @@ class MainWindow:
             font=ctk.CTkFont(size=16),
             height=40
         )
-        self.backup_button.pack(pady=20)
+        self.backup_button.pack(pady=(20,5))
+        
+        # Walks and uploads in one pass, without a separate scan first
+        self.quick_backup_button = ctk.CTkButton(
+            self.root,
+            text="⚡ Backup Now (no scan)",
+            command=self.start_streaming_backup,
+            font=ctk.CTkFont(size=14),
+            height=32
+        )
+        self.quick_backup_button.pack(pady=(0,20))
     
     def create_results_section(self):
         """Create the results display section"""
@@ -103,7 +123,10 @@ class MainWindow:
             font=ctk.CTkFont(size=16)
         ).pack(anchor="w", padx=10, pady=(10,0))
         
-        self.status_text = ctk.CTkTextbox(status_frame, height=200)
+        # Scan results get a lazily filled folder tree; status messages go to the textbox below it
+        self.results_view = ResultsView(status_frame)
+        
+        self.status_text = ctk.CTkTextbox(status_frame, height=80)
         self.status_text.pack(pady=10, padx=10, fill="both", expand=True)
         
     def select_folder(self):
@@ -135,30 +158,23 @@ class MainWindow:
             else:
                 return f"Backup_{timestamp}"
     
-    def show_results(self, folders_found, files_count, total_size):
+    def show_results(self, folders_found, files_count, total_size, manifest, scan_stats=None, folder_stats=None):
         """Show scan results and enable backup"""
-        # Store results for backup
+        # Store results for backup (manifest lets the backup skip re-walking)
         self.scan_results = {
             'folders_found': folders_found,
             'files_count': files_count,
-            'total_size': total_size
+            'total_size': total_size,
+            'manifest': manifest,
+            'scan_stats': scan_stats
         }
         
         # Hide progress bar
         self.progress_widget.hide()
         
-        # Show results
-        size_mb = total_size / (1024 * 1024)
+        # Show the summary; folder rows are only built as they are expanded
         self.status_text.delete("1.0", "end")
-        
-        self.status_text.insert("end", f"✅ Scan Complete!\n")
-        self.status_text.insert("end", f"Files found: {files_count}\n")
-        self.status_text.insert("end", f"Total size: {size_mb:.2f} MB\n")
-        self.status_text.insert("end", f"\nFolders found ({len(folders_found)}):\n")
-        self.status_text.insert("end", "-" * 50 + "\n")
-        
-        for folder in sorted(folders_found):
-            self.status_text.insert("end", f"📁 {folder}\n")
+        self.results_view.show(folder_stats or {}, files_count, total_size, before_widget=self.status_text)
         
         # Change button to backup mode
         self.backup_button.configure(
@@ -166,24 +182,21 @@ class MainWindow:
             text="📤 Backup to Google Drive", 
             command=self.start_actual_backup
         )
+        self.quick_backup_button.configure(state="normal")
     
-    def scan_worker(self):
+    def scan_worker(self, progress_tracker):
         """Worker thread for scanning"""
         scanner = FileScanner(self.selected_folder)
-        
-        def progress_callback(progress, message):
-            self.root.after(0, self.progress_widget.update, progress, message)
-        
-        folders_found, files_count, total_size = scanner.scan_files(callback=progress_callback)
-        self.root.after(0, self.show_results, folders_found, files_count, total_size)
+        folders_found, files_count, total_size = scanner.scan_files(callback=progress_tracker)
+        self.root.after(
+            0, self.show_results, folders_found, files_count, total_size, scanner.manifest, scanner.stats,
+            scanner.folder_stats
+        )
     
-    def backup_worker(self):
+    def backup_worker(self, progress_tracker):
         """Worker thread for backup process"""
         backup_engine = BackupEngine()
         
-        def progress_callback(progress, message):
-            self.root.after(0, self.progress_widget.update, progress, message)
-        
         try:
             # Get the backup name
             backup_name = self.get_backup_name()
@@ -192,7 +205,8 @@ class MainWindow:
                 self.selected_folder, 
                 self.scan_results,
                 backup_name,  # Fixed: Added the missing custom_backup_name parameter
-                progress_callback
+                progress_tracker,
+                incremental=self.incremental_var.get()
             )
             
             if success:
@@ -208,19 +222,36 @@ class MainWindow:
         self.progress_widget.hide()
         self.status_text.insert("end", f"\n✅ {message}\n")
         self.backup_button.configure(state="normal", text="Start New Scan", command=self.reset_for_new_scan)
+        self.quick_backup_button.configure(state="normal")
 
     def show_backup_error(self, error):
         """Show backup error"""
         self.progress_widget.hide()
         self.status_text.insert("end", f"\n❌ Backup Error: {error}\n")
-        self.backup_button.configure(state="normal", text="📤 Retry Backup", command=self.start_actual_backup)
+        retry_command = self.start_actual_backup if self.scan_results else self.start_streaming_backup
+        self.backup_button.configure(state="normal", text="📤 Retry Backup", command=retry_command)
+        self.quick_backup_button.configure(state="normal")
 
     def start_actual_backup(self):
         """Start the actual backup to Google Drive"""
         if not self.scan_results:
             self.status_text.insert("end", "❌ No scan results available. Please scan first.\n")
             return
-            
+        
+        self.launch_backup()
+    
+    def start_streaming_backup(self):
+        """Back up without scanning first; uploads start while the folder is walked"""
+        if not self.selected_folder:
+            self.status_text.delete("1.0", "end")
+            self.status_text.insert("end", "❌ Please select a folder first!\n")
+            return
+        
+        self.scan_results = None
+        self.launch_backup()
+    
+    def launch_backup(self):
+        """Validate the name and run backup_worker in the background"""
         # Validate backup name
         backup_name = self.get_backup_name()
         if not backup_name:
@@ -230,12 +261,15 @@ class MainWindow:
         self.progress_widget.show(after_widget=self.backup_button)
         self.progress_widget.reset()
         self.backup_button.configure(state="disabled", text="Backing up...")
+        self.quick_backup_button.configure(state="disabled")
         
         # Show backup name in status
         self.status_text.insert("end", f"\n🚀 Starting backup: '{backup_name}'\n")
         
-        # Start backup in background thread
-        backup_thread = threading.Thread(target=self.backup_worker, daemon=True)
+        # Start backup in background thread; the widget polls its progress
+        progress_tracker = ProgressTracker()
+        self.progress_widget.track(progress_tracker)
+        backup_thread = threading.Thread(target=self.backup_worker, args=(progress_tracker,), daemon=True)
         backup_thread.start()
 
     def start_scan(self):
@@ -246,18 +280,23 @@ class MainWindow:
             return
         
         self.status_text.delete("1.0", "end")
+        self.results_view.hide()
         self.progress_widget.show(after_widget=self.name_frame)
         self.progress_widget.reset()
         
         self.backup_button.configure(state="disabled", text="Scanning...")
+        self.quick_backup_button.configure(state="disabled")
         
-        scan_thread = threading.Thread(target=self.scan_worker, daemon=True)
+        progress_tracker = ProgressTracker()
+        self.progress_widget.track(progress_tracker)
+        scan_thread = threading.Thread(target=self.scan_worker, args=(progress_tracker,), daemon=True)
         scan_thread.start()
 
     def reset_for_new_scan(self):
         """Reset UI for a new scan"""
         self.scan_results = None
         self.status_text.delete("1.0", "end")
+        self.results_view.hide()
         self.backup_button.configure(text="Start Scan", command=self.start_scan, state="normal")
         # Clear the backup name entry
         self.backup_name_entry.delete(0, 'end')
@@ -21,6 +21,16 @@ class ProgressWidget:
         self.progress_bar.pack(pady=5, padx=20, fill="x")
         self.progress_bar.set(0)
         
+        self.stats_label = ctk.CTkLabel(
+            self.frame,
+            text="",
+            font=ctk.CTkFont(size=12)
+        )
+        self.stats_label.pack(pady=(0,5))
+        
+        self.tracker = None
+        self.poll_job = None
+        
         # Initially hidden
         self.hide()
     
@@ -34,6 +44,7 @@ class ProgressWidget:
     
     def hide(self):
         """Hide the progress bar"""
+        self.stop_tracking()
         self.frame.pack_forget()
         self.is_visible = False
     
@@ -47,10 +58,54 @@ class ProgressWidget:
         self.progress_bar.set(progress)
         self.label.configure(text=message)
     
+    def update_stats(self, snapshot):
+        """Show a ProgressTracker snapshot: bar, message, and transfer stats"""
+        self.update(snapshot['progress'], snapshot['message'])
+        
+        if not snapshot['files_total'] and not snapshot['bytes_total']:
+            self.stats_label.configure(text="")
+            return
+        
+        approx = "~" if snapshot['estimated'] else ""
+        done_mb = snapshot['bytes_done'] / (1024 * 1024)
+        total_mb = snapshot['bytes_total'] / (1024 * 1024)
+        speed_mb = snapshot['bytes_per_second'] / (1024 * 1024)
+        stats = (f"{done_mb:.1f} / {approx}{total_mb:.1f} MB  •  "
+                 f"{speed_mb:.2f} MB/s  •  {snapshot['files_per_second']:.1f} files/s")
+        if snapshot['eta'] is not None:
+            minutes, seconds = divmod(int(snapshot['eta']), 60)
+            hours, minutes = divmod(minutes, 60)
+            eta = f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+            stats += f"  •  ETA {approx}{eta}"
+        self.stats_label.configure(text=stats)
+    
+    def track(self, tracker, interval_ms=100):
+        """Refresh from a ProgressTracker on a fixed timer until stop_tracking()
+        
+        Worker threads only write into the tracker, so the Tk event queue
+        sees one update per interval no matter how fast files complete.
+        """
+        self.stop_tracking()
+        self.tracker = tracker
+        
+        def poll():
+            self.update_stats(tracker.snapshot())
+            self.poll_job = self.parent.after(interval_ms, poll)
+        
+        poll()
+    
+    def stop_tracking(self):
+        """Stop the refresh timer started by track()"""
+        if self.poll_job is not None:
+            self.parent.after_cancel(self.poll_job)
+            self.poll_job = None
+        self.tracker = None
+    
     def reset(self):
         """Reset progress bar to initial state"""
         self.progress_bar.set(0)
         self.label.configure(text="Ready...")
+        self.stats_label.configure(text="")
     
     def set_indeterminate(self, message="Working..."):
         """Set progress bar to indeterminate mode with a message"""
@@ -0,0 +1,127 @@
+import customtkinter as ctk
+from tkinter import ttk
+
+PAGE_SIZE = 500  # Subfolders inserted per expansion; the rest load on demand
+PLACEHOLDER = "…"
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class ResultsView:
+    """Folder tree of a scan that only builds the rows the user opens
+
+    Rows are created when their parent is expanded, PAGE_SIZE at a time,
+    so showing a scan of any size costs the same as showing a small one.
+    Counts and sizes come from FileScanner.folder_stats, computed during
+    the scan, so nothing is walked or summed in the UI thread.
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.folder_stats = {}
+        self.unopened = {}  # Row id -> folder path, for folders whose subfolders aren't inserted yet
+        self.more_rows = {}  # "Show more" row id -> (folder path, sorted subfolder names, next index)
+        self.create_widgets()
+
+    def create_widgets(self):
+        """Create the summary label and the tree"""
+        self.frame = ctk.CTkFrame(self.parent, fg_color="transparent")
+
+        self.summary_label = ctk.CTkLabel(self.frame, text="", justify="left", anchor="w")
+        self.summary_label.pack(fill="x", padx=5)
+
+        tree_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
+        tree_frame.pack(fill="both", expand=True, pady=(5, 0))
+
+        self.tree = ttk.Treeview(tree_frame, columns=("files", "size"), height=8)
+        self.tree.heading("#0", text="Folder")
+        self.tree.heading("files", text="Files")
+        self.tree.heading("size", text="Size")
+        self.tree.column("#0", width=380, stretch=True)
+        self.tree.column("files", width=90, anchor="e", stretch=False)
+        self.tree.column("size", width=100, anchor="e", stretch=False)
+
+        scrollbar = ctk.CTkScrollbar(tree_frame, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.tree.bind("<<TreeviewOpen>>", self.on_open)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+
+    def show(self, folder_stats, files_count, total_size, before_widget=None):
+        """Show the summary and the top-level folders of a scan"""
+        self.clear()
+        self.folder_stats = folder_stats
+
+        self.summary_label.configure(text=(
+            f"✅ Scan Complete!  Files found: {files_count}  •  "
+            f"Total size: {total_size / (1024 * 1024):.2f} MB  •  "
+            f"Folders found: {max(len(folder_stats) - 1, 0)}"
+        ))
+        self.insert_children("", "")
+
+        if before_widget:
+            self.frame.pack(fill="both", expand=True, padx=10, pady=(10, 0), before=before_widget)
+        else:
+            self.frame.pack(fill="both", expand=True, padx=10, pady=(10, 0))
+
+    def hide(self):
+        """Hide the view and drop its rows"""
+        self.clear()
+        self.frame.pack_forget()
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children(""))
+        self.unopened = {}
+        self.more_rows = {}
+        self.folder_stats = {}
+
+    def insert_children(self, row_id, path):
+        """Insert the first page of path's subfolders under row_id"""
+        names = sorted(self.folder_stats.get(path, {}).get('subfolders', ()), key=str.lower)
+        self.insert_page(row_id, path, names, 0)
+
+    def insert_page(self, row_id, path, names, start):
+        for name in names[start:start + PAGE_SIZE]:
+            child_path = f"{path}/{name}" if path else name
+            stats = self.folder_stats[child_path]
+            child_id = self.tree.insert(
+                row_id, "end",
+                text=f"📁 {name}",
+                values=(stats['total_files'], format_size(stats['total_bytes']))
+            )
+            if stats['subfolders']:
+                # Placeholder row so the folder gets an expand arrow; replaced when opened
+                self.unopened[child_id] = child_path
+                self.tree.insert(child_id, "end", text=PLACEHOLDER)
+
+        remaining = len(names) - start - PAGE_SIZE
+        if remaining > 0:
+            more_id = self.tree.insert(
+                row_id, "end", text=f"➕ Show {min(remaining, PAGE_SIZE)} more of {remaining}…"
+            )
+            self.more_rows[more_id] = (path, names, start + PAGE_SIZE)
+
+    def on_open(self, event):
+        row_id = self.tree.focus()
+        path = self.unopened.pop(row_id, None)
+        if path is None:
+            return
+        self.tree.delete(*self.tree.get_children(row_id))
+        self.insert_children(row_id, path)
+
+    def on_select(self, event):
+        for row_id in self.tree.selection():
+            page = self.more_rows.pop(row_id, None)
+            if page:
+                # Swap the "Show more" row for the next page of its siblings
+                parent_id = self.tree.parent(row_id)
+                self.tree.delete(row_id)
+                self.insert_page(parent_id, *page)